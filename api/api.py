@@ -1,11 +1,30 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, validator
-from typing import List, Optional
-import mysql.connector
-import joblib
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError, validator
+from typing import Any, Dict, List, Optional, Union
+import asyncio
+import base64
+import json
+import os
+import time
+import warnings
 import numpy as np
-import pandas as pd
-from fastapi.responses import HTMLResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+
+from api.batching import MicroBatcher
+from api.cache import PredictionCache, ResponseCache, etag_matches
+from api.catalog import CatalogStore
+from api.db import create_database
+from api.export import CHUNK_ROWS as EXPORT_CHUNK_ROWS, FORMATS as EXPORT_FORMATS, catalog_chunks, encode, parquet_available
+from api.facets import DEFAULT_FACETS, FACETS, SORT_ORDERS as FILTER_ORDERS, facets_from_catalog, load_facets
+from api.features import CATEGORICAL_FIELDS, NUMERIC_FEATURES, SCALAR_PREFIXES
+from api.metrics import MetricsMiddleware, SamplingProfiler, TimedRoute, dict_samples, metrics, stage
+from api.neighbors import load_neighbors, neighbors_from_catalog
+from api.registry import ModelRegistry, ModelVersion
+from api.search import load_search, search_from_catalog
+from api.snapshots import SnapshotStore
+from api.stats import DIMENSIONS as STATS_DIMENSIONS, SORT_KEYS as STATS_SORT_KEYS, load_stats, stats_from_catalog
 
 # Database connection settings
 DB_CONFIG = {
@@ -16,6 +35,16 @@ DB_CONFIG = {
     "port": 3306
 }
 
+# Connection pool settings; IMDB_DB_DRIVER selects mysql, aiomysql (asyncio) or sqlite
+DB_POOL_CONFIG = {
+    "driver": os.getenv("IMDB_DB_DRIVER", "mysql"),
+    "size": int(os.getenv("IMDB_DB_POOL_SIZE", "10")),
+    "recycle": 3600,     # seconds before a connection is replaced
+    "ping_after": 30,    # idle seconds before a connection is health-checked on checkout
+    "timeout": 30.0,     # seconds to wait for a free connection
+    "sqlite_path": os.getenv("IMDB_SQLITE_PATH", "imdb.sqlite3"),
+}
+
 # Pydantic models for responses
 class Movie(BaseModel):
     id: str
@@ -62,39 +91,183 @@ class MovieDetail(BaseModel):
     locations: List[str]
 
 app = FastAPI(title="API de Consulta IMDB")
+# Every route reports its validate/endpoint/serialize split to api/metrics.py,
+# exposed on GET /metrics together with the stages timed inside handlers.
+app.router.route_class = TimedRoute
+app.add_middleware(MetricsMiddleware)
+
+db = create_database(DB_CONFIG, DB_POOL_CONFIG)
+
+@app.on_event("shutdown")
+async def close_db():
+    await db.close()
+
+# ----- Catalog snapshot -----
+# Opt-in serving mode: with IMDB_CATALOG_DIR set, /movies, /movies/{id}, the
+# /{entity}/{id}/movies listings and the in-memory snapshots (stats, search,
+# facets, similar movies) read the memory-mapped catalog that `python -m api.catalog publish`
+# writes there (api/catalog.py) instead of the database. A newly published
+# version is picked up within IMDB_CATALOG_POLL_SECONDS, or at once by
+# POST /cache/invalidate; until the first one exists, everything reads the
+# database.
+CATALOG_DIR = os.getenv("IMDB_CATALOG_DIR")
+CATALOG_POLL_SECONDS = float(os.getenv("IMDB_CATALOG_POLL_SECONDS", "5"))
+
+catalog = CatalogStore(CATALOG_DIR) if CATALOG_DIR else None
+if catalog is not None:
+    catalog.reload()
+
+def published_catalog():
+    """The catalog version to serve from, or None to query the database."""
+    return catalog.current if catalog is not None else None
+
+def catalog_or_db(from_catalog, load):
+    """SnapshotStore builder reading the published catalog when there is one, else the database."""
+    def build(db):
+        snapshot = published_catalog()
+        return from_catalog(snapshot) if snapshot is not None else load(db)
+    return build
+
+def rebuild_snapshots(_catalog=None):
+    for store in SNAPSHOTS.values():
+        store.refresh_later()
+
+@app.on_event("startup")
+async def watch_catalog():
+    if catalog is not None and CATALOG_POLL_SECONDS > 0:
+        app.state.catalog_watcher = asyncio.create_task(catalog.watch(CATALOG_POLL_SECONDS, rebuild_snapshots))
+
+@app.on_event("shutdown")
+async def stop_catalog_watcher():
+    watcher = getattr(app.state, "catalog_watcher", None)
+    if watcher is not None:
+        watcher.cancel()
 
-def get_db():
-    """Get a new database connection."""
-    return mysql.connector.connect(**DB_CONFIG)
+# ----- Response cache -----
+# Master lists and stats only change when the loader runs, which calls
+# POST /cache/invalidate when it finishes. TTLs (seconds) bound staleness
+# if that call is missed.
+CACHE_TTLS = {
+    "genres": 3600,
+    "languages": 3600,
+    "countries": 3600,
+    "companies": 3600,
+    "locations": 3600,
+    "ratings": 3600,
+    "stats_top_genres": 600,
+    "stats_yearly_count": 600,
+    "stats_summary": 600,
+    "stats_yearly": 600,
+    "stats_breakdown": 600,
+}
+
+cache = ResponseCache(max_entries=int(os.getenv("IMDB_CACHE_SIZE", "1024")))
+
+async def cached(request: Request, name: str, sql: str, params: tuple = ()) -> Response:
+    """Serve the rows of ``sql`` from the response cache, answering 304 when the client's ETag matches."""
+    return await cached_result(request, name, tuple(params), lambda: db.fetch_all(sql, params))
+
+async def cached_result(request: Request, name: str, key: tuple, compute) -> Response:
+    """Serve the JSON of ``await compute()`` from the response cache under ``(name, key)``, with ETags."""
+    async def load():
+        # Cache the rendered body so hits skip validation and serialization
+        rows = jsonable_encoder(await compute())
+        return json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    entry = await cache.get((name, key), CACHE_TTLS[name], load)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.value, media_type="application/json", headers=headers)
 
 # ----- Prediction Model Setup -----
-model = joblib.load("models/gbc_model.joblib")
-FEATURE_COLUMNS = list(model.feature_names_in_)
+# The registry (api/registry.py) serves the model memory-mapped and swaps in a
+# new version, after a warm-up batch, when the file changes or on
+# POST /admin/model/reload. IMDB_MODEL_ENGINE picks the evaluator: "auto"
+# answers batches of up to COMPILED_MAX_ROWS with the flat-array forest
+# (api/forest.py), an order of magnitude faster there, and larger ones with
+# sklearn; "compiled" never unpickles the sklearn estimator.
+MODEL_PATH = os.getenv("IMDB_MODEL_PATH", "models/model.joblib")
+MODEL_ENGINE = os.getenv("IMDB_MODEL_ENGINE", "auto")
+MODEL_POLL_SECONDS = float(os.getenv("IMDB_MODEL_POLL_SECONDS", "10"))
+COMPILED_MAX_ROWS = 256
+
+registry = ModelRegistry(MODEL_PATH, engine=MODEL_ENGINE, compiled_max_rows=COMPILED_MAX_ROWS)
+registry.reload()
+
+# The encoder emits plain arrays already in feature column order, so the
+# feature-name check sklearn applies to DataFrames has nothing to verify.
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+@app.on_event("startup")
+async def watch_model():
+    if MODEL_POLL_SECONDS > 0:
+        app.state.model_watcher = asyncio.create_task(registry.watch(MODEL_POLL_SECONDS))
+
+@app.on_event("shutdown")
+async def stop_model_watcher():
+    watcher = getattr(app.state, "model_watcher", None)
+    if watcher is not None:
+        watcher.cancel()
 
 def preprocess_input(data: dict) -> np.ndarray:
-    idx = {col: i for i, col in enumerate(FEATURE_COLUMNS)}
-    x = np.zeros(len(FEATURE_COLUMNS), dtype=float)
-    # Numeric features
-    x[idx['runtimeMinutes']] = data.get('runtimeMinutes', 0)
-    x[idx['budget']] = data.get('budget', 0)
-    # One-hot features
-    for g in data.get('genres', []):
-        if g in idx: x[idx[g]] = 1.0
-    for c in data.get('production_companies', []):
-        key = f"comp_{c}"
-        if key in idx: x[idx[key]] = 1.0
-    for l in data.get('languages', []):
-        key = f"lang_{l}"
-        if key in idx: x[idx[key]] = 1.0
-    for c in data.get('countries', []):
-        key = f"ctry_{c}"
-        if key in idx: x[idx[key]] = 1.0
-    # Categorical rating and location
-    rkey = f"rating_{data.get('rating')}"
-    if rkey in idx: x[idx[rkey]] = 1.0
-    lkey = f"loc_{data.get('loc')}"
-    if lkey in idx: x[idx[lkey]] = 1.0
-    return x
+    return registry.current.encoder.encode(data)
+
+def score_items(items: List[dict], active: Optional[ModelVersion] = None) -> np.ndarray:
+    """Success probabilities (percent) of validated request dicts from one model call."""
+    active = active or registry.current
+    with stage("encode"):
+        X = active.encoder.encode_batch(items)
+    return active.predict_proba(X)[:, 1] * 100
+
+# Memoized outputs keyed on FeatureEncoder.canonical_key; entries belong to
+# the model version that computed them and are dropped once another answers.
+prediction_cache = PredictionCache(max_entries=int(os.getenv("IMDB_PREDICT_CACHE_SIZE", "10000")))
+
+def cached_probabilities(items: List[dict], active: ModelVersion):
+    """Prediction-cache keys of ``items`` and their cached probabilities under ``active`` (None for misses)."""
+    with stage("predict_cache"):
+        keys = [active.encoder.canonical_key(item) for item in items]
+        return keys, prediction_cache.get_many(keys, active.version)
+
+def predict_probabilities(items: List[dict], lookup: bool = True) -> List[float]:
+    """score_items behind the prediction cache: only items with an unseen key reach the model.
+
+    Results are stored under the version of the model that scored them, read
+    once here. ``lookup=False`` skips the lookup for items already known to miss.
+    """
+    active = registry.current
+    if lookup:
+        keys, probs = cached_probabilities(items, active)
+    else:
+        keys, probs = [active.encoder.canonical_key(item) for item in items], [None] * len(items)
+    missing = [i for i, prob in enumerate(probs) if prob is None]
+    if missing:
+        for i, prob in zip(missing, score_items([items[i] for i in missing], active)):
+            probs[i] = float(prob)
+        prediction_cache.put_many([keys[i] for i in missing], [probs[i] for i in missing], active.version)
+    return probs
+
+# Opt-in micro-batching of concurrent /predict calls: requests arriving within
+# the window (or until the batch is full) share one predict_proba call.
+PREDICT_BATCHING = {
+    "enabled": os.getenv("IMDB_PREDICT_BATCHING", "0") == "1",
+    "window_ms": float(os.getenv("IMDB_PREDICT_BATCH_WINDOW_MS", "2")),
+    "max_batch": int(os.getenv("IMDB_PREDICT_MAX_BATCH", "64")),
+    "workers": int(os.getenv("IMDB_PREDICT_BATCH_WORKERS", "1")),
+}
+
+batcher = MicroBatcher(
+    lambda items: predict_probabilities(items, lookup=False),
+    max_batch=PREDICT_BATCHING["max_batch"],
+    max_wait=PREDICT_BATCHING["window_ms"] / 1000,
+    workers=PREDICT_BATCHING["workers"],
+) if PREDICT_BATCHING["enabled"] else None
+
+@app.on_event("shutdown")
+async def close_batcher():
+    if batcher is not None:
+        await batcher.close()
 
 # ----- Pydantic Schemas for Prediction -----
 class PredictRequest(BaseModel):
@@ -137,93 +310,569 @@ class PredictResponse(BaseModel):
     success_probability: float
 
 @app.post("/predict", response_model=PredictResponse)
-def predict_endpoint(req: PredictRequest):
+async def predict_endpoint(req: PredictRequest):
     """Retorna a probabilidade prevista de sucesso de um filme em porcentagem."""
-    data = req.dict()
-    x = preprocess_input(data)
-    df = pd.DataFrame([x], columns=FEATURE_COLUMNS)
-    prob = model.predict_proba(df)[0, 1] * 100
+    item = req.dict()
+    # Hits are answered here; misses are scored (and cached) by the batch or thread that runs the model
+    _, (prob,) = cached_probabilities([item], registry.current)
+    if prob is None:
+        if batcher is not None:
+            with stage("batch_wait"):
+                prob = await batcher.submit(item)
+        else:
+            prob = (await run_in_threadpool(predict_probabilities, [item], False))[0]
     return PredictResponse(success_probability=prob)
 
-@app.get("/movies", response_model=List[Movie])
-def list_movies(limit: int = 10, offset: int = 0):
-    """Retorna uma lista de filmes com paginação."""
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT id, primaryTitle, originalTitle, DATE_FORMAT(releaseDate, '%Y-%m-%d') AS releaseDate, \
-         runtimeMinutes, averageRating, numVotes \
-         FROM movies LIMIT %s OFFSET %s",
-        (limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+# ----- Batch prediction -----
+MAX_BATCH_SIZE = 50000
+STREAM_CHUNK_SIZE = 1024
+
+class BatchPredictItem(BaseModel):
+    index: int
+    success_probability: Optional[float] = None
+    errors: Optional[List[dict]] = None
+
+class BatchPredictResponse(BaseModel):
+    count: int
+    failed: int
+    results: List[BatchPredictItem]
+
+def validation_errors(exc: ValidationError) -> List[dict]:
+    """Reduce a pydantic ValidationError to JSON-safe loc/msg/type entries."""
+    return [{"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]} for e in exc.errors()]
+
+def parse_items(items: List[Any], start: int = 0):
+    """Validate raw items as PredictRequest.
+
+    Returns the result list with the invalid items already filled in (their
+    errors), and the positions and dicts of the valid ones.
+    """
+    results = [None] * len(items)
+    positions, valid = [], []
+    for i, item in enumerate(items):
+        try:
+            req = PredictRequest.parse_obj(item)
+        except ValidationError as exc:
+            results[i] = {"index": start + i, "errors": validation_errors(exc)}
+            continue
+        positions.append(i)
+        valid.append(req.dict())
+    return results, positions, valid
+
+def predict_many(items: List[Any], start: int = 0) -> List[dict]:
+    """Validate each raw item and score all valid ones with a single predict_proba call.
+
+    Results keep the input order; invalid items carry their validation errors
+    instead of a probability. ``start`` offsets the reported indexes.
+    """
+    results, positions, valid = parse_items(items, start)
+    if valid:
+        probs = predict_probabilities(valid)
+        for i, prob in zip(positions, probs):
+            results[i] = {"index": start + i, "success_probability": float(prob)}
+    return results
+
+@app.post("/predict/batch", response_model=BatchPredictResponse)
+def predict_batch_endpoint(items: List[Any] = Body(...)):
+    """Retorna a probabilidade de sucesso de uma lista de filmes, com erros de validação por item."""
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote excede o máximo de {MAX_BATCH_SIZE} itens")
+    results = predict_many(items)
+    failed = sum(1 for r in results if r.get("errors"))
+    return {"count": len(results), "failed": failed, "results": results}
+
+def score_ndjson_chunk(lines: List[bytes], start: int) -> bytes:
+    """Parse and score one chunk of NDJSON lines, returning the NDJSON output block."""
+    parsed, results = [], [None] * len(lines)
+    positions = []
+    for i, line in enumerate(lines):
+        try:
+            parsed.append(json.loads(line))
+            positions.append(i)
+        except ValueError as exc:
+            results[i] = {"index": start + i, "errors": [{"loc": [], "msg": str(exc), "type": "json_invalid"}]}
+    for i, result in zip(positions, predict_many(parsed)):
+        result["index"] = start + i
+        results[i] = result
+    return b"".join(json.dumps(r).encode() + b"\n" for r in results)
+
+@app.post("/predict/batch/stream")
+async def predict_batch_stream(request: Request):
+    """Recebe filmes em NDJSON (um por linha) e devolve as predições em NDJSON, processando em blocos."""
+    # The body is read up front: StreamingResponse listens for client
+    # disconnects on the same receive channel, so the request stream cannot
+    # be consumed while the response is being written.
+    lines = [line for line in (await request.body()).split(b"\n") if line.strip()]
+    if len(lines) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote excede o máximo de {MAX_BATCH_SIZE} itens")
+
+    async def generate():
+        for start in range(0, len(lines), STREAM_CHUNK_SIZE):
+            chunk = lines[start:start + STREAM_CHUNK_SIZE]
+            yield await run_in_threadpool(score_ndjson_chunk, chunk, start)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# ----- Explanations -----
+# Tree-path (Saabas) contributions from CompiledForest.explain: each split's
+# change in the success probability is credited to its feature, so
+# base_value + the sum of all contributions equals the prediction.
+EXPLAIN_TOP = 10
+
+class FeatureContribution(BaseModel):
+    feature: str
+    value: float
+    contribution: float
+
+class ExplainResponse(BaseModel):
+    success_probability: float
+    base_value: float
+    contributions: List[FeatureContribution]
+    other: float
+
+class BatchExplainItem(BaseModel):
+    index: int
+    success_probability: Optional[float] = None
+    base_value: Optional[float] = None
+    contributions: Optional[List[FeatureContribution]] = None
+    other: Optional[float] = None
+    errors: Optional[List[dict]] = None
+
+class BatchExplainResponse(BaseModel):
+    count: int
+    failed: int
+    results: List[BatchExplainItem]
+
+def explain_items(items: List[dict], top: int = EXPLAIN_TOP) -> List[dict]:
+    """Prediction, base value and the ``top`` contributions (percentage points) of validated request dicts.
+
+    ``other`` is the sum of the contributions left out.
+    """
+    active = registry.current
+    names = active.feature_columns
+    results = []
+    for start in range(0, len(items), STREAM_CHUNK_SIZE):
+        X = active.encoder.encode_batch(items[start:start + STREAM_CHUNK_SIZE])
+        proba, bias, contributions = active.explain(X)
+        contributions = contributions[:, :, 1] * 100
+        base_value = float(bias[1] * 100)
+        ranked = np.argsort(-np.abs(contributions), axis=1, kind="stable")[:, :top]
+        for x, prob, contrib, best in zip(X, proba[:, 1] * 100, contributions, ranked):
+            shown = [
+                {"feature": names[i], "value": float(x[i]), "contribution": float(contrib[i])}
+                for i in best if contrib[i] != 0
+            ]
+            other = float(contrib.sum() - sum(c["contribution"] for c in shown))
+            results.append({"success_probability": float(prob), "base_value": base_value,
+                            "contributions": shown, "other": other})
+    return results
+
+@app.post("/predict/explain", response_model=ExplainResponse)
+def predict_explain(req: PredictRequest, top: int = Query(EXPLAIN_TOP, ge=1)):
+    """Retorna a probabilidade de sucesso e as features que mais contribuíram para ela."""
+    return explain_items([req.dict()], top)[0]
+
+@app.post("/predict/explain/batch", response_model=BatchExplainResponse)
+def predict_explain_batch(items: List[Any] = Body(...), top: int = Query(EXPLAIN_TOP, ge=1)):
+    """Retorna a explicação de cada filme de uma lista, com erros de validação por item."""
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote excede o máximo de {MAX_BATCH_SIZE} itens")
+    results, positions, valid = parse_items(items)
+    for i, explanation in zip(positions, explain_items(valid, top)):
+        results[i] = {"index": i, **explanation}
+    failed = sum(1 for r in results if r.get("errors"))
+    return {"count": len(results), "failed": failed, "results": results}
+
+# ----- What-if sweeps -----
+# A sweep encodes the base film once and derives every variant from that row:
+# numeric axes overwrite their columns over a grid, each candidate category
+# sets (or, for rating/loc, replaces) one one-hot column. The whole matrix is
+# scored in one call by the forest specialized on the base row, which only
+# branches on the columns that vary.
+MAX_SWEEP_POINTS = 5000
+SCALAR_FIELDS = tuple(field for field, _ in SCALAR_PREFIXES)
+
+class NumericAxis(BaseModel):
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    num: int = 50
+    scale: str = "linear"
+
+    @validator('num')
+    def validate_num(cls, v):
+        if v < 1:
+            raise ValueError('num deve ser maior que 0')
+        return v
+
+    @validator('scale')
+    def validate_scale(cls, v):
+        if v not in ("linear", "log"):
+            raise ValueError("scale deve ser 'linear' ou 'log'")
+        return v
+
+    def grid(self) -> np.ndarray:
+        if self.values is not None:
+            return np.asarray(self.values, dtype=float)
+        space = np.geomspace if self.scale == "log" else np.linspace
+        return space(self.start, self.stop, self.num)
+
+class SweepRequest(BaseModel):
+    base: PredictRequest
+    numeric: Dict[str, NumericAxis] = {}
+    categories: Dict[str, Optional[List[str]]] = {}  # null: every value known to the model
+    top: Optional[int] = None
+
+    @validator('numeric')
+    def validate_numeric(cls, v):
+        for field, axis in v.items():
+            if field not in NUMERIC_FEATURES:
+                raise ValueError(f'eixo numérico desconhecido: {field}')
+            if axis.values is None and (axis.start is None or axis.stop is None):
+                raise ValueError(f'{field}: informe values ou start e stop')
+            if axis.values is not None and not axis.values:
+                raise ValueError(f'{field}: values não pode ser vazio')
+            if axis.values is None and axis.scale == "log" and min(axis.start, axis.stop) <= 0:
+                raise ValueError(f'{field}: escala log exige start e stop positivos')
+        return v
+
+    @validator('top')
+    def validate_top(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('top deve ser maior que 0')
+        return v
+
+    @validator('categories')
+    def validate_categories(cls, v):
+        for field in v:
+            if field not in CATEGORICAL_FIELDS:
+                raise ValueError(f'campo categórico desconhecido: {field}')
+        return v
+
+class SweepPoint(BaseModel):
+    values: Dict[str, float]
+    success_probability: float
+    delta: float
+
+class CategoryEffect(BaseModel):
+    value: str
+    success_probability: float
+    delta: float
+    in_base: bool
+    known: bool
+
+class SweepResponse(BaseModel):
+    model_version: str
+    base_probability: float
+    points: List[SweepPoint]
+    categories: Dict[str, List[CategoryEffect]]
+
+def sweep_matrix(encoder, base: dict, axes: Dict[str, np.ndarray], candidates: Dict[str, List[str]]):
+    """Feature matrix of the base row, the numeric grid (cartesian product of ``axes``) and one row per candidate.
+
+    Returns the matrix, the grid as an (n_points, n_axes) array and the first
+    row of each candidate block.
+    """
+    x0 = encoder.encode(base)
+    grid = np.stack([m.ravel() for m in np.meshgrid(*axes.values(), indexing="ij")], axis=1) if axes \
+        else np.empty((0, 0))
+    n_rows = 1 + len(grid) + sum(len(values) for values in candidates.values())
+    X = np.repeat(x0[None, :], n_rows, axis=0)
+    if axes:
+        X[1:1 + len(grid), [encoder.index[field] for field in axes]] = grid
+    row = 1 + len(grid)
+    offsets = {}
+    for field, values in candidates.items():
+        group = encoder.group(field)
+        block = X[row:row + len(values)]
+        if field in SCALAR_FIELDS:
+            block[:, list(group.values())] = 0.0  # the candidate replaces the base value
+        known = [i for i, value in enumerate(values) if value in group]
+        block[known, [group[values[i]] for i in known]] = 1.0
+        offsets[field] = row
+        row += len(values)
+    return X, grid, offsets
+
+@app.post("/predict/sweep", response_model=SweepResponse)
+def predict_sweep(req: SweepRequest):
+    """Retorna como a probabilidade de sucesso varia ao percorrer orçamento/duração e ao trocar ou adicionar categorias."""
+    active = registry.current
+    encoder = active.encoder
+    base = req.base.dict()
+    axes = {field: axis.grid() for field, axis in req.numeric.items()}
+    for field, values in axes.items():
+        # PredictRequest only checks ranges, so the extremes of an axis stand for all of it
+        for value in (values.min(), values.max()):
+            try:
+                PredictRequest.parse_obj({**base, field: float(value)})
+            except ValidationError as exc:
+                raise HTTPException(status_code=422, detail=validation_errors(exc))
+    candidates = {
+        field: list(dict.fromkeys(values)) if values is not None else sorted(encoder.group(field))
+        for field, values in req.categories.items()
+    }
+    n_points = int(np.prod([len(values) for values in axes.values()])) if axes else 0
+    if n_points + sum(len(values) for values in candidates.values()) > MAX_SWEEP_POINTS:
+        raise HTTPException(status_code=413, detail=f"Sweep excede o máximo de {MAX_SWEEP_POINTS} variantes")
+
+    X, grid, offsets = sweep_matrix(encoder, base, axes, candidates)
+    probs = active.predict_variants(X)[:, 1] * 100
+    base_prob = float(probs[0])
+    names = list(axes)
+    points = [
+        {"values": dict(zip(names, values)), "success_probability": prob, "delta": prob - base_prob}
+        for values, prob in zip(grid.tolist(), probs[1:1 + len(grid)].tolist())
+    ]
+    x0 = X[0]
+    effects = {}
+    for field, values in candidates.items():
+        group = encoder.group(field)
+        start = offsets[field]
+        ranked = [
+            {"value": value, "success_probability": prob, "delta": prob - base_prob,
+             "in_base": bool(value in group and x0[group[value]] == 1.0), "known": value in group}
+            for value, prob in zip(values, probs[start:start + len(values)].tolist())
+        ]
+        ranked.sort(key=lambda effect: effect["delta"], reverse=True)
+        effects[field] = ranked[:req.top] if req.top is not None else ranked
+    body = {"model_version": active.version, "base_probability": base_prob, "points": points, "categories": effects}
+    # Rendered directly: validating thousands of points against SweepResponse would cost more than scoring them
+    return Response(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                    media_type="application/json")
+
+# ----- Pagination -----
+# Listings accept either limit/offset or an opaque keyset cursor. Every page
+# is ordered by a stable key and, when full, carries the cursor of its last
+# row in the X-Next-Cursor header, so walking the catalog never rescans the
+# rows already returned.
+MOVIE_LIST_COLUMNS = (
+    "m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
+    "m.runtimeMinutes, m.averageRating, m.numVotes"
+)
+SORT_ORDERS = {
+    "id": "m.id",
+    "votes": "m.numVotes DESC, m.id DESC",
+}
+
+def encode_cursor(order: str, row: dict) -> str:
+    key = [row["id"]] if order == "id" else [row["numVotes"], row["id"]]
+    raw = json.dumps({"o": order, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(order: str, cursor: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = data["k"]
+        valid = data["o"] == order and len(key) == (1 if order == "id" else 2)
+    except (ValueError, TypeError, KeyError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=400, detail="Cursor inválido para esta ordenação")
+    return key
+
+def keyset_condition(order: str, key: list):
+    """WHERE fragment selecting the rows strictly after ``key`` in SORT_ORDERS[order]."""
+    if order == "id":
+        return "m.id > %s", [key[0]]
+    votes, movie_id = key
+    # numVotes DESC puts NULLs last on both MySQL and SQLite
+    if votes is None:
+        return "(m.numVotes IS NULL AND m.id < %s)", [movie_id]
+    return ("(m.numVotes < %s OR (m.numVotes = %s AND m.id < %s) OR m.numVotes IS NULL)",
+            [votes, votes, movie_id])
+
+# Junction source and filter for each /{entity}/{id}/movies listing
+MOVIE_SOURCES = {
+    "genres": ("movie_genres mg JOIN movies m ON mg.movie_id = m.id", "mg.genre_id = %s"),
+    "languages": ("movie_languages ml JOIN movies m ON ml.movie_id = m.id", "ml.language_id = %s"),
+    "countries": ("movie_countries mc JOIN movies m ON mc.movie_id = m.id", "mc.country_id = %s"),
+    "companies": ("movie_companies mco JOIN movies m ON mco.movie_id = m.id", "mco.company_id = %s"),
+    "locations": ("movie_locations mlc JOIN movies m ON mlc.movie_id = m.id", "mlc.location_id = %s"),
+}
+
+def movie_page_query(source: str, where: Optional[str], params: list, limit: int, offset: int,
+                     key: Optional[list], order: str):
+    """SQL and parameters for one page of Movie rows from ``source`` (which must alias movies as m)."""
+    conditions = [where] if where else []
+    params = list(params)
+    if key is not None:
+        condition, key_params = keyset_condition(order, key)
+        conditions.append(condition)
+        params += key_params
+        offset = 0
+    sql = f"SELECT {MOVIE_LIST_COLUMNS} FROM {source}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {SORT_ORDERS[order]} LIMIT %s"
+    params.append(limit)
+    if offset:
+        sql += " OFFSET %s"
+        params.append(offset)
+    return sql, params
+
+async def page_movies(response: Response, entity: Optional[str], entity_id, limit: int, offset: int,
+                      cursor: Optional[str], order: str) -> List[dict]:
+    """Fetch one page of Movie rows (of the catalog, or of ``entity_id``) and set X-Next-Cursor when more may follow."""
+    if order not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order deve ser um de: {', '.join(SORT_ORDERS)}")
+    key = decode_cursor(order, cursor) if cursor else None
+    snapshot = published_catalog()
+    if snapshot is not None:
+        rows = snapshot.page(entity, entity_id, limit, offset, key, order)
+    else:
+        source, where = MOVIE_SOURCES[entity] if entity else ("movies m", None)
+        params = [entity_id] if entity else []
+        rows = await db.fetch_all(*movie_page_query(source, where, params, limit, offset, key, order))
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(order, rows[-1])
     return rows
 
+# ----- Faceted filtering -----
+# GET /movies/filter combines facets and numeric ranges over an in-memory
+# facet index (api/facets.py) instead of one JOIN per dimension. It is built
+# in the background at startup and rebuilt like the stats snapshot: on
+# POST /cache/invalidate and every IMDB_FACETS_REFRESH_SECONDS.
+FACETS_REFRESH_SECONDS = float(os.getenv("IMDB_FACETS_REFRESH_SECONDS", "600"))
+
+facet_index = SnapshotStore(db, catalog_or_db(facets_from_catalog, load_facets), refresh_seconds=FACETS_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def build_facet_index():
+    facet_index.start(build_now=True)
+
+@app.on_event("shutdown")
+async def stop_facet_watcher():
+    facet_index.stop()
+
+class FacetValue(BaseModel):
+    id: Union[int, str]
+    name: str
+    count: int
+
+class MovieFilterPage(BaseModel):
+    total: int
+    movies: List[Movie]
+    facets: Dict[str, List[FacetValue]]
+
+@app.get("/movies/filter", response_model=MovieFilterPage)
+async def filter_movies(where: Optional[str] = Query(None, max_length=2000), order: str = "votes",
+                        limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0, le=100000),
+                        facets: Optional[str] = None, facet_limit: int = Query(10, ge=1, le=1000)):
+    """Retorna os filmes que satisfazem o filtro `where`, o total e a contagem de cada faceta entre eles.
+
+    `where` combina facetas (`genre`, `language`, `country`, `company`, `location`, `content_rating`, por id ou
+    nome) e faixas numéricas (`year`, `rating`, `votes`, `runtime`, `budget`, `gross`, `metascore`) com
+    AND, OR, NOT e parênteses, por exemplo `genre:Drama genre:Comedy country:US,BR year:2010..2020 rating>=7`.
+    `order` é `votes` (padrão), `rating`, `year` ou `id`. `facets` (separadas por vírgula) escolhe as facetas
+    contadas (padrão `genre,language,country,content_rating`), cada uma com seus `facet_limit` valores mais frequentes.
+    """
+    if order not in FILTER_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order deve ser um de: {', '.join(FILTER_ORDERS)}")
+    wanted = DEFAULT_FACETS if facets is None else tuple(f.strip() for f in facets.split(",") if f.strip())
+    unknown = sorted(set(wanted) - set(FACETS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Faceta desconhecida: {', '.join(unknown)}")
+    index = await facet_index.snapshot()
+    with stage("filter"):
+        try:
+            return index.filter(where, order, limit, offset, wanted, facet_limit)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Filtro inválido: {exc}")
+
+# ----- Movie detail -----
+# Related lists are aggregated by correlated subqueries, so a movie (or a set
+# of movies) is assembled by a single statement in one round trip.
+RELATED_LISTS = {
+    "genres": "SELECT JSON_ARRAYAGG(g.name) FROM movie_genres mg JOIN genres g ON g.id = mg.genre_id WHERE mg.movie_id = m.id",
+    "languages": "SELECT JSON_ARRAYAGG(l.name) FROM movie_languages ml JOIN languages l ON l.id = ml.language_id WHERE ml.movie_id = m.id",
+    "countries": "SELECT JSON_ARRAYAGG(c.name) FROM movie_countries mc JOIN countries c ON c.id = mc.country_id WHERE mc.movie_id = m.id",
+    "companies": "SELECT JSON_ARRAYAGG(co.name) FROM movie_companies mco JOIN companies co ON co.id = mco.company_id WHERE mco.movie_id = m.id",
+    "locations": "SELECT JSON_ARRAYAGG(lo.name) FROM movie_locations mlc JOIN locations lo ON lo.id = mlc.location_id WHERE mlc.movie_id = m.id",
+}
+
+MOVIE_DETAIL_SQL = """
+    SELECT m.id, m.url, m.primaryTitle, m.originalTitle, m.type, m.description, m.primaryImage, m.trailer,
+           m.contentRating, m.isAdult, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, m.startYear,
+           m.endYear, m.runtimeMinutes, m.budget, m.grossWorldwide, m.averageRating, m.numVotes, m.metascore,
+           m.weekendGrossAmount, m.weekendGrossCurrency, m.lifetimeGrossAmount, m.lifetimeGrossCurrency,
+           m.weeksRunning, {related}
+    FROM movies m WHERE {{where}}
+""".format(related=", ".join(f"({sql}) AS {name}" for name, sql in RELATED_LISTS.items()))
+
+MAX_DETAIL_IDS = 100
+
+def hydrate_movie(row: dict) -> dict:
+    """Decode the JSON arrays produced by RELATED_LISTS into Python lists."""
+    for name in RELATED_LISTS:
+        value = row[name]
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode()
+        row[name] = json.loads(value) if isinstance(value, str) else (value or [])
+    return row
+
+@app.get("/movies", response_model=Union[List[MovieDetail], List[Movie]])
+async def list_movies(response: Response, limit: int = Query(10, ge=1, le=100),
+                      offset: int = Query(0, ge=0, le=100000), ids: Optional[str] = None,
+                      cursor: Optional[str] = None, order: str = "id"):
+    """Retorna uma lista de filmes com paginação.
+
+    Aceita `limit`/`offset` ou o `cursor` devolvido no cabeçalho `X-Next-Cursor` da página anterior.
+    Com `ids` (separados por vírgula), retorna os detalhes completos desses filmes, na ordem pedida.
+    """
+    if ids is not None:
+        return await movie_details(ids)
+    return await page_movies(response, None, None, limit, offset, cursor, order)
+
+async def movie_details(ids: str) -> List[dict]:
+    """Hydrate up to MAX_DETAIL_IDS movies with a single query."""
+    wanted = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not wanted:
+        return []
+    if len(wanted) > MAX_DETAIL_IDS:
+        raise HTTPException(status_code=400, detail=f"No máximo {MAX_DETAIL_IDS} ids por requisição")
+    snapshot = published_catalog()
+    if snapshot is not None:
+        with stage("hydrate"):
+            found = (snapshot.find(i) for i in wanted)
+            return [snapshot.detail(i) for i in found if i is not None]
+    placeholders = ", ".join(["%s"] * len(wanted))
+    rows = await db.fetch_all(MOVIE_DETAIL_SQL.format(where=f"m.id IN ({placeholders})"), wanted)
+    with stage("hydrate"):
+        by_id = {row["id"]: hydrate_movie(row) for row in rows}
+    return [by_id[i] for i in wanted if i in by_id]
+
 @app.get("/movies/{movie_id}", response_model=MovieDetail)
-def get_movie(movie_id: str):
+async def get_movie(movie_id: str):
     """Retorna detalhes completos do filme juntamente com gêneros, idiomas, países, produtoras e locações relacionados."""
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    # Main movie data
-    cursor.execute(
-        """
-        SELECT id, url, primaryTitle, originalTitle, type, description, primaryImage, trailer, contentRating,
-               isAdult, DATE_FORMAT(releaseDate, '%Y-%m-%d') AS releaseDate, startYear, endYear, runtimeMinutes,
-               budget, grossWorldwide, averageRating, numVotes, metascore, weekendGrossAmount,
-               weekendGrossCurrency, lifetimeGrossAmount, lifetimeGrossCurrency, weeksRunning
-        FROM movies WHERE id = %s
-        """, (movie_id,)
-    )
-    movie = cursor.fetchone()
+    snapshot = published_catalog()
+    if snapshot is not None:
+        i = snapshot.find(movie_id)
+        if i is None:
+            raise HTTPException(status_code=404, detail="Filme não encontrado")
+        with stage("hydrate"):
+            return snapshot.detail(i)
+    movie = await db.fetch_one(MOVIE_DETAIL_SQL.format(where="m.id = %s"), (movie_id,))
     if not movie:
-        cursor.close()
-        conn.close()
         raise HTTPException(status_code=404, detail="Filme não encontrado")
-    # Fetch related lists
-    cursor.execute("SELECT g.name FROM genres g JOIN movie_genres mg ON g.id = mg.genre_id WHERE mg.movie_id = %s", (movie_id,))
-    movie['genres'] = [r['name'] for r in cursor.fetchall()]
-    cursor.execute("SELECT l.name FROM languages l JOIN movie_languages ml ON l.id = ml.language_id WHERE ml.movie_id = %s", (movie_id,))
-    movie['languages'] = [r['name'] for r in cursor.fetchall()]
-    cursor.execute("SELECT c.name FROM countries c JOIN movie_countries mc ON c.id = mc.country_id WHERE mc.movie_id = %s", (movie_id,))
-    movie['countries'] = [r['name'] for r in cursor.fetchall()]
-    cursor.execute("SELECT co.name FROM companies co JOIN movie_companies mco ON co.id = mco.company_id WHERE mco.movie_id = %s", (movie_id,))
-    movie['companies'] = [r['name'] for r in cursor.fetchall()]
-    cursor.execute("SELECT lo.name FROM locations lo JOIN movie_locations mlc ON lo.id = mlc.location_id WHERE mlc.movie_id = %s", (movie_id,))
-    movie['locations'] = [r['name'] for r in cursor.fetchall()]
-    cursor.close()
-    conn.close()
-    return movie
+    with stage("hydrate"):
+        return hydrate_movie(movie)
+
+MASTER_LIST_SQL = {
+    table: f"SELECT id, name FROM {table} ORDER BY name"
+    for table in ("genres", "languages", "countries", "companies", "locations")
+}
 
 @app.get("/genres", response_model=List[Genre])
-def list_genres():
+async def list_genres(request: Request):
     """Retorna todos os gêneros."""
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM genres ORDER BY name")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+    return await cached(request, "genres", MASTER_LIST_SQL["genres"])
 
 @app.get("/genres/{genre_id}/movies", response_model=List[Movie])
-def movies_by_genre(genre_id: int, limit: int = 10, offset: int = 0):
+async def movies_by_genre(response: Response, genre_id: int, limit: int = Query(10, ge=1, le=100),
+                          offset: int = Query(0, ge=0, le=100000),
+                          cursor: Optional[str] = None, order: str = "id"):
     """Retorna filmes de um gênero específico."""
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, \
-         m.runtimeMinutes, m.averageRating, m.numVotes \
-         FROM movie_genres mg \
-         JOIN movies m ON mg.movie_id = m.id \
-         WHERE mg.genre_id = %s LIMIT %s OFFSET %s",
-        (genre_id, limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+    return await page_movies(response, "genres", genre_id, limit, offset, cursor, order)
 
 # ----- Master table endpoints -----
 class Language(BaseModel):
@@ -243,110 +892,95 @@ class Location(BaseModel):
     name: str
 
 @app.get("/languages", response_model=List[Language])
-def list_languages():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM languages ORDER BY name")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def list_languages(request: Request):
+    return await cached(request, "languages", MASTER_LIST_SQL["languages"])
 
 @app.get("/languages/{lang_id}/movies", response_model=List[Movie])
-def movies_by_language(lang_id: str, limit: int = 10, offset: int = 0):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
-        "m.runtimeMinutes, m.averageRating, m.numVotes "
-        "FROM movie_languages ml JOIN movies m ON ml.movie_id=m.id "
-        "WHERE ml.language_id=%s LIMIT %s OFFSET %s",
-        (lang_id, limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def movies_by_language(response: Response, lang_id: str, limit: int = Query(10, ge=1, le=100),
+                             offset: int = Query(0, ge=0, le=100000),
+                             cursor: Optional[str] = None, order: str = "id"):
+    return await page_movies(response, "languages", lang_id, limit, offset, cursor, order)
 
 @app.get("/countries", response_model=List[Country])
-def list_countries():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM countries ORDER BY name")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def list_countries(request: Request):
+    return await cached(request, "countries", MASTER_LIST_SQL["countries"])
 
 @app.get("/countries/{country_id}/movies", response_model=List[Movie])
-def movies_by_country(country_id: str, limit: int = 10, offset: int = 0):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
-        "m.runtimeMinutes, m.averageRating, m.numVotes "
-        "FROM movie_countries mc JOIN movies m ON mc.movie_id=m.id "
-        "WHERE mc.country_id=%s LIMIT %s OFFSET %s",
-        (country_id, limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def movies_by_country(response: Response, country_id: str, limit: int = Query(10, ge=1, le=100),
+                            offset: int = Query(0, ge=0, le=100000),
+                            cursor: Optional[str] = None, order: str = "id"):
+    return await page_movies(response, "countries", country_id, limit, offset, cursor, order)
 
 @app.get("/companies", response_model=List[Company])
-def list_companies():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM companies ORDER BY name")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def list_companies(request: Request):
+    return await cached(request, "companies", MASTER_LIST_SQL["companies"])
 
 @app.get("/companies/{company_id}/movies", response_model=List[Movie])
-def movies_by_company(company_id: str, limit: int = 10, offset: int = 0):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
-        "m.runtimeMinutes, m.averageRating, m.numVotes "
-        "FROM movie_companies mco JOIN movies m ON mco.movie_id=m.id "
-        "WHERE mco.company_id=%s LIMIT %s OFFSET %s",
-        (company_id, limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def movies_by_company(response: Response, company_id: str, limit: int = Query(10, ge=1, le=100),
+                            offset: int = Query(0, ge=0, le=100000),
+                            cursor: Optional[str] = None, order: str = "id"):
+    return await page_movies(response, "companies", company_id, limit, offset, cursor, order)
 
 @app.get("/locations", response_model=List[Location])
-def list_locations():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, name FROM locations ORDER BY name")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def list_locations(request: Request):
+    return await cached(request, "locations", MASTER_LIST_SQL["locations"])
 
 @app.get("/locations/{location_id}/movies", response_model=List[Movie])
-def movies_by_location(location_id: int, limit: int = 10, offset: int = 0):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
-        "m.runtimeMinutes, m.averageRating, m.numVotes "
-        "FROM movie_locations mlc JOIN movies m ON mlc.movie_id=m.id "
-        "WHERE mlc.location_id=%s LIMIT %s OFFSET %s",
-        (location_id, limit, offset)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def movies_by_location(response: Response, location_id: int, limit: int = Query(10, ge=1, le=100),
+                             offset: int = Query(0, ge=0, le=100000),
+                             cursor: Optional[str] = None, order: str = "id"):
+    return await page_movies(response, "locations", location_id, limit, offset, cursor, order)
+
+# ----- Bulk export -----
+# GET /export streams the whole catalog with its related lists. Rows are read
+# EXPORT_CHUNK_ROWS at a time through an unbuffered cursor (or from the
+# published catalog) and each chunk is encoded and sent before the next one
+# is fetched, so memory stays flat and no row goes through pydantic.
+EXPORT_SQL = MOVIE_DETAIL_SQL.format(where="TRUE") + "    ORDER BY m.id"
+
+def export_chunks(size: int = EXPORT_CHUNK_ROWS):
+    """Detail rows of every movie in id order, in lists of up to ``size`` (blocking)."""
+    snapshot = published_catalog()
+    if snapshot is not None:
+        yield from catalog_chunks(snapshot, size)
+        return
+    for rows in db.stream(EXPORT_SQL, size=size):
+        yield [hydrate_movie(row) for row in rows]
+
+@app.get("/export")
+def export_catalog(format: str = "ndjson"):
+    """Retorna o catálogo inteiro, com gêneros, idiomas, países, produtoras e locações, em `ndjson`, `csv` ou `parquet`.
+
+    A resposta é transmitida em blocos, à medida que as linhas são lidas do banco. No CSV, as listas vêm
+    separadas por `|`; o Parquet requer o pacote `pyarrow`.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format deve ser um de: {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="O formato parquet requer o pacote opcional pyarrow, "
+                                                    "que não está instalado (pip install pyarrow)")
+    media_type, extension = EXPORT_FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="imdb-catalog.{extension}"'}
+    return StreamingResponse(encode(format, export_chunks()), media_type=media_type, headers=headers)
 
 # ----- Stats -----
+# Served from an in-memory aggregate snapshot (api/stats.py) instead of a
+# GROUP BY per request. It is rebuilt in the background when the loader calls
+# POST /cache/invalidate and every IMDB_STATS_REFRESH_SECONDS (other worker
+# processes catch up on their own). Cache keys carry the snapshot generation,
+# so responses never outlive the snapshot they were computed from.
+STATS_REFRESH_SECONDS = float(os.getenv("IMDB_STATS_REFRESH_SECONDS", "600"))
+
+stats = SnapshotStore(db, catalog_or_db(stats_from_catalog, load_stats), refresh_seconds=STATS_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def watch_stats():
+    stats.start()
+
+@app.on_event("shutdown")
+async def stop_stats_watcher():
+    stats.stop()
+
 class GenreCount(BaseModel):
     name: str
     movie_count: int
@@ -355,40 +989,358 @@ class YearlyCount(BaseModel):
     year: int
     count: int
 
+class StatsSummary(BaseModel):
+    movie_count: int
+    avg_rating: Optional[float] = None
+    median_budget: Optional[float] = None
+    total_gross: Optional[float] = None
+
+class YearlyStats(StatsSummary):
+    year: int
+
+class DimensionStats(StatsSummary):
+    value: str
+
+STATS_FILTERS = {"genre": "genres", "country": "countries", "company": "companies", "language": "languages",
+                 "rating": "ratings"}
+
+def stats_filter(genre, country, company, language, rating):
+    """(dimension, value) of the single dimension filter given, or (None, None)."""
+    given = {name: value for name, value in
+             zip(STATS_FILTERS, (genre, country, company, language, rating)) if value is not None}
+    if len(given) > 1:
+        raise HTTPException(status_code=400, detail="Use apenas um filtro de dimensão por vez")
+    if not given:
+        return None, None
+    name, value = given.popitem()
+    return STATS_FILTERS[name], value
+
+def check_years(start: Optional[int], end: Optional[int]):
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start deve ser menor ou igual a end")
+
+async def stats_response(request: Request, name: str, params: tuple, compute) -> Response:
+    snapshot = await stats.snapshot()
+
+    async def run():
+        try:
+            return compute(snapshot)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Valor de dimensão não encontrado")
+
+    return await cached_result(request, name, (snapshot.generation,) + params, run)
+
 @app.get("/stats/genres/top", response_model=List[GenreCount])
-def stats_top_genres(limit: int = 10):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT g.name, COUNT(*) AS movie_count FROM movie_genres mg JOIN genres g ON mg.genre_id=g.id GROUP BY g.name ORDER BY movie_count DESC LIMIT %s", (limit,))
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def stats_top_genres(request: Request, limit: int = 10):
+    def compute(snapshot):
+        return [{"name": row["value"], "movie_count": row["movie_count"]}
+                for row in snapshot.breakdown("genres", limit=max(limit, 0))]
+    return await stats_response(request, "stats_top_genres", (limit,), compute)
 
 @app.get("/stats/yearly/count", response_model=List[YearlyCount])
-def stats_yearly_count(start: Optional[int] = None, end: Optional[int] = None):
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    sql = "SELECT startYear AS year, COUNT(*) AS count FROM movies WHERE startYear IS NOT NULL"
-    params = []
-    if start is not None:
-        sql += " AND startYear >= %s"; params.append(start)
-    if end is not None:
-        sql += " AND startYear <= %s"; params.append(end)
-    sql += " GROUP BY startYear ORDER BY startYear"
-    cursor.execute(sql, tuple(params))
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def stats_yearly_count(request: Request, start: Optional[int] = None, end: Optional[int] = None):
+    def compute(snapshot):
+        return [{"year": row["year"], "count": row["movie_count"]} for row in snapshot.yearly(start, end)]
+    return await stats_response(request, "stats_yearly_count", (start, end), compute)
+
+@app.get("/stats/summary", response_model=StatsSummary)
+async def stats_summary(request: Request, start: Optional[int] = None, end: Optional[int] = None,
+                        genre: Optional[str] = None, country: Optional[str] = None, company: Optional[str] = None,
+                        language: Optional[str] = None, rating: Optional[str] = None):
+    """Retorna contagem, nota média, orçamento mediano e bilheteria total dos filmes entre os anos `start` e `end`.
+
+    Aceita um filtro de dimensão por vez (`genre`, `country`, `company`, `language` ou `rating`, pelo nome).
+    """
+    check_years(start, end)
+    dimension, value = stats_filter(genre, country, company, language, rating)
+    return await stats_response(request, "stats_summary", (start, end, dimension, value),
+                                lambda snapshot: snapshot.summary(start, end, dimension, value))
+
+@app.get("/stats/yearly", response_model=List[YearlyStats])
+async def stats_yearly(request: Request, start: Optional[int] = None, end: Optional[int] = None,
+                       genre: Optional[str] = None, country: Optional[str] = None, company: Optional[str] = None,
+                       language: Optional[str] = None, rating: Optional[str] = None):
+    """Retorna, por ano, contagem, nota média, orçamento mediano e bilheteria total, com os mesmos filtros de `/stats/summary`."""
+    check_years(start, end)
+    dimension, value = stats_filter(genre, country, company, language, rating)
+    return await stats_response(request, "stats_yearly", (start, end, dimension, value),
+                                lambda snapshot: snapshot.yearly(start, end, dimension, value))
+
+@app.get("/stats/by/{dimension}", response_model=List[DimensionStats])
+async def stats_by_dimension(request: Request, dimension: str, start: Optional[int] = None,
+                             end: Optional[int] = None, sort: str = "movie_count",
+                             limit: int = Query(20, ge=1, le=10000), min_count: int = Query(1, ge=1)):
+    """Retorna as métricas de cada gênero, país, produtora, idioma ou classificação (`dimension`) entre `start` e `end`.
+
+    Ordena de forma decrescente por `sort` (`movie_count`, `avg_rating`, `median_budget` ou `total_gross`);
+    `min_count` ignora valores com poucos filmes.
+    """
+    if dimension not in STATS_DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Dimensão desconhecida; use {', '.join(STATS_DIMENSIONS)}")
+    if sort not in STATS_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort deve ser um de {', '.join(STATS_SORT_KEYS)}")
+    check_years(start, end)
+    return await stats_response(
+        request, "stats_breakdown", (dimension, start, end, sort, limit, min_count),
+        lambda snapshot: snapshot.breakdown(dimension, start, end, sort, limit, min_count),
+    )
+
+# ----- Search -----
+# GET /search answers from an in-memory inverted index (api/search.py) built
+# in the background at startup and rebuilt like the stats snapshot: on
+# POST /cache/invalidate and every IMDB_SEARCH_REFRESH_SECONDS.
+SEARCH_REFRESH_SECONDS = float(os.getenv("IMDB_SEARCH_REFRESH_SECONDS", "600"))
+
+search_index = SnapshotStore(db, catalog_or_db(search_from_catalog, load_search), refresh_seconds=SEARCH_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def build_search_index():
+    search_index.start(build_now=True)
+
+@app.on_event("shutdown")
+async def stop_search_watcher():
+    search_index.stop()
+
+class SearchHit(Movie):
+    score: float
+
+@app.get("/search", response_model=List[SearchHit])
+async def search_movies(response: Response, q: str = Query(..., min_length=1, max_length=200),
+                        limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0, le=10000),
+                        prefix: bool = True):
+    """Retorna os filmes cujo título ou descrição contém todas as palavras de `q`, dos mais relevantes aos menos.
+
+    Ignora acentos e maiúsculas; com `prefix` (padrão), a última palavra também casa com as que ela inicia,
+    para autocompletar. A relevância favorece filmes com mais votos. O total de resultados vem no
+    cabeçalho `X-Total-Count`.
+    """
+    index = await search_index.snapshot()
+    with stage("search"):
+        total, hits = index.search(q, limit, offset, prefix)
+    response.headers["X-Total-Count"] = str(total)
+    return hits
+
+# ----- Similar movies -----
+# GET /movies/{id}/similar and POST /predict/neighbors rank the catalog by
+# cosine similarity in the model's feature space, through an LSH index over
+# a sparse matrix of the catalog (api/neighbors.py). It is built in the
+# background at startup, rebuilt like the search index, and rebuilt again
+# when the registry swaps in another model.
+NEIGHBORS_REFRESH_SECONDS = float(os.getenv("IMDB_NEIGHBORS_REFRESH_SECONDS", "600"))
+MAX_NEIGHBORS = 100
+
+neighbor_index = SnapshotStore(
+    db,
+    catalog_or_db(lambda snapshot: neighbors_from_catalog(snapshot, registry.current),
+                  lambda database: load_neighbors(database, registry.current)),
+    refresh_seconds=NEIGHBORS_REFRESH_SECONDS,
+)
+
+@app.on_event("startup")
+async def build_neighbor_index():
+    app.state.neighbors_loop = asyncio.get_running_loop()
+    neighbor_index.start(build_now=True)
+
+@app.on_event("shutdown")
+async def stop_neighbor_watcher():
+    app.state.neighbors_loop = None
+    neighbor_index.stop()
+
+def rebuild_neighbors(_version):
+    """Registry swaps run on a worker thread; the rebuild is scheduled on the event loop."""
+    loop = getattr(app.state, "neighbors_loop", None)
+    if loop is not None and not loop.is_closed():
+        loop.call_soon_threadsafe(neighbor_index.refresh_later)
+
+registry.on_swap(rebuild_neighbors)
+
+class SimilarMovie(Movie):
+    similarity: float
+
+@app.get("/movies/{movie_id}/similar", response_model=List[SimilarMovie])
+async def similar_movies(movie_id: str, limit: int = Query(10, ge=1, le=MAX_NEIGHBORS)):
+    """Retorna os filmes mais parecidos com o filme, do mais ao menos parecido.
+
+    A similaridade é o cosseno entre as features do modelo de predição: gêneros, produtoras, idiomas, países,
+    locações, classificação indicativa, duração e orçamento.
+    """
+    index = await neighbor_index.snapshot()
+    with stage("neighbors"):
+        hits = index.similar(movie_id, limit)
+    if hits is None:
+        raise HTTPException(status_code=404, detail="Filme não encontrado")
+    return hits
+
+@app.post("/predict/neighbors", response_model=List[SimilarMovie])
+async def predict_neighbors(req: PredictRequest, limit: int = Query(10, ge=1, le=MAX_NEIGHBORS)):
+    """Retorna os filmes do catálogo mais parecidos com a proposta, no mesmo espaço de features da predição."""
+    index = await neighbor_index.snapshot()
+    with stage("neighbors"):
+        return index.neighbors(req.dict(), limit)
+
+# In-memory snapshots rebuilt by POST /cache/invalidate, by the name (or
+# name prefix, for the stats_* caches) that selects them
+SNAPSHOTS = {"stats": stats, "search": search_index, "facets": facet_index, "neighbors": neighbor_index}
 
 @app.get("/health")
 def health_check():
     return {"status":"ok"}
 
+@app.get("/health/db")
+def db_pool_metrics():
+    """Retorna o driver e as métricas do pool de conexões (abertas, em uso, ociosas, recicladas, esperas)."""
+    return db.metrics()
+
+@app.get("/health/predict")
+def predict_metrics():
+    """Retorna as métricas de predição: motor, cache de resultados e micro-batching (fila e ocupação dos lotes)."""
+    return {
+        "model": registry.metrics(),
+        "cache": prediction_cache.metrics(),
+        "batching": dict(batcher.metrics(), enabled=True) if batcher is not None else {"enabled": False},
+    }
+
+@app.get("/health/cache")
+def cache_metrics():
+    """Retorna os contadores do cache de respostas (acertos, faltas, requisições agrupadas, remoções)."""
+    return cache.metrics()
+
+@app.get("/health/stats")
+def stats_metrics():
+    """Retorna o estado do snapshot de estatísticas (geração, filmes, quando e em quanto tempo foi montado)."""
+    return stats.metrics()
+
+@app.get("/health/search")
+def search_metrics():
+    """Retorna o estado do índice de busca (geração, filmes, termos, postings, quando e em quanto tempo foi montado)."""
+    return search_index.metrics()
+
+@app.get("/health/facets")
+def facet_metrics():
+    """Retorna o estado do índice de facetas (geração, filmes, valores por faceta, quando e em quanto tempo foi montado)."""
+    return facet_index.metrics()
+
+@app.get("/health/neighbors")
+def neighbor_metrics():
+    """Retorna o estado do índice de filmes parecidos (geração, filmes, features, tabelas LSH, versão do modelo)."""
+    return neighbor_index.metrics()
+
+@app.get("/health/catalog")
+def catalog_metrics():
+    """Retorna o estado do catálogo em memória (versão ativa, filmes, tamanho, trocas) ou `enabled: false`."""
+    if catalog is None:
+        return {"enabled": False}
+    return dict(catalog.metrics(), enabled=True)
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(name: Optional[List[str]] = Query(None)):
+    """Descarta as respostas em cache (todas, ou só as dos endpoints em `name`); chamado pelo carregador após cada carga.
+
+    Quando inclui as estatísticas, a busca (`search`), as facetas (`facets`) ou os filmes parecidos (`neighbors`),
+    o snapshot deles é remontado em segundo plano. Com `IMDB_CATALOG_DIR`, também carrega a versão do catálogo
+    publicada (`catalog`), se mudou.
+    """
+    unknown = sorted(set(name or ()) - set(CACHE_TTLS) - set(SNAPSHOTS) - {"catalog"})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cache desconhecido: {', '.join(unknown)}")
+    result = {"invalidated": cache.invalidate(name)}
+    swapped = False
+    if catalog is not None and (name is None or "catalog" in name):
+        try:
+            swapped = await run_in_threadpool(catalog.reload)
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Falha ao carregar o catálogo: {exc}")
+        result["catalog_reload"] = swapped
+    for prefix, store in SNAPSHOTS.items():
+        # A new catalog version changes every snapshot built from it
+        rebuild = swapped or name is None or any(n == prefix or n.startswith(prefix + "_") for n in name)
+        if rebuild:
+            store.refresh_later()
+        result[f"{prefix}_rebuild"] = rebuild
+    return result
+
+# ----- Metrics -----
+# Pools, caches, the batcher and the registry already keep their own
+# counters; they are read when /metrics is scraped instead of being mirrored
+# on every request.
+COUNTER_STATS = {"submitted", "batches", "scored", "errors", "full_batches", "score_seconds", "checkouts",
+                 "created", "recycled", "failed_pings", "waits", "timeouts", "hits", "misses", "coalesced",
+                 "evictions", "invalidations", "loads", "swaps", "failed_loads"}
+
+def component_samples():
+    pool = db.metrics()
+    yield from dict_samples("imdb_db_pool", pool["pool"], COUNTER_STATS, (("driver", pool["driver"]),),
+                            "Connection pool state.")
+    if "async_pool" in pool:
+        yield from dict_samples("imdb_db_async_pool", pool["async_pool"], COUNTER_STATS, (), "aiomysql pool state.")
+    yield from dict_samples("imdb_response_cache", cache.metrics(), COUNTER_STATS, (), "Response cache state.")
+    yield from dict_samples("imdb_prediction_cache", prediction_cache.metrics(), COUNTER_STATS, (),
+                            "Prediction cache state.")
+    if batcher is not None:
+        yield from dict_samples("imdb_batcher", batcher.metrics(), COUNTER_STATS, (), "Micro-batcher state.")
+    yield from dict_samples("imdb_model", registry.stats, COUNTER_STATS, (), "Model registry state.")
+    yield from dict_samples("imdb_stats_snapshot", stats.metrics(), COUNTER_STATS | {"builds", "failed_builds"}, (),
+                            "Stats snapshot state.")
+    yield from dict_samples("imdb_search_index", search_index.metrics(), COUNTER_STATS | {"builds", "failed_builds"},
+                            (), "Search index state.")
+    yield from dict_samples("imdb_facet_index", facet_index.metrics(), COUNTER_STATS | {"builds", "failed_builds"},
+                            (), "Facet index state.")
+    yield from dict_samples("imdb_neighbor_index", neighbor_index.metrics(), COUNTER_STATS | {"builds", "failed_builds"},
+                            (), "Similar-movies index state.")
+    if catalog is not None:
+        yield from dict_samples("imdb_catalog", catalog.stats, COUNTER_STATS, (), "Catalog snapshot state.")
+        if catalog.current is not None:
+            yield from dict_samples("imdb_catalog_active", catalog.current.describe(), (), (), "Active catalog version.")
+    active = registry.current
+    yield ("imdb_model_info", "gauge", "Active model version.",
+           (("version", active.version), ("engine", active.engine)), 1)
+    yield "imdb_model_loaded_timestamp_seconds", "gauge", "When the active model was loaded.", (), active.loaded_at
+
+metrics.add_collector(component_samples)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Retorna as métricas no formato texto do Prometheus: latência por rota e por etapa, consultas por comando, pools, caches e modelo."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Stack sampling is opt-in (IMDB_PROFILER=1): each sample walks the frames
+# of every thread, which is too costly to leave running.
+PROFILER_ENABLED = os.getenv("IMDB_PROFILER", "0") == "1"
+MAX_PROFILE_SECONDS = 60
+profiler_lock = asyncio.Lock()
+
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(5.0, gt=0, le=MAX_PROFILE_SECONDS),
+                  interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """Amostra as pilhas de todas as threads durante `seconds` e retorna as pilhas agregadas (formato collapsed, para flame graphs)."""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler desabilitado (IMDB_PROFILER=1)")
+    if profiler_lock.locked():
+        raise HTTPException(status_code=409, detail="Já existe uma captura em andamento")
+    async with profiler_lock:
+        profiler = SamplingProfiler(interval=interval_ms / 1000)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await run_in_threadpool(profiler.stop)
+        headers = {"X-Profile-Samples": str(profiler.sample_count),
+                   "X-Profile-Seconds": f"{time.perf_counter() - started:.3f}"}
+        return PlainTextResponse(profiler.collapsed(), headers=headers)
+
+@app.post("/admin/model/reload")
+async def reload_model(force: bool = False):
+    """Recarrega o modelo se o arquivo mudou (ou sempre, com `force`); a versão ativa continua atendendo até a nova passar pelo aquecimento."""
+    try:
+        swapped = await run_in_threadpool(registry.reload, None, force)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Falha ao carregar o modelo: {exc}")
+    return {"swapped": swapped, "model": registry.current.describe()}
+
 @app.get("/version")
 def version():
-    return {"api_version":"1.0.0","database":"IMDB"}
+    return {"api_version":"1.0.0","database":"IMDB","model":registry.current.describe()}
 
 @app.get("/", response_class=HTMLResponse)
 def serve_ui():
@@ -499,15 +1451,11 @@ def serve_ui():
 class RatingOption(BaseModel):
     rating: str
 
+RATINGS_SQL = "SELECT DISTINCT contentRating AS rating FROM movies WHERE contentRating IS NOT NULL ORDER BY rating"
+
 @app.get("/ratings", response_model=List[RatingOption])
-def list_ratings():
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT DISTINCT contentRating AS rating FROM movies WHERE contentRating IS NOT NULL ORDER BY rating")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+async def list_ratings(request: Request):
+    return await cached(request, "ratings", RATINGS_SQL)
 
 # To run:
 # uvicorn api:app --reload --host 0.0.0.0 --port 8000
@@ -0,0 +1,109 @@
+"""Server-side micro-batching of single predictions.
+
+``MicroBatcher`` queues the items submitted by concurrent requests. A worker
+takes the first waiting item, gives others up to ``max_wait`` seconds to
+arrive (or until ``max_batch`` are queued) and scores the whole group with
+one call of ``score``, a blocking function run in the threadpool that maps a
+list of items to a list of results. Each caller gets its own result back.
+"""
+import asyncio
+import contextvars
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+class MicroBatcher:
+    """Coalesces concurrent ``submit`` calls into batched ``score`` calls."""
+
+    def __init__(self, score, max_batch=64, max_wait=0.002, workers=1):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers
+        self._loop = None
+        self._queue = None
+        self._full = None
+        self._tasks = []
+        self.stats = {"submitted": 0, "batches": 0, "scored": 0, "errors": 0, "max_queue_depth": 0,
+                      "full_batches": 0, "score_seconds": 0.0}
+
+    def _ensure_started(self):
+        # Queue and workers belong to the running loop; start them on first use
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._full = asyncio.Event()
+        # Workers outlive the request that started them: give them a fresh
+        # context so they do not carry its context variables along.
+        self._tasks = [contextvars.Context().run(loop.create_task, self._work()) for _ in range(self.workers)]
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        self.stats["submitted"] += 1
+        depth = self._queue.qsize()
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+        if depth >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _work(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() + 1 < self.max_batch:
+                # Hold the window open until it expires or enough items are queued
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if batch:
+                await self._run(batch)
+
+    async def _run(self, batch):
+        start = time.perf_counter()
+        try:
+            results = await run_in_threadpool(self.score, [item for item, _ in batch])
+        except Exception as exc:
+            self.stats["errors"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.stats["score_seconds"] += time.perf_counter() - start
+        self.stats["batches"] += 1
+        self.stats["scored"] += len(batch)
+        if len(batch) == self.max_batch:
+            self.stats["full_batches"] += 1
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def metrics(self) -> dict:
+        batches = self.stats["batches"]
+        mean = self.stats["scored"] / batches if batches else 0.0
+        return dict(
+            self.stats,
+            score_seconds=round(self.stats["score_seconds"], 4),
+            queue_depth=self._queue.qsize() if self._queue is not None else 0,
+            max_batch=self.max_batch,
+            max_wait_ms=self.max_wait * 1000,
+            workers=self.workers,
+            mean_batch_size=round(mean, 2),
+            batch_fill=round(mean / self.max_batch, 4),
+        )
@@ -0,0 +1,173 @@
+"""In-process caches.
+
+``ResponseCache`` serves endpoints whose data only changes when the loader
+runs. It keeps computed responses with a per-entry TTL in a size-bounded
+LRU. Concurrent misses on the same key are coalesced into a single load
+(single flight), so an expired entry never sends a burst of identical
+queries to the database. Every entry carries an ETag derived from its
+content, letting clients revalidate with ``If-None-Match``.
+
+``PredictionCache`` memoizes model outputs by canonical feature key for the
+model version that produced them.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+class CacheEntry:
+    __slots__ = ("value", "etag", "expires")
+
+    def __init__(self, value, etag, expires):
+        self.value = value
+        self.etag = etag
+        self.expires = expires
+
+def compute_etag(value) -> str:
+    """Strong ETag over ``value``: the bytes themselves, or the JSON form of anything else."""
+    if not isinstance(value, bytes):
+        value = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return '"' + hashlib.md5(value).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """True when an ``If-None-Match`` header value matches ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+class ResponseCache:
+    """TTL + LRU cache of endpoint results keyed by ``(name, args)`` tuples."""
+
+    def __init__(self, max_entries=1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._pending = {}             # key -> Task of the load in flight
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    async def get(self, key, ttl, load) -> CacheEntry:
+        """Return the entry for ``key``, awaiting ``load()`` on a miss.
+
+        The load runs in its own task, so a caller that is cancelled (a client
+        disconnecting) leaves it running for the others. Callers that miss
+        while a load for the same key is running wait for that load instead
+        of starting their own; if it fails they retry once with a fresh load.
+        """
+        retried = False
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > self._clock():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            pending = self._pending.get(key)
+            started = pending is None
+            if started:
+                self.stats["misses"] += 1
+                pending = self._pending[key] = asyncio.ensure_future(self._load(key, ttl, load))
+                # Retrieve the outcome even when every caller has gone
+                pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+            else:
+                self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except Exception:
+                if started or retried:
+                    raise
+                retried = True
+
+    async def _load(self, key, ttl, load) -> CacheEntry:
+        generation = self._generation
+        try:
+            value = await load()
+        finally:
+            del self._pending[key]
+        entry = CacheEntry(value, compute_etag(value), self._clock() + ttl)
+        # A load that raced an invalidation may hold stale rows: serve it once, don't keep it
+        if generation == self._generation:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, names=None) -> int:
+        """Drop the entries of the given endpoint names (all when None) and return how many."""
+        if names is None:
+            keys = list(self._entries)
+        else:
+            names = set(names)
+            keys = [key for key in self._entries if key[0] in names]
+        for key in keys:
+            del self._entries[key]
+        self._generation += 1
+        self.stats["invalidations"] += 1
+        return len(keys)
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        hit_ratio = (self.stats["hits"] + self.stats["coalesced"]) / lookups if lookups else 0.0
+        return dict(self.stats, size=len(self._entries), max_entries=self.max_entries,
+                    hit_ratio=round(hit_ratio, 4))
+
+class PredictionCache:
+    """Thread-safe LRU of model outputs, emptied whenever the model version changes."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self, version):
+        # Called with the lock held
+        if version != self.version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self.version = version
+
+    def get_many(self, keys, version) -> list:
+        """Cached values for ``keys`` (None for misses) computed by model ``version``."""
+        with self._lock:
+            self._check_version(version)
+            values = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.stats["misses"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                values.append(value)
+            return values
+
+    def put_many(self, keys, values, version):
+        if not self.max_entries:
+            return
+        with self._lock:
+            if version != self.version:
+                return  # computed by a model that has since been replaced
+            for key, value in zip(keys, values):
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries,
+                        hit_ratio=round(self.stats["hits"] / lookups, 4) if lookups else 0.0)
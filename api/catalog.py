@@ -0,0 +1,404 @@
+"""Columnar, memory-mapped snapshot of the movie catalog.
+
+``publish`` reads ``movies``, the master tables and the junction tables once
+and writes them as flat arrays under ``<directory>/<version>/``:
+
+* every string (ids, titles, descriptions, names) is interned into one
+  UTF-8 blob with offsets, and string columns hold int32 codes (-1 = NULL);
+  movie ids are interned first, in id order, so movie ``i`` is string ``i``;
+* numeric columns are float64 with NaN for NULL;
+* genres, languages, countries, companies and locations are CSR adjacency
+  in both directions: each movie's entities, and each entity's movies in
+  id order and in ``numVotes`` order.
+
+The arrays are ``.npy`` files loaded with ``mmap_mode="r"``, so every
+worker shares one copy through the page cache. A version is published by
+writing its directory, then replacing ``<directory>/CURRENT`` with its name
+in one rename; ``CatalogStore`` polls that file and swaps the new version in
+whole, while requests in flight keep reading the one they started with.
+
+    python -m api.catalog publish catalog/      # from the database configured for the API
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from api.registry import file_signature
+
+MOVIE_TEXT = ("url", "primaryTitle", "originalTitle", "type", "description", "primaryImage", "trailer",
+              "contentRating", "releaseDate", "weekendGrossCurrency", "lifetimeGrossCurrency")
+MOVIE_NUMBERS = ("isAdult", "startYear", "endYear", "runtimeMinutes", "budget", "grossWorldwide", "averageRating",
+                 "numVotes", "metascore", "weekendGrossAmount", "lifetimeGrossAmount", "weeksRunning")
+INTEGER_COLUMNS = {"isAdult", "startYear", "endYear", "runtimeMinutes", "numVotes", "metascore", "weeksRunning"}
+DETAIL_FIELDS = ("id", "url", "primaryTitle", "originalTitle", "type", "description", "primaryImage", "trailer",
+                 "contentRating", "isAdult", "releaseDate", "startYear", "endYear", "runtimeMinutes", "budget",
+                 "grossWorldwide", "averageRating", "numVotes", "metascore", "weekendGrossAmount",
+                 "weekendGrossCurrency", "lifetimeGrossAmount", "lifetimeGrossCurrency", "weeksRunning")
+LIST_FIELDS = ("id", "primaryTitle", "originalTitle", "releaseDate", "runtimeMinutes", "averageRating", "numVotes")
+
+MOVIES_SQL = ("SELECT m.id, {columns}, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate FROM movies m ORDER BY m.id"
+              .format(columns=", ".join(f"m.{c}" for c in MOVIE_TEXT + MOVIE_NUMBERS if c != "releaseDate")))
+# entity -> (master table query, junction query of (movie, entity) pairs)
+ENTITY_SQL = {
+    "genres": ("SELECT id, name FROM genres", "SELECT movie_id, genre_id FROM movie_genres"),
+    "languages": ("SELECT id, name FROM languages", "SELECT movie_id, language_id FROM movie_languages"),
+    "countries": ("SELECT id, name FROM countries", "SELECT movie_id, country_id FROM movie_countries"),
+    "companies": ("SELECT id, name FROM companies", "SELECT movie_id, company_id FROM movie_companies"),
+    "locations": ("SELECT id, name FROM locations", "SELECT movie_id, location_id FROM movie_locations"),
+}
+ENTITIES = tuple(ENTITY_SQL)
+
+CURRENT = "CURRENT"
+META = "catalog.json"
+
+def csr(groups, keys, n):
+    """Offsets (n + 1) and ``keys`` grouped by ``groups`` (already sorted by group)."""
+    return np.concatenate(([0], np.cumsum(np.bincount(groups, minlength=n)))).astype(np.int64), keys
+
+def lower_bound(n: int, after) -> int:
+    """First i in [0, n) with ``after(i)`` true, for a predicate that is false then true."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if after(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def decode_strings(blob: np.ndarray, offsets: np.ndarray, codes) -> list:
+    """Strings of ``codes`` in a ``StringTable`` blob (array or bytes); None for -1."""
+    codes = np.asarray(codes)
+    known = np.maximum(codes, 0)
+    data = blob.data if isinstance(blob, np.ndarray) else blob
+    return [None if code < 0 else str(data[lo:hi], "utf-8")
+            for code, lo, hi in zip(codes.tolist(), offsets[known].tolist(), offsets[known + 1].tolist())]
+
+# ----- Writing -----
+class StringTable:
+    """Interned strings: one code per distinct value, in first-seen order."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return -1
+        return self.codes.setdefault(str(value), len(self.codes))
+
+    def column(self, values) -> np.ndarray:
+        return np.array([self.code(v) for v in values], dtype=np.int32)
+
+    def arrays(self):
+        encoded = [s.encode("utf-8") for s in self.codes]
+        offsets = np.concatenate(([0], np.cumsum([len(b) for b in encoded]))).astype(np.int64)
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def build_arrays(movies, entities, pairs):
+    """Arrays and metadata of a snapshot from movie rows, master rows and junction pairs per entity."""
+    strings = StringTable()
+    ids = [row["id"] for row in movies]
+    for movie_id in ids:
+        strings.code(movie_id)  # movie i is string i
+    n = len(ids)
+    position = {movie_id: i for i, movie_id in enumerate(ids)}
+    arrays = {f"text_{c}": strings.column(row[c] for row in movies) for c in MOVIE_TEXT}
+    arrays.update({f"num_{c}": np.array([np.nan if row[c] is None else float(row[c]) for row in movies])
+                   for c in MOVIE_NUMBERS})
+    votes = np.nan_to_num(arrays["num_numVotes"], nan=-np.inf)
+    # SORT_ORDERS["votes"]: numVotes DESC (NULLs last), then id DESC
+    arrays["by_votes"] = np.lexsort((-np.arange(n), -votes)).astype(np.int32)
+    arrays["votes_rank"] = np.empty(n, dtype=np.int32)
+    arrays["votes_rank"][arrays["by_votes"]] = np.arange(n)
+    meta = {"movies": n, "entities": {}}
+    for entity in ENTITIES:
+        rows = sorted(entities[entity], key=lambda r: r["id"])
+        index = {row["id"]: i for i, row in enumerate(rows)}
+        integer = all(isinstance(row["id"], int) for row in rows)
+        arrays[f"{entity}_ids"] = (np.array([row["id"] for row in rows], dtype=np.int64) if integer
+                                   else strings.column(row["id"] for row in rows))
+        arrays[f"{entity}_names"] = strings.column(row["name"] for row in rows)
+        unique = {(position[m], index[e]) for m, e in pairs[entity] if m in position and e in index}
+        movie_idx = np.array([m for m, _ in unique], dtype=np.int32)
+        entity_idx = np.array([e for _, e in unique], dtype=np.int32)
+        order = np.lexsort((entity_idx, movie_idx))
+        arrays[f"{entity}_movie_offsets"], arrays[f"{entity}_movie_values"] = csr(movie_idx[order], entity_idx[order], n)
+        order = np.lexsort((movie_idx, entity_idx))
+        arrays[f"{entity}_offsets"], arrays[f"{entity}_movies"] = csr(entity_idx[order], movie_idx[order], len(rows))
+        # The same groups as votes ranks, ascending: a listing by votes is a slice of by_votes positions
+        ranks = arrays["votes_rank"][movie_idx]
+        order = np.lexsort((ranks, entity_idx))
+        arrays[f"{entity}_ranks"] = ranks[order]
+        meta["entities"][entity] = {"count": len(rows), "pairs": len(unique), "id_type": "int" if integer else "str"}
+    arrays["strings"], arrays["string_offsets"] = strings.arrays()
+    meta["strings"] = len(strings.codes)
+    return arrays, meta
+
+def write_version(directory: str, arrays: dict, meta: dict) -> str:
+    """Write one version under ``directory`` and point CURRENT at it; returns the version name."""
+    version = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    meta = dict(meta, version=version, created_at=time.time(), arrays=sorted(arrays))
+    with open(os.path.join(path, META), "w") as f:
+        json.dump(meta, f, indent=2)
+    tmp = os.path.join(directory, f"{CURRENT}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(directory, CURRENT))
+    return version
+
+def prune(directory: str, keep: int = 2):
+    """Delete all but the newest ``keep`` versions; workers still mapping one keep reading it."""
+    with open(os.path.join(directory, CURRENT)) as f:
+        current = f.read().strip()
+    versions = sorted(d for d in os.listdir(directory)
+                      if os.path.isfile(os.path.join(directory, d, META)) and d != current)
+    for version in versions[:max(len(versions) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+def publish(db, directory: str, keep: int = 2) -> dict:
+    """Snapshot the catalog in ``db`` into ``directory``; returns the new version's metadata."""
+    movies = db.query(MOVIES_SQL)
+    entities = {entity: db.query(master) for entity, (master, _) in ENTITY_SQL.items()}
+    pairs = {entity: [tuple(row.values()) for row in db.query(junction)] for entity, (_, junction) in ENTITY_SQL.items()}
+    arrays, meta = build_arrays(movies, entities, pairs)
+    os.makedirs(directory, exist_ok=True)
+    version = write_version(directory, arrays, meta)
+    prune(directory, keep)
+    return Catalog.load(directory, version).meta
+
+# ----- Reading -----
+class Catalog:
+    """One published version, memory-mapped."""
+
+    def __init__(self, directory, version, meta, arrays, signature=None):
+        self.directory = directory
+        self.version = version
+        self.meta = meta
+        self.signature = signature
+        self.a = arrays
+        self.n = meta["movies"]
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, directory: str, version: str = None) -> "Catalog":
+        signature = file_signature(os.path.join(directory, CURRENT))
+        if version is None:
+            with open(os.path.join(directory, CURRENT)) as f:
+                version = f.read().strip()
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, META)) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in meta["arrays"]}
+        return cls(directory, version, meta, arrays, signature)
+
+    # Strings and cells
+    def text(self, code):
+        if code < 0:
+            return None
+        offsets = self.a["string_offsets"]
+        return self.a["strings"][offsets[code]:offsets[code + 1]].tobytes().decode("utf-8")
+
+    def texts(self, codes) -> list:
+        """``text`` of many codes, reading the offsets once."""
+        return decode_strings(self.a["strings"], self.a["string_offsets"], codes)
+
+    def value(self, field: str, i: int):
+        if field == "id":
+            return self.text(i)
+        if field in MOVIE_NUMBERS:
+            x = self.a[f"num_{field}"][i]
+            if np.isnan(x):
+                return None
+            return int(x) if field in INTEGER_COLUMNS else float(x)
+        return self.text(int(self.a[f"text_{field}"][i]))
+
+    def movie(self, i: int, fields=LIST_FIELDS) -> dict:
+        return {field: self.value(field, i) for field in fields}
+
+    # Lookups
+    def find(self, movie_id: str):
+        """Index of ``movie_id``, or None."""
+        i = lower_bound(self.n, lambda m: self.text(m) >= movie_id)
+        return i if i < self.n and self.text(i) == movie_id else None
+
+    def entity_index(self, entity: str, entity_id):
+        """Index of ``entity_id`` among the entity's rows (sorted by id), or None."""
+        ids = self.a[f"{entity}_ids"]
+        if self.meta["entities"][entity]["id_type"] == "int":
+            try:
+                entity_id = int(entity_id)
+            except (TypeError, ValueError):
+                return None
+            i = int(np.searchsorted(ids, entity_id))
+            return i if i < len(ids) and ids[i] == entity_id else None
+        entity_id = str(entity_id)
+        i = lower_bound(len(ids), lambda e: self.text(int(ids[e])) >= entity_id)
+        return i if i < len(ids) and self.text(int(ids[i])) == entity_id else None
+
+    def related(self, entity: str, i: int) -> list:
+        offsets = self.a[f"{entity}_movie_offsets"]
+        names = self.a[f"{entity}_names"]
+        return [self.text(int(names[e])) for e in self.a[f"{entity}_movie_values"][offsets[i]:offsets[i + 1]]]
+
+    def detail(self, i: int) -> dict:
+        row = self.movie(i, DETAIL_FIELDS)
+        for entity in ENTITIES:
+            row[entity] = self.related(entity, i)
+        return row
+
+    def details(self, start: int, stop: int) -> list:
+        """``detail`` of movies ``start``..``stop - 1``, reading each column once."""
+        columns = {}
+        for field in DETAIL_FIELDS:
+            if field == "id":
+                columns[field] = self.texts(np.arange(start, stop))
+            elif field in MOVIE_NUMBERS:
+                cast = int if field in INTEGER_COLUMNS else float
+                columns[field] = [None if x != x else cast(x) for x in self.a[f"num_{field}"][start:stop].tolist()]
+            else:
+                columns[field] = self.texts(self.a[f"text_{field}"][start:stop])
+        for entity in ENTITIES:
+            offsets = self.a[f"{entity}_movie_offsets"][start:stop + 1].tolist()
+            values = self.a[f"{entity}_movie_values"][offsets[0]:offsets[-1]]
+            names = self.texts(self.a[f"{entity}_names"][values])
+            base = offsets[0]
+            columns[entity] = [names[lo - base:hi - base] for lo, hi in zip(offsets, offsets[1:])]
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    # Listings
+    def key_position(self, order: str, key: list) -> int:
+        """Position in the ``order`` listing of the whole catalog of the first movie after ``key``."""
+        if order == "id":
+            return lower_bound(self.n, lambda m: self.text(m) > key[0])
+        votes_after, movie_id = key
+        votes, by_votes = self.a["num_numVotes"], self.a["by_votes"]
+
+        def after(r):
+            m = int(by_votes[r])
+            v = votes[m]
+            if votes_after is None:
+                return np.isnan(v) and self.text(m) < movie_id
+            return np.isnan(v) or v < votes_after or (v == votes_after and self.text(m) < movie_id)
+        return lower_bound(self.n, after)
+
+    def page(self, entity, entity_id, limit: int, offset: int, key, order: str) -> list:
+        """Movie rows of one listing page, like ``movie_page_query`` over the database."""
+        if entity is None:
+            start = self.key_position(order, key) if key is not None else offset
+            positions = np.arange(start, min(start + limit, self.n))
+        else:
+            e = self.entity_index(entity, entity_id)
+            if e is None:
+                return []
+            lo, hi = self.a[f"{entity}_offsets"][e], self.a[f"{entity}_offsets"][e + 1]
+            group = self.a[f"{entity}_movies" if order == "id" else f"{entity}_ranks"][lo:hi]
+            if key is None:
+                start = offset
+            else:
+                # movies are numbered in id order and ranks in votes order, so either group is sorted
+                start = int(np.searchsorted(group, self.key_position(order, key)))
+            positions = group[start:start + limit]
+        movies = positions if order == "id" else self.a["by_votes"][positions]
+        return [self.movie(int(i)) for i in movies]
+
+    # Inputs of the other in-memory snapshots
+    def rows(self, fields) -> list:
+        return [self.movie(i, fields) for i in range(self.n)]
+
+    def pairs(self, entity: str) -> list:
+        """(movie id, entity id, entity name) of every link of ``entity``."""
+        offsets, movies = self.a[f"{entity}_offsets"], self.a[f"{entity}_movies"]
+        ids, names = self.a[f"{entity}_ids"], self.a[f"{entity}_names"]
+        integer = self.meta["entities"][entity]["id_type"] == "int"
+        out = []
+        for e in range(len(ids)):
+            entity_id = int(ids[e]) if integer else self.text(int(ids[e]))
+            name = self.text(int(names[e]))
+            out.extend((self.text(int(m)), entity_id, name) for m in movies[offsets[e]:offsets[e + 1]])
+        return out
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "movies": self.n,
+            "strings": self.meta["strings"],
+            "entities": self.meta["entities"],
+            "bytes": int(sum(array.nbytes for array in self.a.values())),
+            "created_at": self.meta["created_at"],
+            "loaded_at": self.loaded_at,
+        }
+
+class CatalogStore:
+    """Holds the current Catalog of ``directory`` and swaps in newly published versions."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.current = None
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "swaps": 0, "failed_loads": 0, "last_error": None, "last_check": None}
+
+    def reload(self) -> bool:
+        """Load the version CURRENT points at if it changed; False when nothing is published or it is unchanged."""
+        with self._lock:
+            try:
+                signature = file_signature(os.path.join(self.directory, CURRENT))
+            except FileNotFoundError:
+                return False
+            if self.current is not None and signature == self.current.signature:
+                return False
+            self.stats["loads"] += 1
+            try:
+                candidate = Catalog.load(self.directory)
+            except Exception as exc:
+                self.stats["failed_loads"] += 1
+                self.stats["last_error"] = f"{type(exc).__name__}: {exc}"
+                raise
+            previous, self.current = self.current, candidate
+            if previous is not None:
+                self.stats["swaps"] += 1
+            return True
+
+    async def watch(self, interval: float, on_swap=None):
+        """Check CURRENT every ``interval`` seconds; after a swap, call ``on_swap(catalog)`` on the event loop."""
+        while True:
+            await asyncio.sleep(interval)
+            self.stats["last_check"] = time.time()
+            try:
+                swapped = await run_in_threadpool(self.reload)
+            except Exception:
+                continue  # recorded in stats; the current version keeps serving
+            if swapped and on_swap is not None:
+                on_swap(self.current)
+
+    def metrics(self) -> dict:
+        return dict(self.stats, directory=self.directory,
+                    active=self.current.describe() if self.current is not None else None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    publish_cmd = sub.add_parser("publish", help="snapshot the database configured for the API")
+    publish_cmd.add_argument("directory")
+    publish_cmd.add_argument("--keep", type=int, default=2, help="versions kept, counting the new one")
+    args = parser.parse_args()
+    from api.api import db
+
+    t0 = time.perf_counter()
+    meta = publish(db, args.directory, args.keep)
+    print(f"published {meta['version']}: {meta['movies']} movies, {meta['strings']} strings, "
+          + ", ".join(f"{e} {m['count']}/{m['pairs']}" for e, m in meta["entities"].items())
+          + f" in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
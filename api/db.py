@@ -0,0 +1,415 @@
+"""Pooled database access for the API.
+
+``Database`` hides the driver behind ``fetch_all``/``fetch_one`` (coroutines
+returning dict rows), ``stream`` (chunks of dict rows from an unbuffered
+cursor, for exports) and ``connection()`` for code that needs a raw
+connection. Supported drivers:
+
+- ``mysql``: mysql-connector connections in a thread-safe ``ConnectionPool``;
+  coroutines run the blocking query in the threadpool.
+- ``aiomysql``: native asyncio pool, handlers never block a thread
+  (optional dependency, ``pip install aiomysql``).
+- ``sqlite``: a local SQLite file behind the same pool, for development and
+  benchmarks without a MySQL server.
+
+All drivers take MySQL-flavoured SQL with ``%s`` placeholders. Every query
+reports its pool checkout and statement time to ``api.metrics``.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from fastapi.concurrency import run_in_threadpool
+
+from api.metrics import metrics
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+class ConnectionPool:
+    """Fixed-size, thread-safe pool of DB-API connections.
+
+    Idle connections are reused LIFO. A connection older than ``recycle``
+    seconds is replaced on checkout, and one idle for more than
+    ``ping_after`` seconds is health-checked first, so only quiet
+    connections pay for the extra round trip.
+    """
+
+    def __init__(self, connect, size=10, recycle=3600, ping_after=30, timeout=30.0, ping=None):
+        self._connect = connect
+        self._ping = ping or _select_one
+        self.size = size
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._cond = threading.Condition()
+        self._open = 0
+        self._in_use = 0
+        self.stats = {"checkouts": 0, "created": 0, "recycled": 0, "failed_pings": 0, "waits": 0, "timeouts": 0}
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        entry = None
+        with self._cond:
+            self.stats["checkouts"] += 1
+            waited = False
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout}s")
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        now = time.monotonic()
+        if entry is not None:
+            conn, created, last_used = entry
+            if self.recycle and now - created > self.recycle:
+                self.stats["recycled"] += 1
+                _close_quietly(conn)
+                entry = None
+            elif self.ping_after is not None and now - last_used > self.ping_after and not self._ping(conn):
+                self.stats["failed_pings"] += 1
+                _close_quietly(conn)
+                entry = None
+        if entry is not None:
+            return conn, created
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        self.stats["created"] += 1
+        return conn, now
+
+    def _checkin(self, conn, created, broken):
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._open -= 1
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+            self._cond.notify()
+        if broken:
+            _close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it is discarded instead of returned if the block fails on it."""
+        conn, created = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except BaseException:
+            broken = not self._ping(conn)
+            raise
+        finally:
+            self._checkin(conn, created, broken)
+
+    def close(self):
+        """Close every idle connection; connections in use are closed on return."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for conn, _, _ in idle:
+            _close_quietly(conn)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return dict(self.stats, size=self.size, open=self._open, in_use=self._in_use, idle=len(self._idle))
+
+def _select_one(conn) -> bool:
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+        return True
+    except Exception:
+        return False
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+# ----- SQLite stand-in -----
+_MYSQL_DATE_CODES = {"%Y": "%Y", "%m": "%m", "%d": "%d", "%H": "%H", "%i": "%M", "%s": "%S", "%y": "%y"}
+
+def _date_format(value, fmt):
+    """Subset of MySQL's DATE_FORMAT over ISO date strings stored by SQLite."""
+    if value is None or fmt is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value) if len(value) > 10 else date.fromisoformat(value)
+        except ValueError:
+            return None
+    return value.strftime(re.sub(r"%[a-zA-Z]", lambda m: _MYSQL_DATE_CODES.get(m.group(0), m.group(0)), fmt))
+
+class _JSONArrayAgg:
+    """MySQL's JSON_ARRAYAGG as a SQLite aggregate (NULL when there are no rows)."""
+
+    def __init__(self):
+        self.items = []
+
+    def step(self, value):
+        self.items.append(value)
+
+    def finalize(self):
+        return json.dumps(self.items) if self.items else None
+
+class SQLiteCursor:
+    """DB-API cursor wrapper accepting ``%s`` placeholders and optional dict rows."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _rows(self, rows):
+        if not self._dictionary:
+            return rows
+        names = [d[0] for d in self._cursor.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), tuple(params or ()))
+
+    def executemany(self, sql, seq_params):
+        self._cursor.executemany(sql.replace("%s", "?"), [tuple(p) for p in seq_params])
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def fetchmany(self, size):
+        return self._rows(self._cursor.fetchmany(size))
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._rows([row])[0]
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """sqlite3 connection exposing the mysql-connector calls the API relies on."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.create_function("DATE_FORMAT", 2, _date_format, deterministic=True)
+        self._conn.create_aggregate("JSON_ARRAYAGG", 1, _JSONArrayAgg)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+# ----- Async MySQL -----
+class AsyncMySQLPool:
+    """aiomysql pool created lazily inside the running event loop."""
+
+    def __init__(self, config, size=10, recycle=3600, ping_after=30):
+        self.config = config
+        self.size = size
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._pool = None
+        self._lock = None
+        self._last_used = {}
+        self.stats = {"checkouts": 0, "failed_pings": 0}
+
+    async def _get_pool(self):
+        if self._pool is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._pool is None:
+                    import aiomysql
+                    self._pool = await aiomysql.create_pool(
+                        host=self.config["host"], port=self.config.get("port", 3306),
+                        user=self.config["user"], password=self.config["password"],
+                        db=self.config["database"], minsize=1, maxsize=self.size,
+                        pool_recycle=self.recycle, autocommit=True,
+                    )
+        return self._pool
+
+    async def execute(self, sql, params, one=False):
+        import aiomysql
+        pool = await self._get_pool()
+        # PyMySQL interpolates with the % operator, so literal percent signs
+        # such as DATE_FORMAT's '%Y' must be doubled when parameters are passed.
+        statement = sql
+        if params:
+            sql = re.sub(r"%(?!s)", "%%", sql)
+        requested = time.perf_counter()
+        async with pool.acquire() as conn:
+            self.stats["checkouts"] += 1
+            now = time.monotonic()
+            if now - self._last_used.get(id(conn), now) > self.ping_after:
+                try:
+                    await conn.ping(reconnect=True)
+                except Exception:
+                    self.stats["failed_pings"] += 1
+                    raise
+            started = time.perf_counter()
+            failed = True
+            try:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(sql, params or None)
+                    rows = await (cursor.fetchone() if one else cursor.fetchall())
+                failed = False
+                return rows
+            finally:
+                self._last_used[id(conn)] = time.monotonic()
+                metrics.observe_query(statement, started - requested, time.perf_counter() - started, failed)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def metrics(self) -> dict:
+        if self._pool is None:
+            return dict(self.stats, size=self.size, open=0, in_use=0, idle=0)
+        open_ = self._pool.size
+        idle = self._pool.freesize
+        return dict(self.stats, size=self.size, open=open_, in_use=open_ - idle, idle=idle)
+
+# ----- Facade -----
+class Database:
+    """Query helpers over a sync ``ConnectionPool`` and an optional async pool."""
+
+    def __init__(self, driver, pool, async_pool=None):
+        self.driver = driver
+        self.pool = pool
+        self.async_pool = async_pool
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            yield conn
+
+    def query(self, sql, params=(), one=False):
+        """Run one statement on a pooled connection and return dict rows (blocking)."""
+        requested = time.perf_counter()
+        with self.pool.connection() as conn:
+            started = time.perf_counter()
+            failed = True
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(sql, tuple(params))
+                rows = cursor.fetchone() if one else cursor.fetchall()
+                failed = False
+                return rows
+            finally:
+                cursor.close()
+                metrics.observe_query(sql, started - requested, time.perf_counter() - started, failed)
+
+    def stream(self, sql, params=(), size=1000):
+        """Yield the rows of one statement in lists of up to ``size`` dict rows (blocking).
+
+        The rows are read through an unbuffered cursor, so only one chunk is
+        held in memory, and the connection stays checked out until the
+        generator is exhausted or closed. A stream abandoned midway leaves
+        unread rows behind; its connection fails the pool's ping and is
+        discarded instead of being reused.
+        """
+        requested = time.perf_counter()
+        with self.pool.connection() as conn:
+            started = time.perf_counter()
+            failed = True
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            try:
+                cursor.execute(sql, tuple(params))
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+                failed = False
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass  # unread rows of an abandoned stream
+                metrics.observe_query(sql, started - requested, time.perf_counter() - started, failed)
+
+    async def fetch_all(self, sql, params=()):
+        if self.async_pool is not None:
+            return await self.async_pool.execute(sql, tuple(params))
+        return await run_in_threadpool(self.query, sql, params)
+
+    async def fetch_one(self, sql, params=()):
+        if self.async_pool is not None:
+            return await self.async_pool.execute(sql, tuple(params), one=True)
+        return await run_in_threadpool(self.query, sql, params, True)
+
+    async def close(self):
+        self.pool.close()
+        if self.async_pool is not None:
+            await self.async_pool.close()
+
+    def metrics(self) -> dict:
+        metrics = {"driver": self.driver, "pool": self.pool.metrics()}
+        if self.async_pool is not None:
+            metrics["async_pool"] = self.async_pool.metrics()
+        return metrics
+
+def create_database(db_config: dict, pool_config: dict) -> Database:
+    """Build the Database for ``pool_config['driver']``; no connection is opened yet."""
+    driver = pool_config.get("driver", "mysql")
+    size = pool_config.get("size", 10)
+    recycle = pool_config.get("recycle", 3600)
+    ping_after = pool_config.get("ping_after", 30)
+    timeout = pool_config.get("timeout", 30.0)
+    if driver == "sqlite":
+        path = pool_config.get("sqlite_path", "imdb.sqlite3")
+        connect = lambda: SQLiteConnection(path)
+    elif driver in ("mysql", "aiomysql"):
+        import mysql.connector
+        connect = lambda: mysql.connector.connect(autocommit=True, **db_config)
+    else:
+        raise ValueError(f"unknown database driver: {driver}")
+    pool = ConnectionPool(connect, size=size, recycle=recycle, ping_after=ping_after, timeout=timeout)
+    async_pool = AsyncMySQLPool(db_config, size=size, recycle=recycle, ping_after=ping_after) if driver == "aiomysql" else None
+    return Database(driver, pool, async_pool)
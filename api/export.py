@@ -0,0 +1,167 @@
+"""Streaming export of the denormalized catalog behind GET /export.
+
+Rows arrive in chunks, either from ``Database.stream`` over an unbuffered
+cursor or from a published ``api.catalog.Catalog``, and every chunk is
+encoded straight to bytes: NDJSON with ``json.dumps``, CSV with the ``csv``
+module (related lists joined by ``LIST_SEPARATOR``), or Parquet with
+pyarrow, one row group per chunk. Nothing holds more than one chunk and no
+row goes through pydantic, so memory stays flat whatever the catalog size.
+pyarrow is an optional dependency (``pip install pyarrow``, listed in
+``requirements-optional.txt``), only needed for Parquet.
+
+    python -m api.export --format csv --output catalog.csv    # from the database configured for the API
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from api.catalog import DETAIL_FIELDS, ENTITIES, INTEGER_COLUMNS, MOVIE_NUMBERS
+
+EXPORT_FIELDS = DETAIL_FIELDS + ENTITIES
+# format -> (media type, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+LIST_SEPARATOR = "|"
+CHUNK_ROWS = 1000
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def ndjson_chunks(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=json_default) + "\n" for row in rows).encode()
+
+def csv_chunks(chunks):
+    """A header line, then one CSV line per movie; related lists are joined by LIST_SEPARATOR."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    for rows in chunks:
+        writer.writerows([
+            [LIST_SEPARATOR.join(row[field]) if field in ENTITIES else row[field] for field in EXPORT_FIELDS]
+            for row in rows
+        ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # header of an empty export
+        yield buffer.getvalue().encode()
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file collecting what ParquetWriter emits until it is drained."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+def parquet_schema(pa):
+    """Fixed schema, so a chunk where a column is all NULL still matches the others."""
+    def kind(field):
+        if field in ENTITIES:
+            return pa.list_(pa.string())
+        if field in INTEGER_COLUMNS:
+            return pa.int64()
+        if field in MOVIE_NUMBERS:
+            return pa.float64()
+        return pa.string()
+    return pa.schema([(field, kind(field)) for field in EXPORT_FIELDS])
+
+def parquet_chunks(chunks):
+    """A Parquet file with one row group per chunk, emitted as each group is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(pa)
+    floats = [field for field in MOVIE_NUMBERS if field not in INTEGER_COLUMNS]
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in chunks:
+            columns = {field: [row[field] for row in rows] for field in EXPORT_FIELDS}
+            for field in floats:  # DECIMAL columns arrive as Decimal from MySQL
+                columns[field] = [None if v is None else float(v) for v in columns[field]]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+ENCODERS = {"ndjson": ndjson_chunks, "csv": csv_chunks, "parquet": parquet_chunks}
+
+def encode(fmt: str, chunks):
+    """Bytes of the export of ``chunks`` (lists of detail rows) in ``fmt``."""
+    return ENCODERS[fmt](chunks)
+
+def catalog_chunks(catalog, size=CHUNK_ROWS):
+    """Detail rows of a published catalog, ``size`` movies at a time, in id order."""
+    for start in range(0, catalog.n, size):
+        yield catalog.details(start, min(start + size, catalog.n))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--output", default="-", help="file to write, or - for stdout")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    if args.format == "parquet" and not parquet_available():
+        parser.error("parquet requires the optional package pyarrow, which is not installed (pip install pyarrow)")
+    from api.api import export_chunks
+
+    counts = {"rows": 0, "bytes": 0}
+
+    def counted(chunks):
+        for rows in chunks:
+            counts["rows"] += len(rows)
+            yield rows
+
+    t0 = time.perf_counter()
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for data in encode(args.format, counted(export_chunks(args.chunk_rows))):
+            out.write(data)
+            counts["bytes"] += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f"exported {counts['rows']} movies, {counts['bytes'] / 2 ** 20:.1f} MiB as {args.format} in {elapsed:.2f}s "
+          f"({counts['rows'] / elapsed:.0f} movies/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""In-memory facet index behind GET /movies/filter.
+
+Movies are numbered by id order. Each facet (genres, languages, countries,
+companies, locations, content ratings) is a sparse value x movie matrix in
+CSR form, so every value has the sorted numbers of its movies. A filter
+expression is evaluated to a boolean mask over the catalog: a value sets
+its movies, AND/OR/NOT are elementwise, and numeric ranges compare whole
+columns. Facet counts are one sparse product of a facet matrix with the
+mask, and the page is read off precomputed sort orders. ``load_facets``
+(or ``facets_from_catalog``) is the builder for ``api.snapshots.SnapshotStore``.
+
+Filter syntax (``where``)::
+
+    genre:Drama AND genre:Comedy AND country:US,BR AND year:2010..2020 AND rating>=7
+    (genre:Horror OR genre:Thriller) NOT language:en company:"Warner Bros."
+
+Adjacent terms are ANDed; ``a,b`` is a OR b; ranges are ``lo..hi`` with
+either side open, or ``>=``, ``<=``, ``>``, ``<``, ``=``.
+"""
+import re
+
+import numpy as np
+from scipy import sparse
+
+from api.search import fold
+
+MOVIES_SQL = (
+    "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
+    "m.runtimeMinutes, m.averageRating, m.numVotes, m.startYear, m.budget, m.grossWorldwide, m.metascore, "
+    "m.contentRating FROM movies m ORDER BY m.id"
+)
+MOVIE_FIELDS = ("id", "primaryTitle", "originalTitle", "releaseDate", "runtimeMinutes", "averageRating", "numVotes")
+
+# facet -> (movie id, value id, value name) rows; content_rating comes from movies.contentRating
+FACET_SQL = {
+    "genre": "SELECT mg.movie_id, g.id, g.name FROM movie_genres mg JOIN genres g ON g.id = mg.genre_id",
+    "language": "SELECT ml.movie_id, l.id, l.name FROM movie_languages ml JOIN languages l ON l.id = ml.language_id",
+    "country": "SELECT mc.movie_id, c.id, c.name FROM movie_countries mc JOIN countries c ON c.id = mc.country_id",
+    "company": "SELECT mco.movie_id, co.id, co.name FROM movie_companies mco JOIN companies co ON co.id = mco.company_id",
+    "location": "SELECT mlc.movie_id, lo.id, lo.name FROM movie_locations mlc JOIN locations lo ON lo.id = mlc.location_id",
+}
+FACETS = tuple(FACET_SQL) + ("content_rating",)
+FACET_TABLES = {"genre": "genres", "language": "languages", "country": "countries", "company": "companies",
+                "location": "locations"}
+# Counted unless the request names its facets; companies and locations have
+# thousands of values and most of the pairs
+DEFAULT_FACETS = ("genre", "language", "country", "content_rating")
+
+# range field -> movies column
+NUMERIC_FIELDS = {
+    "year": "startYear",
+    "rating": "averageRating",
+    "votes": "numVotes",
+    "runtime": "runtimeMinutes",
+    "budget": "budget",
+    "gross": "grossWorldwide",
+    "metascore": "metascore",
+}
+
+# Descending orders put movies without a value last; ties go by id
+SORT_ORDERS = {"id": None, "votes": "numVotes", "rating": "averageRating", "year": "startYear"}
+
+MAX_TERMS = 64
+# Each '(' or NOT costs a few Python frames; deeper filters are refused before hitting the recursion limit
+MAX_NESTING = 32
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(,)|"((?:[^"\\]|\\.)*)"|(>=|<=|>|<|=|:)|([^\s(),"<>=:]+))')
+
+def lex(text: str) -> list:
+    """(kind, text) tokens of a filter expression: paren, comma, op, quoted or word."""
+    tokens, pos, text = [], 0, text.strip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise ValueError(f"caractere inesperado na posição {pos}: {text[pos]!r}")
+        pos = match.end()
+        opening, closing, comma, quoted, op, word = match.groups()
+        if opening or closing:
+            tokens.append(("paren", opening or closing))
+        elif comma:
+            tokens.append(("comma", comma))
+        elif quoted is not None:
+            tokens.append(("quoted", re.sub(r"\\(.)", r"\1", quoted)))
+        elif op:
+            tokens.append(("op", op))
+        else:
+            tokens.append(("word", word))
+    return tokens
+
+def as_float(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+class Facet:
+    """Values of one facet as a sparse value x movie incidence matrix.
+
+    Its CSR arrays are the sorted movie numbers of each value (``indices``
+    between consecutive ``indptr``), and counting the values of a set of
+    movies is one product with that set's 0/1 vector.
+    """
+
+    def __init__(self, rows, position, n):
+        # Distinct (movie, value) pairs; rows of movies no longer in the catalog are dropped
+        unique = {(position[m], vid, name) for m, vid, name in rows if m in position and vid is not None}
+        values = sorted({(vid, name) for _, vid, name in unique}, key=lambda v: v[0])
+        self.ids = [vid for vid, _ in values]
+        self.names = [name for _, name in values]
+        index = {vid: i for i, vid in enumerate(self.ids)}
+        # Values are looked up by id or by name, case- and accent-insensitively; ids win
+        self.lookup = {fold(str(name)): i for i, name in enumerate(self.names) if name is not None}
+        self.lookup.update({fold(str(vid)): i for i, vid in enumerate(self.ids)})
+        docs = np.array([d for d, _, _ in unique], dtype=np.int32)
+        value_idx = np.array([index[vid] for _, vid, _ in unique], dtype=np.int32)
+        self.matrix = sparse.csr_matrix((np.ones(len(docs), dtype=np.float32), (value_idx, docs)),
+                                        shape=(len(self.ids), n))
+        self.matrix.sort_indices()
+
+    def value(self, text: str) -> int:
+        try:
+            return self.lookup[fold(text)]
+        except KeyError:
+            raise ValueError(f"valor desconhecido: {text!r}") from None
+
+    def movies(self, value: int) -> np.ndarray:
+        return self.matrix.indices[self.matrix.indptr[value]:self.matrix.indptr[value + 1]]
+
+    def counts(self, selected: np.ndarray) -> np.ndarray:
+        """Movies having each value among those where ``selected`` (float32 0/1 per movie) is 1."""
+        return (self.matrix @ selected).astype(np.int64)
+
+class FilterParser:
+    """Recursive-descent evaluation of a filter expression into a mask over the catalog."""
+
+    def __init__(self, index, text: str):
+        self.index = index
+        self.tokens = lex(text)
+        self.pos = 0
+        self.terms = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def keyword(self, word: str) -> bool:
+        kind, text = self.peek()
+        return kind == "word" and text.upper() == word
+
+    def nest(self):
+        self.depth += 1
+        if self.depth > MAX_NESTING:
+            raise ValueError(f"parênteses aninhados demais (no máximo {MAX_NESTING} níveis, contando cada NOT)")
+
+    def parse(self) -> np.ndarray:
+        mask = self.disjunction()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"trecho inesperado: {self.tokens[self.pos][1]!r}")
+        return mask
+
+    def disjunction(self):
+        mask = self.conjunction()
+        while self.keyword("OR"):
+            self.pos += 1
+            mask = mask | self.conjunction()
+        return mask
+
+    def conjunction(self):
+        mask = self.negation()
+        while True:
+            if self.keyword("AND"):
+                self.pos += 1
+            elif not (self.peek()[0] == "word" and not self.keyword("OR") or self.peek() == ("paren", "(")):
+                return mask
+            mask = mask & self.negation()
+
+    def negation(self):
+        if self.keyword("NOT"):
+            self.pos += 1
+            self.nest()
+            mask = ~self.negation()
+            self.depth -= 1
+            return mask
+        return self.atom()
+
+    def atom(self):
+        kind, text = self.take()
+        if (kind, text) == ("paren", "("):
+            self.nest()
+            mask = self.disjunction()
+            if self.take() != ("paren", ")"):
+                raise ValueError("parêntese não fechado")
+            self.depth -= 1
+            return mask
+        if kind != "word":
+            raise ValueError(f"esperado um campo, encontrado {text!r}" if text else "expressão incompleta")
+        self.terms += 1
+        if self.terms > MAX_TERMS:
+            raise ValueError(f"no máximo {MAX_TERMS} termos por filtro")
+        field = text.lower()
+        kind, op = self.take()
+        if kind != "op":
+            raise ValueError(f"esperado ':' ou uma comparação depois de {field!r}")
+        if field in self.index.facets:
+            if op not in (":", "="):
+                raise ValueError(f"{field} aceita apenas ':'")
+            values = [self.value()]
+            while self.peek()[0] == "comma":
+                self.pos += 1
+                values.append(self.value())
+            return self.index.facet_mask(field, values)
+        if field in NUMERIC_FIELDS:
+            return self.index.range_mask(field, op, self.value())
+        raise ValueError(f"campo desconhecido: {field!r}; use {', '.join(FACETS + tuple(NUMERIC_FIELDS))}")
+
+    def value(self) -> str:
+        kind, text = self.take()
+        if kind not in ("word", "quoted"):
+            raise ValueError("valor ausente" if text is None else f"valor inválido: {text!r}")
+        return text
+
+def number(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f"número inválido: {text!r}") from None
+
+class FacetIndex:
+    """Facets, numeric columns and sort ranks of the whole catalog."""
+
+    def __init__(self, movies, pairs):
+        self.movies = [{k: row[k] for k in MOVIE_FIELDS} for row in movies]
+        position = {row["id"]: i for i, row in enumerate(movies)}
+        n = len(movies)
+        pairs = dict(pairs, content_rating=[(row["id"], row["contentRating"], row["contentRating"]) for row in movies])
+        self.facets = {name: Facet(pairs[name], position, n) for name in FACETS}
+        self.columns = {field: as_float(row[column] for row in movies) for field, column in NUMERIC_FIELDS.items()}
+        # Movie numbers in each sort order
+        self.orders = {"id": np.arange(n)}
+        for order, column in SORT_ORDERS.items():
+            if column is not None:
+                field = next(f for f, c in NUMERIC_FIELDS.items() if c == column)
+                self.orders[order] = np.lexsort((np.arange(n), -np.nan_to_num(self.columns[field], nan=-np.inf)))
+        self.generation = 0
+
+    def facet_mask(self, facet: str, values) -> np.ndarray:
+        facet = self.facets[facet]
+        mask = np.zeros(len(self.movies), dtype=bool)
+        for value in values:
+            mask[facet.movies(facet.value(value))] = True
+        return mask
+
+    def range_mask(self, field: str, op: str, text: str) -> np.ndarray:
+        column = self.columns[field]
+        if op == ":" and ".." in text:
+            lo, hi = text.split("..", 1)
+            mask = np.ones(len(column), dtype=bool) if lo or hi else ~np.isnan(column)
+            if lo:
+                mask &= column >= number(lo)
+            if hi:
+                mask &= column <= number(hi)
+            return mask
+        value = number(text)
+        if op in (":", "="):
+            return column == value
+        return {">=": column >= value, "<=": column <= value, ">": column > value, "<": column < value}[op]
+
+    def page(self, mask: np.ndarray, order: str, limit: int, offset: int) -> np.ndarray:
+        """Movie numbers of the page, walking the sort order in growing chunks until it is filled."""
+        movies = self.orders[order]
+        wanted, start, step, found = offset + limit, 0, max(4 * (offset + limit), 1024), []
+        while wanted > 0 and start < len(movies):
+            chunk = movies[start:start + step]
+            hits = chunk[mask[chunk]][:wanted]
+            found.append(hits)
+            wanted -= len(hits)
+            start += step
+            step *= 4
+        return np.concatenate(found)[offset:] if found else np.empty(0, dtype=np.int64)
+
+    def top_values(self, facet: str, selected: np.ndarray, limit: int) -> list:
+        """The ``limit`` values with most movies among ``selected``; ties in id order."""
+        facet = self.facets[facet]
+        counts = facet.counts(selected)
+        idx = np.flatnonzero(counts)
+        if len(idx) > limit:
+            c = counts[idx]
+            kth = np.partition(c, len(c) - limit)[len(c) - limit]
+            above = idx[c > kth]
+            idx = np.concatenate((above, idx[c == kth][:limit - len(above)]))
+        idx = idx[np.lexsort((idx, -counts[idx]))]
+        return [{"id": facet.ids[i], "name": facet.names[i], "count": int(counts[i])} for i in idx]
+
+    def filter(self, where=None, order="votes", limit=20, offset=0, facets=DEFAULT_FACETS, facet_limit=10) -> dict:
+        """Page of movies matching ``where`` (all when empty), their total and the top values of ``facets``."""
+        if where and where.strip():
+            mask = FilterParser(self, where).parse()
+        else:
+            mask = np.ones(len(self.movies), dtype=bool)
+        selected = mask.astype(np.float32)
+        return {
+            "total": int(np.count_nonzero(mask)),
+            "movies": [self.movies[i] for i in self.page(mask, order, limit, offset)],
+            "facets": {name: self.top_values(name, selected, facet_limit) for name in facets},
+        }
+
+    def describe(self) -> dict:
+        return {
+            "movies": len(self.movies),
+            "values": {name: len(f.ids) for name, f in self.facets.items()},
+            "postings": sum(f.matrix.nnz for f in self.facets.values()),
+        }
+
+def load_facets(db) -> FacetIndex:
+    movies = db.query(MOVIES_SQL)
+    pairs = {name: [(row["movie_id"], row["id"], row["name"]) for row in db.query(sql)]
+             for name, sql in FACET_SQL.items()}
+    return FacetIndex(movies, pairs)
+
+def facets_from_catalog(catalog) -> FacetIndex:
+    """The same index from a published ``api.catalog.Catalog``."""
+    movies = catalog.rows(MOVIE_FIELDS + tuple(NUMERIC_FIELDS.values()) + ("contentRating",))
+    return FacetIndex(movies, {facet: catalog.pairs(table) for facet, table in FACET_TABLES.items()})
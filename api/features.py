@@ -0,0 +1,130 @@
+"""Feature encoding for the success model.
+
+``FeatureEncoder`` is built once from the model's ``feature_names_in_`` and
+turns PredictRequest-shaped dicts into rows in that column order, either as a
+preallocated dense matrix or as a CSR sparse matrix.
+"""
+from typing import Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+NUMERIC_FEATURES = ("runtimeMinutes", "budget")
+
+# Request field -> column prefix of its one-hot block
+LIST_PREFIXES = (
+    ("production_companies", "comp_"),
+    ("languages", "lang_"),
+    ("countries", "ctry_"),
+)
+SCALAR_PREFIXES = (
+    ("rating", "rating_"),
+    ("loc", "loc_"),
+)
+CATEGORICAL_FIELDS = ("genres",) + tuple(field for field, _ in LIST_PREFIXES + SCALAR_PREFIXES)
+# contentRating -> bucket of the "rating_" block, shared with scripts/train_model.py
+RATING_MAP = {
+    "G": "G", "TV-G": "G", "TV-Y7": "G",
+    "PG": "PG", "TV-PG": "PG", "Approved": "PG", "Passed": "PG", "Not Rated": "PG", "Unrated": "PG",
+    "PG-13": "PG-13", "TV-14": "PG-13",
+    "R": "R", "NC-17": "R", "TV-MA": "R", "18+": "R",
+}
+RATING_BUCKETS = ("G", "PG", "PG-13", "R")
+
+class FeatureEncoder:
+    """Maps request dicts onto the model's feature columns.
+
+    Produces exactly the vectors the original ``preprocess_input`` built:
+    numeric fields first, then every matching one-hot column set to 1.0.
+    Genres carry no prefix and, as before, are matched against every column.
+    """
+
+    def __init__(self, columns: Iterable[str]):
+        self.columns = list(columns)
+        self.n_features = len(self.columns)
+        self.index = {col: i for i, col in enumerate(self.columns)}
+        self.numeric = [(name, self.index[name]) for name in NUMERIC_FEATURES]
+        self.tables = {
+            field: {col[len(prefix):]: i for col, i in self.index.items() if col.startswith(prefix)}
+            for field, prefix in LIST_PREFIXES + SCALAR_PREFIXES
+        }
+        prefixes = tuple(prefix for _, prefix in LIST_PREFIXES + SCALAR_PREFIXES)
+        self.tables["genres"] = {
+            col: i for col, i in self.index.items() if col not in NUMERIC_FEATURES and not col.startswith(prefixes)
+        }
+
+    def group(self, field: str) -> dict:
+        """Known values of a categorical request field mapped to their one-hot column."""
+        return self.tables[field]
+
+    def onehot_indices(self, data: dict) -> List[int]:
+        """Sorted, deduplicated positions of the one-hot columns set by ``data``."""
+        found = set()
+        index = self.index
+        for g in data.get("genres") or ():
+            i = index.get(g)
+            if i is not None:
+                found.add(i)
+        for field, _ in LIST_PREFIXES:
+            table = self.tables[field]
+            for value in data.get(field) or ():
+                i = table.get(str(value))
+                if i is not None:
+                    found.add(i)
+        for field, _ in SCALAR_PREFIXES:
+            i = self.tables[field].get(str(data.get(field)))
+            if i is not None:
+                found.add(i)
+        return sorted(found)
+
+    def numeric_values(self, data: dict) -> List[float]:
+        """Numeric feature values in NUMERIC_FEATURES order (missing fields are 0)."""
+        return [data.get(name, 0) for name, _ in self.numeric]
+
+    def canonical_key(self, data: dict) -> tuple:
+        """Hashable form of the encoded request: numeric values plus sorted one-hot positions.
+
+        Requests that differ only in list order, duplicates or unknown values
+        (which encode to nothing) share a key.
+        """
+        return (tuple(float(v) for v in self.numeric_values(data)), tuple(self.onehot_indices(data)))
+
+    def _fill(self, row: np.ndarray, data: dict) -> None:
+        # row must be zeroed; one-hots are written last so they win on collisions
+        for name, i in self.numeric:
+            row[i] = data.get(name, 0)
+        row[self.onehot_indices(data)] = 1.0
+
+    def encode(self, data: dict, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dense feature vector for one request, optionally written into ``out``."""
+        if out is None:
+            out = np.zeros(self.n_features, dtype=float)
+        else:
+            out.fill(0.0)
+        self._fill(out, data)
+        return out
+
+    def encode_batch(self, items: List[dict], dtype=np.float64) -> np.ndarray:
+        """Dense (n_items, n_features) matrix, allocated once for the whole batch."""
+        X = np.zeros((len(items), self.n_features), dtype=dtype)
+        for row, data in zip(X, items):
+            self._fill(row, data)
+        return X
+
+    def encode_sparse(self, items: List[dict], dtype=np.float64) -> sparse.csr_matrix:
+        """CSR (n_items, n_features) matrix holding only the non-zero features."""
+        indptr = [0]
+        indices: List[int] = []
+        values: List[float] = []
+        for data in items:
+            cols = {i: v for (_, i), v in zip(self.numeric, self.numeric_values(data)) if v}
+            for i in self.onehot_indices(data):
+                cols[i] = 1.0
+            for i in sorted(cols):
+                indices.append(i)
+                values.append(cols[i])
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(values, dtype=dtype), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(items), self.n_features),
+        )
@@ -0,0 +1,366 @@
+"""Request, stage and query instrumentation in the Prometheus text format.
+
+``metrics`` is the process-wide ``Metrics`` registry. ``MetricsMiddleware``
+times every request by route template and status, and splits it into
+stages: ``validate`` (routing, body parsing and validation, up to the
+endpoint call), ``endpoint``, ``serialize`` (endpoint return to response
+start) and ``send``. Code on the hot path adds its own stages with
+``stage(name)``; they are attributed to the route of the request being
+served. Database statements are timed by fingerprint, and the caches,
+pools, batcher and model registry are read by collectors at scrape time,
+so they cost nothing between scrapes.
+
+Recording is a couple of ``perf_counter`` calls and a bisect under a lock.
+Set ``IMDB_METRICS=0`` to turn it off. ``SamplingProfiler`` is an opt-in
+stack sampler for finding where the time goes inside a stage.
+"""
+import bisect
+import contextvars
+import functools
+import hashlib
+import inspect
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from fastapi.routing import APIRoute
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestTimer:
+    """Timestamps of one request; shared with threadpool code through a context variable."""
+    __slots__ = ("route", "start", "endpoint_start", "endpoint_end", "response_start")
+
+    def __init__(self, start):
+        self.route = None
+        self.start = start
+        self.endpoint_start = None
+        self.endpoint_end = None
+        self.response_start = None
+
+_current = contextvars.ContextVar("imdb_request_timer", default=None)
+
+class Metrics:
+    """Counters and histograms keyed by name and labels, plus collectors read at scrape time."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._meta = {}        # name -> (type, help)
+        self._collectors = []
+        self._statements = {}  # sql -> statement fingerprint
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), value=1.0):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(name, labels, buckets).observe(value)
+
+    def _histogram(self, name, labels, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        return histogram
+
+    def add_collector(self, collect):
+        """Register ``collect()``, returning ``(name, kind, help, labels, value)`` samples for each scrape."""
+        self._collectors.append(collect)
+
+    # ----- Recording helpers -----
+    def observe_stage(self, stage, seconds, route=None):
+        if route is None:
+            timer = _current.get()
+            route = timer.route if timer is not None and timer.route else "-"
+        self.observe("imdb_stage_seconds", (("route", route), ("stage", stage)), seconds)
+
+    def observe_request(self, timer, method, status, end):
+        route = timer.route or "unmatched"
+        marks = ()
+        if timer.endpoint_start is not None and timer.endpoint_end is not None:
+            marks = [("validate", timer.start, timer.endpoint_start),
+                     ("endpoint", timer.endpoint_start, timer.endpoint_end)]
+            if timer.response_start is not None:
+                marks += [("serialize", timer.endpoint_end, timer.response_start),
+                          ("send", timer.response_start, end)]
+        counter = ("imdb_http_requests_total", (("method", method), ("route", route), ("status", str(status))))
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0.0) + 1
+            self._histogram("imdb_http_request_duration_seconds",
+                            (("method", method), ("route", route))).observe(end - timer.start)
+            for stage, begin, finish in marks:
+                self._histogram("imdb_stage_seconds", (("route", route), ("stage", stage))).observe(max(finish - begin, 0.0))
+
+    def statement(self, sql):
+        """Short stable name of a SQL statement: verb, first table and a digest of its normalized text."""
+        name = self._statements.get(sql)
+        if name is None:
+            normalized = re.sub(r"%s(\s*,\s*%s)+", "%s, ...", " ".join(sql.split()))
+            verb = normalized.split(" ", 1)[0].lower()
+            table = re.search(r"\bFROM\s+(\w+)", normalized, re.IGNORECASE)
+            digest = hashlib.md5(normalized.encode()).hexdigest()[:8]
+            name = f"{verb}_{table.group(1) if table else 'none'}_{digest}"
+            if len(self._statements) >= 4096:
+                self._statements.clear()
+            self._statements[sql] = name
+            self.describe_statement(name, normalized)
+        return name
+
+    def describe_statement(self, name, normalized):
+        with self._lock:
+            self._counters[("imdb_db_statement_info", (("statement", name), ("sql", normalized[:300])))] = 1.0
+
+    def observe_query(self, sql, acquire_seconds, query_seconds, failed=False):
+        """Record one database round trip: pool checkout time and statement time."""
+        if not self.enabled:
+            return
+        name = self.statement(sql)
+        self.observe("imdb_db_acquire_seconds", (), acquire_seconds)
+        self.observe("imdb_db_query_seconds", (("statement", name),), query_seconds)
+        if failed:
+            self.inc("imdb_db_query_errors_total", (("statement", name),))
+        self.observe_stage("db_acquire", acquire_seconds)
+        self.observe_stage("db_query", query_seconds)
+
+    def observe_inference(self, evaluator, rows, seconds):
+        labels = (("evaluator", evaluator),)
+        self.inc("imdb_model_inference_total", labels)
+        self.inc("imdb_model_rows_total", labels, rows)
+        self.observe("imdb_model_inference_seconds", labels, seconds)
+        self.observe("imdb_model_batch_rows", labels, rows, ROWS_BUCKETS)
+        self.observe_stage("inference", seconds)
+
+    # ----- Exposition -----
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()]
+        families = {}
+        for (name, labels), value in counters:
+            families.setdefault(name, []).append(f"{name}{format_labels(labels)} {format_value(value)}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, n in zip(buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                self._meta.setdefault(name, (kind, help_text))
+                families.setdefault(name, []).append(f"{name}{format_labels(labels)} {format_value(value)}")
+        out = []
+        for name in sorted(families):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            if help_text:
+                out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(families[name])
+        return "\n".join(out) + "\n"
+
+def format_labels(labels) -> str:
+    if isinstance(labels, dict):
+        labels = tuple(labels.items())
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+def dict_samples(prefix, values, counters=(), labels=(), help_text=""):
+    """Collector samples for the numeric entries of a ``metrics()`` dict; ``counters`` get a _total suffix."""
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            yield f"{prefix}_{key}_total", "counter", help_text, labels, value
+        else:
+            yield f"{prefix}_{key}", "gauge", help_text, labels, value
+
+metrics = Metrics(enabled=os.getenv("IMDB_METRICS", "1") != "0")
+metrics.describe("imdb_http_requests_total", "counter", "Requests by route template and status.")
+metrics.describe("imdb_http_request_duration_seconds", "histogram", "Request latency by route template.")
+metrics.describe("imdb_stage_seconds", "histogram", "Time spent per request stage, by route.")
+metrics.describe("imdb_db_acquire_seconds", "histogram", "Time to check a connection out of the pool.")
+metrics.describe("imdb_db_query_seconds", "histogram", "Statement execution and fetch time, by statement.")
+metrics.describe("imdb_db_query_errors_total", "counter", "Failed statements, by statement.")
+metrics.describe("imdb_db_statement_info", "gauge", "Normalized SQL of each statement fingerprint.")
+metrics.describe("imdb_model_inference_total", "counter", "Model calls, by evaluator.")
+metrics.describe("imdb_model_rows_total", "counter", "Rows scored, by evaluator.")
+metrics.describe("imdb_model_inference_seconds", "histogram", "Model call latency, by evaluator.")
+metrics.describe("imdb_model_batch_rows", "histogram", "Rows per model call, by evaluator.")
+
+@contextmanager
+def stage(name):
+    """Time the block as stage ``name`` of the current request."""
+    if not metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_stage(name, time.perf_counter() - start)
+
+# ----- Request timing -----
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and the stage split of every HTTP request."""
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.metrics = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        timer = RequestTimer(time.perf_counter())
+        token = _current.set(timer)
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timer.response_start = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                timer.route = route
+            self.metrics.observe_request(timer, scope["method"], status, time.perf_counter())
+
+def _mark(attribute, route):
+    timer = _current.get()
+    if timer is not None:
+        timer.route = route
+        setattr(timer, attribute, time.perf_counter())
+
+def timed_endpoint(endpoint, path):
+    """Wrap ``endpoint`` (sync or async) to mark when it starts and returns."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            _mark("endpoint_start", path)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark("endpoint_end", path)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            _mark("endpoint_start", path)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark("endpoint_end", path)
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """APIRoute whose endpoint reports its start and end to the request timer.
+
+    Marking the route at endpoint start also attributes the stages recorded
+    inside the endpoint (``stage``, queries, inference) to it.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, timed_endpoint(endpoint, path), **kwargs)
+
+# ----- Sampling profiler -----
+class SamplingProfiler:
+    """Samples the Python stacks of all threads every ``interval`` seconds.
+
+    Opt-in and meant for short captures: each sample walks every thread's
+    frames. ``collapsed()`` returns one ``frame;frame;... count`` line per
+    distinct stack, the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("profiler already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    label = names.get(code)
+                    if label is None:
+                        label = names[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(label)
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
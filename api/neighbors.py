@@ -0,0 +1,224 @@
+"""Approximate nearest neighbours in the model's feature space.
+
+Backs GET /movies/{id}/similar and POST /predict/neighbors. Every catalog
+movie is encoded onto the active model's feature columns, the way the
+training script encodes it: genre, company, language, country, location
+and rating-bucket one-hots, plus runtime and log-budget as z-scores. The
+rows are L2-normalised into a CSR matrix, so cosine similarity is a dot
+product.
+
+Lookups go through a random-hyperplane LSH index (SimHash, the LSH family
+for cosine): ``LSH_TABLES`` tables of ``LSH_BITS`` sign bits each. All the
+(table, code) keys live in one sorted array, so the buckets of a query in
+every table are found by a single ``searchsorted``. The movies in the
+query's buckets are re-ranked exactly; the buckets one bit away are added
+when those hold few movies, and the whole matrix is scored when even they
+hold fewer than ``k``. Up to ``EXACT_MAX_MOVIES`` movies one sparse product
+over the whole matrix is faster than the lookup, so smaller catalogs are
+always scored exactly. ``python -m benchmarks.bench_neighbors`` measures
+recall and latency against the exact scan.
+``load_neighbors`` (or ``neighbors_from_catalog``) is the builder for
+``api.snapshots.SnapshotStore``.
+"""
+import numpy as np
+from scipy import sparse
+
+from api.facets import FACET_SQL, FACET_TABLES, MOVIE_FIELDS, MOVIES_SQL
+from api.features import RATING_MAP, FeatureEncoder
+
+# Request field of the encoder -> (facet, key of the label); the training
+# script labels genres, companies and locations by name, languages and
+# countries by id
+LABELS = (
+    ("genres", "genre", "name"),
+    ("production_companies", "company", "name"),
+    ("languages", "language", "id"),
+    ("countries", "country", "id"),
+    ("loc", "location", "name"),
+)
+# A z-score of 1 on runtime or budget weighs as much as a quarter of a shared label
+NUMERIC_WEIGHT = 0.5
+LSH_TABLES = 24
+LSH_BITS = 18
+# Buckets one bit away are probed too when the query's own hold fewer than this many movies per result
+MIN_CANDIDATES = 20
+# Below this cosine the collision odds drop fast (0.8 per bit at 0.8), so such results are rescanned exactly
+LSH_MIN_SIMILARITY = 0.8
+EXACT_MAX_MOVIES = 50_000
+LSH_SEED = 20240901  # fixed, so every worker hashes alike
+
+def as_float(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+def normalize(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+class NeighborIndex:
+    """CSR feature matrix of the catalog plus an LSH index over its rows."""
+
+    def __init__(self, movies, pairs, columns, model_version=None):
+        self.movies = [{k: row[k] for k in MOVIE_FIELDS} for row in movies]
+        self.position = {row["id"]: i for i, row in enumerate(movies)}
+        self.encoder = FeatureEncoder(columns)
+        self.model_version = model_version
+        n = len(movies)
+
+        runtime = as_float(row["runtimeMinutes"] for row in movies)
+        budget = np.log1p(np.fmax(as_float(row["budget"] for row in movies), 0))
+        self.scale = {}
+        numeric = []
+        for (name, column), values in zip(self.encoder.numeric, (runtime, budget)):
+            known = values[~np.isnan(values)]
+            mean, std = (float(known.mean()), float(known.std()) or 1.0) if len(known) else (0.0, 1.0)
+            self.scale[name] = (mean, std)
+            # Unknown values sit at the mean
+            numeric.append((column, np.nan_to_num((values - mean) / std * NUMERIC_WEIGHT)))
+
+        rows, cols = [], []
+        for field, facet, key in LABELS:
+            group = self.encoder.group(field)
+            for movie_id, value_id, name in pairs.get(facet, ()):
+                i, col = self.position.get(movie_id), group.get(str(value_id if key == "id" else name))
+                if i is not None and col is not None:
+                    rows.append(i)
+                    cols.append(col)
+        ratings = self.encoder.group("rating")
+        for i, row in enumerate(movies):
+            col = ratings.get(RATING_MAP.get(row["contentRating"]))
+            if col is not None:
+                rows.append(i)
+                cols.append(col)
+        values = [1.0] * len(rows)
+        for column, z in numeric:
+            rows.extend(range(n))
+            cols.extend([column] * n)
+            values.extend(z)
+        # Duplicate (movie, label) pairs are summed by the constructor; clip them back to 1
+        matrix = sparse.csr_matrix((values, (rows, cols)), shape=(n, self.encoder.n_features), dtype=np.float64)
+        onehot = np.ones(self.encoder.n_features, dtype=bool)
+        onehot[[column for column, _ in numeric]] = False
+        matrix.data[onehot[matrix.indices]] = 1.0
+        matrix.eliminate_zeros()
+        self.matrix = normalize(matrix)
+
+        rng = np.random.default_rng(LSH_SEED)
+        self.planes = rng.standard_normal((self.encoder.n_features, LSH_TABLES * LSH_BITS)).astype(np.float32)
+        keys = self.keys(np.asarray((self.matrix @ self.planes)))
+        order = np.argsort(keys, axis=None, kind="stable")
+        self.bucket_keys = keys.ravel()[order].astype(np.int32)  # LSH_TABLES << LSH_BITS < 2 ** 31
+        self.bucket_movies = (order // LSH_TABLES).astype(np.int32)
+        self.generation = 0
+
+    @staticmethod
+    def keys(projections: np.ndarray) -> np.ndarray:
+        """(rows, LSH_TABLES) bucket keys: the table number above the ``LSH_BITS`` sign bits of that table."""
+        bits = (projections > 0).reshape(len(projections), LSH_TABLES, LSH_BITS)
+        codes = bits.astype(np.int64) @ (1 << np.arange(LSH_BITS, dtype=np.int64))
+        return codes + (np.arange(LSH_TABLES, dtype=np.int64) << LSH_BITS)
+
+    def vector(self, data: dict) -> np.ndarray:
+        """Normalised feature vector of a PredictRequest-shaped dict."""
+        x = np.zeros(self.encoder.n_features, dtype=np.float32)
+        x[self.encoder.onehot_indices(data)] = 1.0
+        for name, column in self.encoder.numeric:
+            value = data.get(name)
+            if value is not None:
+                value = np.log1p(max(float(value), 0.0)) if name == "budget" else float(value)
+                mean, std = self.scale[name]
+                x[column] = (value - mean) / std * NUMERIC_WEIGHT
+        norm = np.linalg.norm(x)
+        return x / norm if norm else x
+
+    def candidates(self, x: np.ndarray, probe=False) -> np.ndarray:
+        """Movies sharing a bucket with ``x`` in some table; with ``probe``, also the buckets one bit away."""
+        probes = self.keys((x @ self.planes)[None, :])[0]
+        if probe:
+            probes = np.concatenate((probes, (probes[:, None] ^ (1 << np.arange(LSH_BITS, dtype=np.int64))).ravel()))
+        probes = probes.astype(self.bucket_keys.dtype)  # a wider dtype would copy the keys on every search
+        lo = np.searchsorted(self.bucket_keys, probes, "left")
+        hi = np.searchsorted(self.bucket_keys, probes, "right")
+        hit = np.flatnonzero(hi > lo)
+        if not len(hit):
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate([self.bucket_movies[a:b] for a, b in zip(lo[hit], hi[hit])]))
+
+    def nearest(self, x: np.ndarray, k: int, exclude=None, exact=None):
+        """(movie numbers, cosine similarities) of the ``k`` movies closest to ``x``, best first.
+
+        ``exact`` forces (True) or skips (False) the full scan; by default small catalogs are scanned.
+        """
+        wanted = k + (exclude is not None)
+        if exact is None:
+            exact = len(self.movies) <= EXACT_MAX_MOVIES
+        pool = None
+        if not exact:
+            pool = self.candidates(x)
+            if len(pool) < MIN_CANDIDATES * wanted:
+                pool = self.candidates(x, probe=True)
+            if len(pool) < wanted:
+                pool = None
+        if pool is not None:
+            scores = self.matrix[pool] @ x
+            # Far neighbours rarely share a bucket, so a weak k-th match may hide better ones
+            if np.partition(scores, len(scores) - wanted)[len(scores) - wanted] < LSH_MIN_SIMILARITY:
+                pool = None
+        if pool is None:
+            pool, scores = np.arange(len(self.movies)), self.matrix @ x
+        if exclude is not None:
+            keep = pool != exclude
+            pool, scores = pool[keep], scores[keep]
+        if len(pool) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            pool, scores = pool[top], scores[top]
+        # Most similar first; ties in id order
+        order = np.lexsort((pool, -scores))
+        return pool[order], scores[order]
+
+    def hits(self, found, scores) -> list:
+        return [dict(self.movies[i], similarity=round(float(s), 4)) for i, s in zip(found, scores)]
+
+    def similar(self, movie_id: str, k: int = 10, exact=None):
+        """The ``k`` movies most like ``movie_id`` (itself excluded); None if it is not in the index."""
+        i = self.position.get(movie_id)
+        if i is None:
+            return None
+        x = self.matrix[i].toarray().ravel()
+        return self.hits(*self.nearest(x, k, exclude=i, exact=exact))
+
+    def neighbors(self, data: dict, k: int = 10, exact=None) -> list:
+        """The ``k`` catalog movies most like a PredictRequest-shaped dict."""
+        return self.hits(*self.nearest(self.vector(data), k, exact=exact))
+
+    def describe(self) -> dict:
+        sizes = np.diff(np.flatnonzero(np.diff(self.bucket_keys, prepend=-1, append=-1)))
+        return {
+            "movies": len(self.movies),
+            "features": self.encoder.n_features,
+            "nonzeros": int(self.matrix.nnz),
+            "model_version": self.model_version,
+            "lsh_tables": LSH_TABLES,
+            "lsh_bits": LSH_BITS,
+            "exact_scan": len(self.movies) <= EXACT_MAX_MOVIES,
+            "largest_bucket": int(sizes.max()) if len(sizes) else 0,
+            "index_bytes": int(self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+                               + self.bucket_keys.nbytes + self.bucket_movies.nbytes),
+        }
+
+def read_neighbors(db):
+    """Movies and (movie id, value id, value name) rows of every facet, from the database."""
+    movies = db.query(MOVIES_SQL)
+    pairs = {facet: [(row["movie_id"], row["id"], row["name"]) for row in db.query(FACET_SQL[facet])]
+             for _, facet, _ in LABELS}
+    return movies, pairs
+
+def load_neighbors(db, model) -> NeighborIndex:
+    """Index of the catalog in the feature space of ``model`` (an ``api.registry.ModelVersion``)."""
+    return NeighborIndex(*read_neighbors(db), model.feature_columns, model.version)
+
+def neighbors_from_catalog(catalog, model) -> NeighborIndex:
+    """The same index from a published ``api.catalog.Catalog``."""
+    movies = catalog.rows(MOVIE_FIELDS + ("budget", "contentRating"))
+    pairs = {facet: catalog.pairs(FACET_TABLES[facet]) for _, facet, _ in LABELS}
+    return NeighborIndex(movies, pairs, model.feature_columns, model.version)
@@ -0,0 +1,82 @@
+"""Fail when an API query falls back to a full table scan.
+
+Runs EXPLAIN for every query shape the endpoints issue, against the
+database configured for the API (``IMDB_DB_DRIVER``), and exits non-zero if
+any of them scans a whole table. Master-table listings return every row by
+design and are allowed to, as are the reads that build the stats snapshot,
+the search index, the facet index and a published catalog.
+
+    python -m api.plancheck
+"""
+import sys
+
+from api.api import EXPORT_SQL, MASTER_LIST_SQL, MOVIE_DETAIL_SQL, MOVIE_SOURCES, RATINGS_SQL, SORT_ORDERS, db, movie_page_query
+from api.catalog import ENTITY_SQL, MOVIES_SQL as CATALOG_MOVIES_SQL
+from api.facets import FACET_SQL, MOVIES_SQL as FACET_MOVIES_SQL
+from api.search import SEARCH_SQL
+from api.stats import DIMENSION_SQL, MOVIES_SQL
+
+SAMPLE_IDS = {"genres": 1, "languages": "en", "countries": "US", "companies": "co0000001", "locations": 1}
+
+def plan_checks():
+    """(name, sql, params, full_scan_allowed) for every query shape served by the API."""
+    checks = []
+    for order in SORT_ORDERS:
+        key = ["tt0000001"] if order == "id" else [1000, "tt0000001"]
+        checks.append((f"/movies order={order}", *movie_page_query("movies m", None, [], 10, 0, None, order), False))
+        checks.append((f"/movies order={order} cursor", *movie_page_query("movies m", None, [], 10, 0, key, order), False))
+        for entity, (source, where) in MOVIE_SOURCES.items():
+            params = [SAMPLE_IDS[entity]]
+            checks.append((f"/{entity}/{{id}}/movies order={order}",
+                           *movie_page_query(source, where, params, 10, 0, None, order), False))
+            checks.append((f"/{entity}/{{id}}/movies order={order} cursor",
+                           *movie_page_query(source, where, params, 10, 0, key, order), False))
+    checks.append(("/movies/{id}", MOVIE_DETAIL_SQL.format(where="m.id = %s"), ["tt0000001"], False))
+    checks.append(("/movies?ids=", MOVIE_DETAIL_SQL.format(where="m.id IN (%s, %s)"), ["tt0000001", "tt0000002"], False))
+    for table, sql in MASTER_LIST_SQL.items():
+        checks.append((f"/{table}", sql, [], True))
+    # The stats snapshot reads whole tables once per rebuild, not per request
+    checks.append(("stats snapshot: movies", MOVIES_SQL, [], True))
+    for dimension, sql in DIMENSION_SQL.items():
+        checks.append((f"stats snapshot: {dimension}", sql, [], True))
+    checks.append(("search index: movies", SEARCH_SQL, [], True))
+    checks.append(("facet index: movies", FACET_MOVIES_SQL, [], True))
+    for facet, sql in FACET_SQL.items():
+        checks.append((f"facet index: {facet}", sql, [], True))
+    checks.append(("catalog publish: movies", CATALOG_MOVIES_SQL, [], True))
+    for entity, (master, junction) in ENTITY_SQL.items():
+        checks.append((f"catalog publish: {entity}", master, [], True))
+        checks.append((f"catalog publish: movie_{entity}", junction, [], True))
+    checks.append(("/export", EXPORT_SQL, [], True))
+    checks.append(("/ratings", RATINGS_SQL, [], False))
+    return checks
+
+def full_scans(conn, sql, params, driver):
+    """Tables read by a full scan in the plan of ``sql``."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if driver == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            details = [row["detail"] for row in cursor.fetchall()]
+            return [d for d in details if d.startswith("SCAN ") and " USING " not in d]
+        cursor.execute("EXPLAIN " + sql, params)
+        return [row["table"] for row in cursor.fetchall() if row["type"] == "ALL"]
+    finally:
+        cursor.close()
+
+def main():
+    failures = 0
+    with db.connection() as conn:
+        for name, sql, params, allowed in plan_checks():
+            scans = full_scans(conn, sql, params, db.driver)
+            if scans and not allowed:
+                failures += 1
+                status = "FULL SCAN"
+            else:
+                status = "ok" if not scans else "ok (listing)"
+            print(f"{status:<13} {name}" + (f"  [{', '.join(scans)}]" if scans else ""))
+    print(f"{failures} query shape(s) with full table scans")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Versioned model artifacts with memory-mapped loading and atomic hot swap.
+
+A model version is the joblib file plus its flat-array export
+(``<name>_forest/`` next to it, see ``api/forest.py``), identified by a hash
+of the joblib file. The export is memory-mapped, so every worker process
+serving the same version shares one copy of the node arrays through the page
+cache; it is (re)written whenever it is missing or was exported from another
+version. The sklearn estimator is only unpickled when the engine needs it.
+A training manifest (``<name>.json``, written by ``scripts/train_model.py``)
+next to the file is checked against the model and reported with it.
+
+``ModelRegistry.current`` always points at a fully loaded, warmed-up
+version. ``reload`` builds the next version off to the side, runs a warm-up
+batch through it and only then replaces ``current`` in a single assignment,
+so requests in flight finish on the version they started with.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from api.features import FeatureEncoder
+from api.forest import CompiledForest
+from api.metrics import metrics
+
+ENGINES = ("auto", "compiled", "sklearn")
+
+def file_signature(path: str) -> str:
+    """Size and mtime of ``path``; changes whenever the file is rewritten."""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+def content_version(path: str) -> str:
+    """Short SHA-256 of the file contents, used as the model version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def forest_dir(path: str) -> str:
+    return os.path.splitext(path)[0] + "_forest"
+
+def read_manifest(path: str, version: str):
+    """Training manifest of ``path``, or None when there is none or it belongs to another file."""
+    try:
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not str(manifest.get("model_sha256", "")).startswith(version):
+        return None  # left over from a model that has since been replaced by hand
+    return manifest
+
+class ModelVersion:
+    """One loaded model: encoder, flat-array forest and, optionally, the sklearn estimator."""
+
+    def __init__(self, path, version, signature, forest, feature_columns, model=None,
+                 engine="auto", compiled_max_rows=256, manifest=None):
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.forest = forest
+        self.model = model
+        self.feature_columns = list(feature_columns)
+        self.encoder = FeatureEncoder(self.feature_columns)
+        self.engine = engine
+        self.compiled_max_rows = compiled_max_rows
+        self.manifest = manifest
+        self.loaded_at = time.time()
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities from the forest or sklearn, per the engine and batch size."""
+        use_sklearn = self.model is not None and (
+            self.engine == "sklearn" or (self.engine == "auto" and X.shape[0] > self.compiled_max_rows)
+        )
+        start = time.perf_counter()
+        proba = self.model.predict_proba(X) if use_sklearn else self.forest.predict_proba(X)
+        metrics.observe_inference("sklearn" if use_sklearn else "compiled", X.shape[0], time.perf_counter() - start)
+        return proba
+
+    def predict_variants(self, X) -> np.ndarray:
+        """Class probabilities of rows that differ from ``X[0]`` in only a few columns."""
+        start = time.perf_counter()
+        proba = self.forest.predict_variants(X)
+        metrics.observe_inference("variants", X.shape[0], time.perf_counter() - start)
+        return proba
+
+    def explain(self, X):
+        """Probabilities, base value and per-feature contributions from the forest (see CompiledForest.explain)."""
+        start = time.perf_counter()
+        result = self.forest.explain(X)
+        metrics.observe_inference("explain", X.shape[0], time.perf_counter() - start)
+        return result
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "n_features": len(self.feature_columns),
+            "n_trees": len(self.forest.roots),
+            "n_nodes": self.forest.n_nodes,
+            "engine": self.engine,
+            "loaded_at": self.loaded_at,
+            "training": None if self.manifest is None else {
+                key: self.manifest.get(key) for key in ("version", "created_at", "rows", "metrics")
+            },
+        }
+
+def load_version(path, engine="auto", compiled_max_rows=256) -> ModelVersion:
+    """Load ``path`` and its flat-array export, exporting it first when it is missing or stale."""
+    if engine not in ENGINES:
+        raise ValueError(f"unknown model engine: {engine}")
+    signature = file_signature(path)
+    version = content_version(path)
+    directory = forest_dir(path)
+    forest = None
+    try:
+        if CompiledForest.read_meta(directory).get("source_version") == version:
+            forest = CompiledForest.load(directory, mmap=True)
+    except (OSError, ValueError):
+        forest = None
+    model = None
+    if forest is None or engine != "compiled":
+        model = joblib.load(path, mmap_mode="r")
+    if forest is None:
+        forest = CompiledForest.from_sklearn(model)
+        try:
+            forest.save(directory, source_version=version)
+            forest = CompiledForest.load(directory, mmap=True)
+        except OSError:
+            pass  # read-only deployment: serve the in-memory export
+    if forest.feature_names_in_ is None:
+        raise ValueError(f"{path}: model was fitted without feature names")
+    manifest = read_manifest(path, version)
+    if manifest is not None and manifest.get("features") != list(forest.feature_names_in_):
+        raise ValueError(f"{path}: feature columns differ from its manifest")
+    if engine == "compiled":
+        model = None
+    return ModelVersion(path, version, signature, forest, forest.feature_names_in_, model,
+                        engine=engine, compiled_max_rows=compiled_max_rows, manifest=manifest)
+
+def warm_up(candidate: ModelVersion, rows=None):
+    """Score a synthetic batch on every code path and check the outputs are probabilities."""
+    n_features = len(candidate.feature_columns)
+    numeric = [column for _, column in candidate.encoder.numeric]  # wherever the training script put them
+    rng = np.random.default_rng(0)
+    sizes = [1, candidate.compiled_max_rows + 1] if rows is None else [rows]
+    for size in sizes:
+        X = (rng.random((size, n_features)) < 0.05).astype(np.float64)
+        X[:, numeric] = rng.uniform(1, 1e8, size=(size, len(numeric)))
+        proba = candidate.predict_proba(X)
+        if proba.shape != (size, len(candidate.forest.classes_)) or not np.isfinite(proba).all() \
+                or proba.min() < 0 or proba.max() > 1:
+            raise ValueError(f"model {candidate.version} failed warm-up on a batch of {size}")
+
+class ModelRegistry:
+    """Holds the active ModelVersion and replaces it when the model file changes."""
+
+    def __init__(self, path, engine="auto", compiled_max_rows=256):
+        self.path = path
+        self.engine = engine
+        self.compiled_max_rows = compiled_max_rows
+        self.current = None
+        self._lock = threading.Lock()  # one load at a time
+        self._listeners = []
+        self.stats = {"loads": 0, "swaps": 0, "failed_loads": 0, "last_error": None, "last_check": None}
+
+    def on_swap(self, callback):
+        """Register ``callback(new_version)``, called after each swap."""
+        self._listeners.append(callback)
+
+    def reload(self, path=None, force=False) -> bool:
+        """Load, warm up and activate the model at ``path`` (default: the registry path).
+
+        Returns False when the file is unchanged and ``force`` is not set. On
+        any failure the active version keeps serving and the error is raised.
+        """
+        with self._lock:
+            path = path or self.path
+            if not force and self.current is not None and self.current.path == path \
+                    and file_signature(path) == self.current.signature:
+                return False
+            self.stats["loads"] += 1
+            try:
+                candidate = load_version(path, self.engine, self.compiled_max_rows)
+                warm_up(candidate)
+            except Exception as exc:
+                self.stats["failed_loads"] += 1
+                self.stats["last_error"] = f"{type(exc).__name__}: {exc}"
+                raise
+            previous, self.current, self.path = self.current, candidate, path
+            if previous is not None:
+                self.stats["swaps"] += 1
+            for callback in self._listeners:
+                callback(candidate)
+            return True
+
+    async def watch(self, interval: float):
+        """Poll the model file every ``interval`` seconds and hot-swap when it changes."""
+        rejected = None  # signature of a file that failed to load, not retried until it changes again
+        while True:
+            await asyncio.sleep(interval)
+            self.stats["last_check"] = time.time()
+            try:
+                signature = file_signature(self.path)
+            except OSError as exc:
+                # Missing or being replaced: look again at the next poll
+                self.stats["last_error"] = f"{type(exc).__name__}: {exc}"
+                continue
+            if signature in (self.current.signature, rejected):
+                continue
+            try:
+                await run_in_threadpool(self.reload)
+            except Exception as exc:
+                # The active version keeps serving
+                rejected = signature
+                self.stats["last_error"] = f"{type(exc).__name__}: {exc}"
+
+    def metrics(self) -> dict:
+        return dict(self.stats, active=self.current.describe() if self.current else None)
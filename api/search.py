@@ -0,0 +1,210 @@
+"""In-memory inverted index behind GET /search.
+
+Titles (``primaryTitle`` and ``originalTitle``) and descriptions are split
+into accent- and case-folded tokens, so "Coração" matches "coracao" and
+"CORAÇÃO". Every (term, movie) pair gets a BM25F weight at build time, with
+title matches counting ``TITLE_WEIGHT`` times a description match. The
+vocabulary is kept sorted and the postings are CSR arrays in vocabulary
+order (``offsets`` into ``docs``/``weights``), so all the terms starting
+with a prefix are one contiguous slice: typeahead costs the same as an
+exact lookup. A query reads each token's postings as (movie, score) arrays,
+intersects them across tokens and multiplies by a ``numVotes`` boost, so
+its cost follows the postings it touches rather than the catalog size.
+The listed fields of every movie are kept as columns (strings interned in
+one UTF-8 blob, numbers in float arrays) and turned into dicts only for the
+page returned. ``load_search`` (or ``search_from_catalog``) is the builder
+for ``api.snapshots.SnapshotStore``.
+"""
+import bisect
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from api.catalog import INTEGER_COLUMNS, StringTable, decode_strings
+
+SEARCH_FIELDS = ("id", "primaryTitle", "originalTitle", "releaseDate", "runtimeMinutes", "averageRating", "numVotes",
+                 "description")
+SEARCH_SQL = (
+    "SELECT m.id, m.primaryTitle, m.originalTitle, DATE_FORMAT(m.releaseDate, '%Y-%m-%d') AS releaseDate, "
+    "m.runtimeMinutes, m.averageRating, m.numVotes, m.description FROM movies m ORDER BY m.id"
+)
+
+TITLE_WEIGHT = 3.0
+K1, B = 1.2, 0.75
+# Fields returned with each hit; the others are numbers
+TEXT_FIELDS = ("id", "primaryTitle", "originalTitle", "releaseDate")
+NUMBER_FIELDS = ("runtimeMinutes", "averageRating", "numVotes")
+# Terms that only extend the last token of the query rank below an exact match
+PREFIX_DISCOUNT = 0.8
+# Shorter last tokens are matched exactly: a one-letter prefix would touch most of the index
+MIN_PREFIX = 2
+
+TOKEN_RE = re.compile(r"\w+")
+
+def fold(text: str) -> str:
+    """Case- and accent-folded text: casefold, decompose and drop the combining marks."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def tokenize(text) -> list:
+    return TOKEN_RE.findall(fold(text)) if text else []
+
+def bm25(counts: Counter, length: int, average: float) -> dict:
+    """BM25 term-frequency part of each term of one field (idf is applied per term afterwards)."""
+    norm = K1 * (1 - B + B * length / average) if average else K1
+    return {term: tf * (K1 + 1) / (tf + norm) for term, tf in counts.items()}
+
+def intersect(a: np.ndarray, b: np.ndarray):
+    """Positions in ``a`` and in ``b`` of their common values; both ascending and unique."""
+    if len(a) > len(b):
+        theirs, mine = intersect(b, a)
+        return mine, theirs
+    if not len(a):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # Look the shorter one up in the longer one
+    at = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    mine = np.flatnonzero(b[at] == a)
+    return mine, at[mine]
+
+class SearchIndex:
+    """Sorted vocabulary plus CSR postings of precomputed BM25F weights."""
+
+    def __init__(self, rows):
+        n = len(rows)
+        strings = StringTable()
+        # (movie, field) blocks, so a page is read with one gather per block
+        self.text_codes = strings.column(row[field] for row in rows for field in TEXT_FIELDS).reshape(n, -1)
+        blob, self.string_offsets = strings.arrays()
+        self.strings = blob.tobytes()  # bytes slice and decode faster than a memoryview
+        self.numbers = np.array([[np.nan if row[field] is None else float(row[field]) for field in NUMBER_FIELDS]
+                                 for row in rows], dtype=np.float64).reshape(n, -1)
+        titles, descriptions = [], []
+        for row in rows:
+            title = tokenize(row["primaryTitle"])
+            original = tokenize(row["originalTitle"])
+            if original != title:
+                title += original
+            titles.append(Counter(title))
+            descriptions.append(Counter(tokenize(row["description"])))
+        self.title_lengths = np.array([sum(c.values()) for c in titles], dtype=np.int32)
+        self.description_lengths = np.array([sum(c.values()) for c in descriptions], dtype=np.int32)
+        average = [float(lengths.mean()) if n else 0.0 for lengths in (self.title_lengths, self.description_lengths)]
+
+        term_ids, pair_terms, pair_docs, pair_weights = {}, [], [], []
+        for doc, (title, description) in enumerate(zip(titles, descriptions)):
+            weights = {t: TITLE_WEIGHT * w for t, w in bm25(title, int(self.title_lengths[doc]), average[0]).items()}
+            for term, w in bm25(description, int(self.description_lengths[doc]), average[1]).items():
+                weights[term] = weights.get(term, 0.0) + w
+            for term, w in weights.items():
+                pair_terms.append(term_ids.setdefault(term, len(term_ids)))
+                pair_docs.append(doc)
+                pair_weights.append(w)
+
+        # Vocabulary in sorted order; postings grouped by term rank, then by movie
+        self.terms = sorted(term_ids)
+        rank = np.empty(len(term_ids), dtype=np.int64)
+        rank[[term_ids[t] for t in self.terms]] = np.arange(len(self.terms))
+        pair_rank = rank[np.array(pair_terms, dtype=np.int64)]
+        pair_docs = np.array(pair_docs, dtype=np.int32)
+        order = np.lexsort((pair_docs, pair_rank))
+        df = np.bincount(pair_rank, minlength=len(self.terms))
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        self.offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self.docs = pair_docs[order]
+        self.weights = (np.array(pair_weights, dtype=np.float64)[order] * idf[pair_rank[order]]).astype(np.float32)
+
+        votes = np.nan_to_num(self.numbers[:, NUMBER_FIELDS.index("numVotes")])
+        top = math.log1p(votes.max()) if n and votes.max() > 0 else 1.0
+        # Up to 2x for the most voted movie, so popularity breaks near-ties without burying better matches
+        self.boost = (1 + np.log1p(votes) / top).astype(np.float32)
+        self.n = n
+        self.generation = 0
+
+    def movies(self, indices: np.ndarray) -> list:
+        """Dicts of the listed fields of movies ``indices``."""
+        texts = decode_strings(self.strings, self.string_offsets, self.text_codes[indices].ravel())
+        columns = [texts[k::len(TEXT_FIELDS)] for k in range(len(TEXT_FIELDS))]
+        for field, values in zip(NUMBER_FIELDS, self.numbers[indices].T.tolist()):
+            cast = int if field in INTEGER_COLUMNS else float
+            columns.append([None if x != x else cast(x) for x in values])
+        return [dict(zip(TEXT_FIELDS + NUMBER_FIELDS, row)) for row in zip(*columns)]
+
+    def term_range(self, token: str, prefix: bool):
+        """[lo, hi) range of ``self.terms`` equal to ``token`` or, with ``prefix``, starting with it."""
+        lo = bisect.bisect_left(self.terms, token)
+        if prefix:
+            return lo, bisect.bisect_left(self.terms, token + "\U0010ffff", lo)
+        return lo, lo + (lo < len(self.terms) and self.terms[lo] == token)
+
+    def token_postings(self, token: str, prefix: bool):
+        """(movies, scores) of ``token``, movies ascending; with ``prefix`` also its expansions, discounted."""
+        lo, hi = self.term_range(token, prefix)
+        a, b = self.offsets[lo], self.offsets[hi]
+        exact = lo < hi and self.terms[lo] == token
+        if hi - lo == exact:
+            return self.docs[a:b], self.weights[a:b]
+        scores = self.weights[a:b] * PREFIX_DISCOUNT
+        if exact:
+            end = self.offsets[lo + 1]
+            scores[:end - a] = self.weights[a:end]
+        if hi - lo == 1:
+            return self.docs[a:b], scores
+        # A movie can hold several expansions of the prefix; it keeps the best one. Positive
+        # float32 bits order like the values, so sorting (movie, score bits) packed in one
+        # int64 puts each movie's best posting last; the terms' runs merge in a stable sort
+        key = np.sort((self.docs[a:b].astype(np.int64) << 32) | scores.view(np.uint32), kind="stable")
+        movie = (key >> 32).astype(np.int32)
+        last = np.append(movie[1:] != movie[:-1], True)
+        return movie[last], (key[last] & 0xFFFFFFFF).astype(np.uint32).view(np.float32)
+
+    def search(self, query: str, limit: int = 10, offset: int = 0, prefix: bool = True):
+        """(total matches, page of movie dicts with a ``score``) for movies matching every token of ``query``.
+
+        With ``prefix``, the last token also matches the terms it starts, for typeahead.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.n:
+            return 0, []
+        candidates = total = None
+        for i, token in enumerate(tokens):
+            docs, scores = self.token_postings(token, prefix and i == len(tokens) - 1 and len(token) >= MIN_PREFIX)
+            if candidates is None:
+                candidates, total = docs, scores
+            else:
+                mine, theirs = intersect(candidates, docs)
+                candidates, total = candidates[mine], total[mine] + scores[theirs]
+            if not len(candidates):
+                break
+        count = len(candidates)
+        if offset >= count:
+            return count, []
+        scores = total * self.boost[candidates]
+        wanted = offset + limit
+        if len(candidates) > wanted:
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            candidates, scores = candidates[top], scores[top]
+        # Best score first; ties in id order
+        order = np.lexsort((candidates, -scores))[offset:wanted]
+        return count, [dict(movie, score=round(score, 4))
+                       for movie, score in zip(self.movies(candidates[order]), scores[order].tolist())]
+
+    def describe(self) -> dict:
+        return {
+            "movies": self.n,
+            "terms": len(self.terms),
+            "postings": len(self.docs),
+            "postings_bytes": int(self.offsets.nbytes + self.docs.nbytes + self.weights.nbytes),
+            "movie_bytes": int(len(self.strings) + self.string_offsets.nbytes + self.text_codes.nbytes
+                               + self.numbers.nbytes + self.title_lengths.nbytes + self.description_lengths.nbytes
+                               + self.boost.nbytes),
+        }
+
+def load_search(db) -> SearchIndex:
+    return SearchIndex(db.query(SEARCH_SQL))
+
+def search_from_catalog(catalog) -> SearchIndex:
+    """The same index from a published ``api.catalog.Catalog``."""
+    return SearchIndex(catalog.rows(SEARCH_FIELDS))
@@ -0,0 +1,102 @@
+"""Catalog-derived in-memory snapshots, rebuilt off to the side and swapped in whole.
+
+The catalog only changes when the loader runs, so read paths that would
+aggregate or scan it per request (stats, search) are answered from a
+snapshot built by one read of the tables. ``SnapshotStore`` builds it on
+first use and rebuilds it in the background when the loader reports a new
+catalog (POST /cache/invalidate) and every ``refresh_seconds``, so every
+worker process catches up on its own. Requests keep using the snapshot
+they started with; ``generation`` tells successive snapshots apart.
+"""
+import asyncio
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+class SnapshotStore:
+    """Current snapshot produced by ``build(db)`` (blocking), built on first use and rebuilt in the background."""
+
+    def __init__(self, db, build, refresh_seconds=600.0):
+        self.db = db
+        self._build = build
+        self.refresh_seconds = refresh_seconds
+        self.current = None
+        self.generation = 0
+        self._build_lock = threading.Lock()
+        self._first = None  # asyncio.Lock guarding the first build
+        self._pending = None
+        self._again = False
+        self._watcher = None
+        self.stats = {"builds": 0, "failed_builds": 0, "last_error": None, "built_at": None, "build_seconds": None}
+
+    def build(self):
+        """Read the catalog and swap in a new snapshot (blocking)."""
+        with self._build_lock:
+            start = time.perf_counter()
+            try:
+                snapshot = self._build(self.db)
+            except Exception as exc:
+                self.stats["failed_builds"] += 1
+                self.stats["last_error"] = f"{type(exc).__name__}: {exc}"
+                raise
+            self.generation += 1
+            snapshot.generation = self.generation
+            self.stats["builds"] += 1
+            self.stats["built_at"] = time.time()
+            self.stats["build_seconds"] = round(time.perf_counter() - start, 4)
+            self.current = snapshot
+            return snapshot
+
+    async def snapshot(self):
+        if self.current is None:
+            if self._first is None:
+                self._first = asyncio.Lock()
+            async with self._first:
+                if self.current is None:
+                    await run_in_threadpool(self.build)
+        return self.current
+
+    def refresh_later(self) -> bool:
+        """Rebuild in the background while the current snapshot keeps serving.
+
+        A rebuild already running may have read the catalog before the
+        change, so another one is queued after it.
+        """
+        if self._pending is not None and not self._pending.done():
+            self._again = True
+        else:
+            self._pending = asyncio.get_running_loop().create_task(self._refresh())
+        return True
+
+    async def _refresh(self):
+        while True:
+            self._again = False
+            try:
+                await run_in_threadpool(self.build)
+            except Exception:
+                pass  # recorded in stats; the previous snapshot keeps serving
+            if not self._again:
+                return
+
+    async def watch(self):
+        """Rebuild every ``refresh_seconds``."""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self._refresh()
+
+    def start(self, build_now=False):
+        """Start the periodic rebuilds (if ``refresh_seconds`` > 0) and, with ``build_now``, a first build."""
+        if build_now:
+            self.refresh_later()
+        if self.refresh_seconds > 0:
+            self._watcher = asyncio.get_running_loop().create_task(self.watch())
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def metrics(self) -> dict:
+        return dict(self.stats, generation=self.generation, refresh_seconds=self.refresh_seconds,
+                    **(self.current.describe() if self.current is not None else {}))
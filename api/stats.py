@@ -0,0 +1,193 @@
+"""In-memory aggregate snapshot behind the /stats endpoints.
+
+``StatsSnapshot`` is built from one read of ``movies`` and of each junction
+table. Each dimension (the whole catalog, genres, countries, companies,
+languages, content ratings) becomes a ``Rollup``: its (movie, value) pairs
+sorted by value, year and budget, with prefix sums of the per-movie
+metrics. Counts, averages and totals over any year range are then two
+binary searches and a subtraction per value, and a per-year breakdown is a
+subtraction per year; medians read the budgets of the selected range,
+which the sort order keeps next to each other. ``load_stats`` (or
+``stats_from_catalog``) is the builder for ``api.snapshots.SnapshotStore``.
+"""
+import numpy as np
+
+MOVIES_SQL = "SELECT id, startYear, averageRating, budget, grossWorldwide, contentRating FROM movies"
+
+# dimension -> (movie id, value name) pairs; "ratings" comes from movies.contentRating
+DIMENSION_SQL = {
+    "genres": "SELECT mg.movie_id, g.name FROM movie_genres mg JOIN genres g ON g.id = mg.genre_id",
+    "countries": "SELECT mc.movie_id, c.name FROM movie_countries mc JOIN countries c ON c.id = mc.country_id",
+    "companies": "SELECT mco.movie_id, co.name FROM movie_companies mco JOIN companies co ON co.id = mco.company_id",
+    "languages": "SELECT ml.movie_id, l.name FROM movie_languages ml JOIN languages l ON l.id = ml.language_id",
+}
+DIMENSIONS = tuple(DIMENSION_SQL) + ("ratings",)
+SORT_KEYS = ("movie_count", "avg_rating", "median_budget", "total_gross")
+
+def as_float(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+def prefix(values) -> np.ndarray:
+    return np.concatenate(([0.0], np.cumsum(values)))
+
+class Rollup:
+    """Metrics of the (movie, value) pairs of one dimension, sorted by value, year and budget."""
+
+    def __init__(self, values, value_idx, movie_idx, year_idx, n_years, rating, budget, gross):
+        year = year_idx[movie_idx]
+        order = np.lexsort((budget[movie_idx], year, value_idx))  # NaN budgets sort last within a year
+        self.values = list(values)
+        self.index = {value: i for i, value in enumerate(self.values)}
+        self.n_years = n_years
+        self.key = value_idx[order] * n_years + year[order]
+        self.budget = budget[movie_idx][order]
+        # The same pairs by value and budget alone, for medians over all years
+        self.budget_by_value = budget[movie_idx][np.lexsort((budget[movie_idx], value_idx))]
+        rating, gross = rating[movie_idx][order], gross[movie_idx][order]
+        self.rated = prefix(~np.isnan(rating))
+        self.rating_sum = prefix(np.nan_to_num(rating))
+        self.budgeted = prefix(~np.isnan(self.budget))
+        self.grossed = prefix(~np.isnan(gross))
+        self.gross_sum = prefix(np.nan_to_num(gross))
+
+    def bounds(self, values, lo_year, hi_year):
+        """Pair ranges [lo, hi) of ``values`` (indexes) restricted to year indexes [lo_year, hi_year)."""
+        base = np.asarray(values) * self.n_years
+        return np.searchsorted(self.key, base + lo_year), np.searchsorted(self.key, base + hi_year)
+
+    def metrics(self, lo, hi, medians=True) -> dict:
+        rated = self.rated[hi] - self.rated[lo]
+        grossed = self.grossed[hi] - self.grossed[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_rating = (self.rating_sum[hi] - self.rating_sum[lo]) / rated
+        # Rounded: differences of prefix sums carry float noise in the last digits
+        out = {
+            "movie_count": hi - lo,
+            "avg_rating": np.where(rated > 0, avg_rating, np.nan).round(4),
+            "total_gross": np.where(grossed > 0, self.gross_sum[hi] - self.gross_sum[lo], np.nan).round(2),
+        }
+        if medians:
+            out["median_budget"] = self.median_budgets(lo, hi)
+        return out
+
+    def median_budgets(self, lo, hi) -> np.ndarray:
+        lo, hi = np.asarray(lo), np.asarray(hi)
+        n = (self.budgeted[hi] - self.budgeted[lo]).astype(np.int64)
+        medians = np.full(len(lo), np.nan)
+        some = np.flatnonzero(n > 0)
+        if not len(some):
+            return medians
+        a, b, k = lo[some], hi[some], n[some]
+        value = self.key // self.n_years
+        # Ranges covering one year or one whole value are sorted by budget (NaNs
+        # last) in one of the two orders, so their median is read directly
+        one_year = self.key[a] == self.key[b - 1]
+        whole = ((a == 0) | (value[np.maximum(a - 1, 0)] != value[a])) & \
+                ((b == len(self.key)) | (value[np.minimum(b, len(self.key) - 1)] != value[b - 1]))
+        for mask, budgets in ((one_year, self.budget), (whole & ~one_year, self.budget_by_value)):
+            i = np.flatnonzero(mask)
+            medians[some[i]] = (budgets[a[i] + (k[i] - 1) // 2] + budgets[a[i] + k[i] // 2]) / 2
+        for i in np.flatnonzero(~one_year & ~whole):
+            medians[some[i]] = np.nanmedian(self.budget[a[i]:b[i]])
+        return medians
+
+class StatsSnapshot:
+    """Rollups of the whole catalog and of every dimension."""
+
+    def __init__(self, movies, pairs):
+        ids = [row["id"] for row in movies]
+        position = {movie_id: i for i, movie_id in enumerate(ids)}
+        years = [row["startYear"] for row in movies]
+        self.years = np.array(sorted({int(y) for y in years if y is not None}), dtype=np.int64)
+        # Year index 0 holds movies without a year; they only count when no range is given
+        year_idx = np.array([0 if y is None else int(np.searchsorted(self.years, int(y))) + 1 for y in years],
+                            dtype=np.int64)
+        n_years = len(self.years) + 1
+        rating = as_float(row["averageRating"] for row in movies)
+        budget = as_float(row["budget"] for row in movies)
+        gross = as_float(row["grossWorldwide"] for row in movies)
+        pairs = dict(pairs, ratings=[(row["id"], row["contentRating"]) for row in movies])
+
+        everything = np.arange(len(ids), dtype=np.int64)
+        self.rollups = {None: Rollup([None], np.zeros(len(ids), dtype=np.int64), everything, year_idx, n_years,
+                                     rating, budget, gross)}
+        for dimension, rows in pairs.items():
+            # Distinct (movie, name) pairs: companies, for one, share names across ids
+            unique = {(position[m], name) for m, name in rows if name is not None and m in position}
+            values = sorted({name for _, name in unique})
+            index = {value: i for i, value in enumerate(values)}
+            movie_idx = np.array([m for m, _ in unique], dtype=np.int64)
+            value_idx = np.array([index[name] for _, name in unique], dtype=np.int64)
+            self.rollups[dimension] = Rollup(values, value_idx, movie_idx, year_idx, n_years, rating, budget, gross)
+
+        self.movie_count = len(ids)
+        self.generation = 0
+
+    def year_bounds(self, start=None, end=None):
+        """Year index range [lo, hi) for ``start``..``end`` inclusive; the full range when neither is given."""
+        if start is None and end is None:
+            return 0, len(self.years) + 1
+        lo = 1 if start is None else int(np.searchsorted(self.years, start, "left")) + 1
+        hi = len(self.years) + 1 if end is None else int(np.searchsorted(self.years, end, "right")) + 1
+        return lo, max(lo, hi)
+
+    def rollup(self, dimension=None, value=None):
+        """Rollup and value index for ``dimension=value``, or the whole catalog; KeyError if unknown."""
+        if dimension is None:
+            return self.rollups[None], 0
+        rollup = self.rollups[dimension]
+        return rollup, rollup.index[value]
+
+    def breakdown(self, dimension, start=None, end=None, sort="movie_count", limit=None, min_count=1):
+        """One row per value of ``dimension``, sorted by ``sort`` descending."""
+        rollup = self.rollups[dimension]
+        lo, hi = rollup.bounds(np.arange(len(rollup.values)), *self.year_bounds(start, end))
+        metrics = rollup.metrics(lo, hi, medians=sort == "median_budget")
+        keep = np.flatnonzero(metrics["movie_count"] >= max(min_count, 1))
+        # Descending by the sort key, NaN last, then by name
+        names = np.array([rollup.values[i] for i in keep], dtype=str)
+        primary = np.nan_to_num(metrics[sort][keep].astype(float), nan=-np.inf)
+        order = keep[np.lexsort((names, -primary))][:limit]
+        if sort != "median_budget":
+            metrics["median_budget"] = np.full(len(lo), np.nan)
+            metrics["median_budget"][order] = rollup.median_budgets(lo[order], hi[order])
+        return [dict(value=rollup.values[i], **{k: _value(v[i]) for k, v in metrics.items()}) for i in order]
+
+    def yearly(self, start=None, end=None, dimension=None, value=None):
+        """One row per year with movies, for the catalog or for ``dimension=value``."""
+        rollup, index = self.rollup(dimension, value)
+        lo_year, hi_year = self.year_bounds(start, end)
+        lo_year = max(lo_year, 1)  # no row for movies without a year
+        years = np.arange(lo_year, hi_year)
+        lo, hi = rollup.bounds(np.full(len(years), index), years, years + 1)
+        metrics = rollup.metrics(lo, hi)
+        return [
+            dict(year=int(self.years[y - 1]), **{k: _value(v[i]) for k, v in metrics.items()})
+            for i, y in enumerate(years) if metrics["movie_count"][i]
+        ]
+
+    def summary(self, start=None, end=None, dimension=None, value=None) -> dict:
+        rollup, index = self.rollup(dimension, value)
+        lo, hi = rollup.bounds([index], *self.year_bounds(start, end))
+        return {k: _value(v[0]) for k, v in rollup.metrics(lo, hi).items()}
+
+    def describe(self) -> dict:
+        return {"movies": self.movie_count, "values": {d: len(r.values) for d, r in self.rollups.items() if d}}
+
+def _value(x):
+    """JSON-friendly scalar: ints stay ints, NaN becomes None."""
+    if isinstance(x, (np.integer, int)):
+        return int(x)
+    x = float(x)
+    return None if np.isnan(x) else x
+
+def load_stats(db) -> StatsSnapshot:
+    movies = db.query(MOVIES_SQL)
+    pairs = {name: [(row["movie_id"], row["name"]) for row in db.query(sql)] for name, sql in DIMENSION_SQL.items()}
+    return StatsSnapshot(movies, pairs)
+
+def stats_from_catalog(catalog) -> StatsSnapshot:
+    """The same snapshot from a published ``api.catalog.Catalog``."""
+    movies = catalog.rows(("id", "startYear", "averageRating", "budget", "grossWorldwide", "contentRating"))
+    pairs = {name: [(movie_id, value) for movie_id, _, value in catalog.pairs(name)] for name in DIMENSION_SQL}
+    return StatsSnapshot(movies, pairs)
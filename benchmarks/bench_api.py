@@ -0,0 +1,288 @@
+"""End-to-end load profiles against the API served in-process.
+
+Seeds a SQLite copy of the database from ``dump/`` (see
+``benchmarks/seed_sqlite.py``) unless it already exists. The app is then
+started inside this process, with its startup/shutdown events, over an ASGI
+transport with no sockets. Each scenario runs a warm-up, then a timed
+phase at ``--concurrency`` for throughput and p50/p95/p99, then a short
+serial phase under tracemalloc for the memory allocated per request.
+Inputs come from a seeded RNG, so runs are reproducible and need no network.
+Before measuring, a few malformed requests are checked to be refused with a 4xx.
+
+    python -m benchmarks.bench_api                          # run and print the report
+    python -m benchmarks.bench_api --save-baseline main     # also store benchmarks/baselines/main.json
+    python -m benchmarks.bench_api --compare main           # compare with it, exit 1 on a regression
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+PROFILES = {
+    "quick": {"requests": 300, "concurrency": 8, "warmup": 30, "alloc_requests": 30},
+    "full": {"requests": 3000, "concurrency": 32, "warmup": 200, "alloc_requests": 100},
+}
+
+# ----- Scenarios -----
+# Each scenario builds its request list up front: (method, url, json body).
+def scenarios(data, rng):
+    from benchmarks.bench_predict import random_payload
+
+    def payload():
+        # Fractional runtimes keep the prediction cache out of the uncached scenarios
+        return dict(random_payload(rng), runtimeMinutes=round(rng.uniform(60, 180), 3))
+
+    hot = [payload() for _ in range(16)]
+    years = [year for year in data["years"] if year]
+    return {
+        "predict": lambda: ("POST", "/predict", payload()),
+        "predict_cached": lambda: ("POST", "/predict", rng.choice(hot)),
+        "predict_batch_100": lambda: ("POST", "/predict/batch", [payload() for _ in range(100)]),
+        "movie_detail": lambda: ("GET", f"/movies/{rng.choice(data['movies'])}", None),
+        "movies_ids_20": lambda: ("GET", "/movies?ids=" + ",".join(rng.sample(data["movies"], 20)), None),
+        "movies_page": lambda: ("GET", f"/movies?limit=20&offset={rng.randrange(0, min(len(data['movies']), 100000) - 20)}", None),
+        "movies_by_votes": lambda: ("GET", "/movies?limit=20&order=votes", None),
+        "genre_movies": lambda: ("GET", f"/genres/{rng.choice(data['genres'])}/movies?limit=20", None),
+        "genres": lambda: ("GET", "/genres", None),
+        "stats_top_genres": lambda: ("GET", "/stats/genres/top?limit=10", None),
+        "stats_yearly": lambda: ("GET", "/stats/yearly/count?start={}&end={}".format(
+            *sorted(rng.sample(years, 2))), None),
+        "stats_by_company": lambda: ("GET", "/stats/by/companies?start={}&end={}&sort=median_budget".format(
+            *sorted(rng.sample(years, 2))), None),
+        "stats_yearly_genre": lambda: ("GET", "/stats/yearly?genre={}&start={}".format(
+            rng.choice(data["genre_names"]), rng.choice(years)), None),
+        "movies_filter": lambda: ("GET", "/movies/filter?" + urlencode({"where": facet_filter(data, years, rng)}), None),
+        # Typeahead: the first word of a title plus the start of the next one
+        "search": lambda: ("GET", "/search?" + urlencode({"q": typeahead(rng.choice(data["titles"]), rng)}), None),
+        "similar": lambda: ("GET", f"/movies/{rng.choice(data['movies'])}/similar?limit=10", None),
+        "predict_neighbors": lambda: ("POST", "/predict/neighbors?limit=10", payload()),
+    }
+
+def facet_filter(data, years, rng):
+    """Two genres, an open year range and a minimum rating."""
+    first, second = rng.sample(data["genre_names"], 2)
+    return f'genre:"{first}" genre:"{second}" year:{rng.choice(years)}.. rating>={rng.randint(5, 7)}'
+
+def typeahead(title, rng):
+    words = title.split()
+    if len(words) < 2:
+        return title[:max(2, rng.randrange(len(title) + 1))]
+    return f"{words[0]} {words[1][:rng.randrange(2, len(words[1]) + 2)]}"
+
+def sample_data(db):
+    return {
+        "movies": [row["id"] for row in db.query("SELECT id FROM movies ORDER BY id")],
+        "genres": [row["id"] for row in db.query("SELECT id FROM genres ORDER BY id")],
+        "genre_names": [row["name"] for row in db.query("SELECT name FROM genres ORDER BY id")],
+        "titles": [row["primaryTitle"] for row in db.query("SELECT primaryTitle FROM movies ORDER BY id")],
+        "years": [row["startYear"] for row in db.query("SELECT DISTINCT startYear FROM movies ORDER BY startYear")],
+    }
+
+# ----- Measurement -----
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(math.ceil(q * len(sorted_values)) - 1, 0)]
+
+async def send(client, request):
+    method, url, body = request
+    response = await client.request(method, url, json=body)
+    await response.aread()
+    return response.status_code
+
+async def load(client, requests, concurrency):
+    """Send ``requests`` with ``concurrency`` clients; returns (elapsed, latencies, errors)."""
+    latencies, errors = [], 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for request in pending:
+            t0 = time.perf_counter()
+            status = await send(client, request)
+            latencies.append(time.perf_counter() - t0)
+            if status >= 400:
+                errors += 1
+            # Fully cached responses complete without suspending; yield as a
+            # socket read would, or one client can hold the loop for its whole run
+            await asyncio.sleep(0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - t0, latencies, errors
+
+async def allocated_per_request(client, requests):
+    """Mean peak of traced Python allocations per request, in KiB."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for request in requests:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await send(client, request)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+async def check_rejections(client):
+    """Inputs the API must refuse with a 4xx rather than fail on with a 500."""
+    from api.facets import MAX_NESTING
+
+    checks = [
+        # Nesting past MAX_NESTING used to exhaust the parser's recursion
+        ("/movies/filter?" + urlencode({"where": "(" * MAX_NESTING + "genre:Drama" + ")" * MAX_NESTING}), 200),
+        ("/movies/filter?" + urlencode({"where": "(" * 240 + "genre:Drama" + ")" * 240}), 400),
+        ("/movies/filter?" + urlencode({"where": "NOT " * 490 + "genre:Drama"}), 400),
+        ("/movies?limit=-1", 422),
+    ]
+    for url, expected in checks:
+        status = await send(client, ("GET", url, None))
+        assert status == expected, f"GET {url[:80]}: {status}, expected {expected}"
+
+async def run(app, build, names, profile):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await check_rejections(client)
+            for name in names:
+                make = build[name]
+                warmup = [make() for _ in range(profile["warmup"])]
+                timed = [make() for _ in range(profile["requests"])]
+                traced = [make() for _ in range(profile["alloc_requests"])]
+                await load(client, warmup, profile["concurrency"])
+                gc.collect()
+                elapsed, latencies, errors = await load(client, timed, profile["concurrency"])
+                latencies.sort()
+                results[name] = {
+                    "requests": len(latencies),
+                    "errors": errors,
+                    "rps": len(latencies) / elapsed,
+                    "p50_ms": percentile(latencies, 0.50) * 1000,
+                    "p95_ms": percentile(latencies, 0.95) * 1000,
+                    "p99_ms": percentile(latencies, 0.99) * 1000,
+                    "alloc_kib": await allocated_per_request(client, traced),
+                }
+                print_row(name, results[name])
+    return results
+
+# ----- Reports -----
+def print_header():
+    print(f"{'scenario':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'alloc KiB':>10} {'errors':>7}")
+
+def print_row(name, r):
+    print(f"{name:<18} {r['rps']:>9.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+          f"{r['alloc_kib']:>10.1f} {r['errors']:>7}", flush=True)
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit}
+
+def compare(baseline, results, tolerance):
+    """Print the change of every metric against ``baseline``; returns the regressed scenarios."""
+    print(f"\ncompared with baseline from {baseline['created_at']} (commit {baseline['environment']['commit']})")
+    if baseline["environment"]["platform"] != platform.platform():
+        print(f"  note: baseline recorded on {baseline['environment']['platform']}")
+    print(f"{'scenario':<18} {'req/s':>15} {'p95 ms':>15} {'p99 ms':>15} {'alloc KiB':>15}")
+    # (metric, higher is better, gates the comparison); p99 over a few hundred
+    # requests is a handful of samples, so it is shown but not judged
+    metrics = [("rps", True, True), ("p95_ms", False, True), ("p99_ms", False, False), ("alloc_kib", False, True)]
+    regressed = []
+    for name, current in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<18} (not in baseline)")
+            continue
+        cells, worse = [], False
+        for metric, higher_is_better, gates in metrics:
+            change = (current[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            if gates and (-change if higher_is_better else change) > tolerance:
+                worse = True
+            cells.append(f"{change:>+14.1%}")
+        if current["errors"] > base["errors"]:
+            worse = True
+        print(f"{name:<18} {' '.join(cells)}" + ("  REGRESSION" if worse else ""))
+        if worse:
+            regressed.append(name)
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--requests", type=int, help="timed requests per scenario (overrides the profile)")
+    parser.add_argument("--concurrency", type=int, help="concurrent clients (overrides the profile)")
+    parser.add_argument("--scenarios", nargs="+", help="run only these scenarios")
+    parser.add_argument("--db", default="benchmarks/data/imdb.sqlite3", help="SQLite database, seeded from dump/ if missing")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the database even if it exists")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", metavar="NAME", help="store the results as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with benchmarks/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change in req/s, p95 or allocations counted as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.requests:
+        profile["requests"] = args.requests
+    if args.concurrency:
+        profile["concurrency"] = args.concurrency
+
+    if args.reseed or not os.path.exists(args.db):
+        from benchmarks.seed_sqlite import seed
+        seed(args.db)
+    # The app reads its configuration at import time
+    os.environ.update(IMDB_DB_DRIVER="sqlite", IMDB_SQLITE_PATH=os.path.abspath(args.db),
+                      IMDB_MODEL_POLL_SECONDS="0")
+    from api.api import app, db
+
+    build = scenarios(sample_data(db), random.Random(args.seed))
+    names = args.scenarios or list(build)
+    unknown = sorted(set(names) - set(build))
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(build)}")
+
+    print(f"profile {args.profile}: {profile['requests']} requests x {profile['concurrency']} clients per scenario")
+    print_header()
+    results = asyncio.run(run(app, build, names, profile))
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "profile": dict(profile, name=args.profile, seed=args.seed),
+        "results": results,
+    }
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nbaseline saved to {path}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if baseline["profile"] != report["profile"]:
+            print(f"\nwarning: baseline profile {baseline['profile']} differs from {report['profile']}")
+        regressed = compare(baseline, results, args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} scenario(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Check FeatureEncoder against the original preprocess_input and time both.
+
+Run from the project root:
+
+    python -m benchmarks.bench_encoder --n 20000
+"""
+import argparse
+import random
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from api.api import registry
+from benchmarks.bench_predict import random_payload
+
+FEATURE_COLUMNS = registry.current.feature_columns
+encoder = registry.current.encoder
+model = registry.current.model or joblib.load(registry.current.path)
+
+def legacy_preprocess_input(data: dict) -> np.ndarray:
+    """The per-call implementation FeatureEncoder replaced, kept as the reference."""
+    idx = {col: i for i, col in enumerate(FEATURE_COLUMNS)}
+    x = np.zeros(len(FEATURE_COLUMNS), dtype=float)
+    x[idx['runtimeMinutes']] = data.get('runtimeMinutes', 0)
+    x[idx['budget']] = data.get('budget', 0)
+    for g in data.get('genres', []):
+        if g in idx: x[idx[g]] = 1.0
+    for c in data.get('production_companies', []):
+        key = f"comp_{c}"
+        if key in idx: x[idx[key]] = 1.0
+    for l in data.get('languages', []):
+        key = f"lang_{l}"
+        if key in idx: x[idx[key]] = 1.0
+    for c in data.get('countries', []):
+        key = f"ctry_{c}"
+        if key in idx: x[idx[key]] = 1.0
+    rkey = f"rating_{data.get('rating')}"
+    if rkey in idx: x[idx[rkey]] = 1.0
+    lkey = f"loc_{data.get('loc')}"
+    if lkey in idx: x[idx[lkey]] = 1.0
+    return x
+
+def odd_payloads():
+    """Inputs that exercise the corners of the legacy lookup rules."""
+    return [
+        {"runtimeMinutes": 90, "budget": 1e6, "genres": ["budget", "comp_Netflix"], "languages": ["en", "en"]},
+        {"runtimeMinutes": 90, "budget": 1e6, "genres": ["Unknown"], "languages": ["xx"], "rating": None},
+        {"genres": ["Drama"], "languages": ["pt"], "countries": ["BR"], "loc": "Los Angeles, California, USA"},
+    ]
+
+def check_parity(payloads):
+    for data in payloads:
+        expected = legacy_preprocess_input(data)
+        assert np.array_equal(expected, encoder.encode(data)), data
+        assert np.array_equal(expected, encoder.encode_sparse([data]).toarray()[0]), data
+    assert np.array_equal(
+        np.vstack([legacy_preprocess_input(d) for d in payloads]), encoder.encode_batch(payloads)
+    )
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [random_payload(rng) for _ in range(args.n)] + odd_payloads()
+    check_parity(payloads)
+    print(f"parity ok on {len(payloads)} inputs")
+
+    n = len(payloads)
+    cases = {
+        "legacy rows + DataFrame": lambda: pd.DataFrame(
+            [legacy_preprocess_input(d) for d in payloads], columns=FEATURE_COLUMNS),
+        "encoder.encode (per row)": lambda: [encoder.encode(d) for d in payloads],
+        "encoder.encode_batch": lambda: encoder.encode_batch(payloads),
+        "encoder.encode_sparse": lambda: encoder.encode_sparse(payloads),
+    }
+    for name, fn in cases.items():
+        print(f"{name:<26} {best_of(fn, args.repeat) / n * 1e6:8.2f} us/row")
+
+    one = payloads[:1]
+    legacy_df = lambda: model.predict_proba(pd.DataFrame([legacy_preprocess_input(one[0])], columns=FEATURE_COLUMNS))
+    encoded = lambda: model.predict_proba(encoder.encode_batch(one))
+    print(f"{'single predict, legacy':<26} {best_of(legacy_df, args.repeat * 10) * 1e3:8.2f} ms")
+    print(f"{'single predict, encoder':<26} {best_of(encoded, args.repeat * 10) * 1e3:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
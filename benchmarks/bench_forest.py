@@ -0,0 +1,60 @@
+"""Compare the flat-array forest with sklearn's predict_proba: parity, latency and memory.
+
+Also times ``CompiledForest.explain`` (prediction plus feature contributions).
+
+    python -m benchmarks.bench_forest --sizes 1 10 64 256 1000 10000
+"""
+import argparse
+import pickle
+import random
+import time
+
+import joblib
+import numpy as np
+
+from api.api import registry
+from api.forest import CompiledForest
+from benchmarks.bench_predict import random_payload
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 64, 256, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    model = joblib.load(registry.current.path)
+    encoder = registry.current.encoder
+    t0 = time.perf_counter()
+    forest = CompiledForest.from_sklearn(model)
+    print(f"export: {time.perf_counter() - t0:.2f}s, {len(forest.roots)} trees, {forest.n_nodes} nodes, "
+          f"depth {forest.max_depth}")
+    print(f"size: compiled arrays {forest.nbytes / 1024:.0f} KiB, pickled sklearn model "
+          f"{len(pickle.dumps(model)) / 1024:.0f} KiB")
+
+    rng = random.Random(args.seed)
+    payloads = [random_payload(rng) for _ in range(max(args.sizes))]
+    X = encoder.encode_batch(payloads)
+    X_sparse = encoder.encode_sparse(payloads)
+    expected = model.predict_proba(X)
+    print(f"max |diff| dense: {np.abs(forest.predict_proba(X) - expected).max():.2e}, "
+          f"sparse: {np.abs(forest.predict_proba(X_sparse) - expected).max():.2e}")
+
+    print(f"{'rows':>8} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8} {'explain ms':>11}")
+    for size in args.sizes:
+        x = X[:size]
+        sk = best_of(lambda: model.predict_proba(x), args.repeat) * 1000
+        cf = best_of(lambda: forest.predict_proba(x), args.repeat) * 1000
+        ex = best_of(lambda: forest.explain(x), args.repeat) * 1000
+        print(f"{size:>8} {sk:>11.2f} {cf:>12.2f} {sk / cf:>7.1f}x {ex:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Throughput and latency of concurrent /predict calls with and without micro-batching.
+
+Simulates ``--clients`` concurrent callers, each sending single-film
+predictions back to back, against the direct path (one predict_proba per
+call in the threadpool) and against ``MicroBatcher`` for every window size.
+
+    python -m benchmarks.bench_microbatch --clients 256 --requests 4
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from api.api import PredictRequest, score_items
+from api.batching import MicroBatcher
+from benchmarks.bench_predict import random_payload
+
+async def run_clients(call, payloads, clients):
+    latencies = []
+
+    async def client(items):
+        for item in items:
+            t0 = time.perf_counter()
+            await call(item)
+            latencies.append(time.perf_counter() - t0)
+
+    per_client = len(payloads) // clients
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(payloads[i * per_client:(i + 1) * per_client]) for i in range(clients)))
+    return time.perf_counter() - t0, latencies
+
+def summary(label, elapsed, latencies, extra=""):
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<22} {len(latencies) / elapsed:>10.0f} {p50:>9.1f} {p99:>9.1f}  {extra}")
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    payloads = [PredictRequest(**random_payload(rng)).dict() for _ in range(args.clients * args.requests)]
+    print(f"{'mode':<22} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+
+    direct = lambda item: run_in_threadpool(score_items, [item])
+    summary("direct", *await run_clients(direct, payloads, args.clients))
+
+    for window in args.windows:
+        batcher = MicroBatcher(lambda items: [float(p) for p in score_items(items)],
+                               max_batch=args.max_batch, max_wait=window / 1000, workers=args.workers)
+        elapsed, latencies = await run_clients(batcher.submit, payloads, args.clients)
+        m = batcher.metrics()
+        summary(f"batched {window:g} ms", elapsed, latencies,
+                f"mean batch {m['mean_batch_size']:.1f}, fill {m['batch_fill']:.0%}, max queue {m['max_queue_depth']}")
+        await batcher.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=4, help="requests per client")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.5, 2, 5], help="batch windows in ms")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Recall and latency of the LSH similar-movies index against the exact cosine scan.
+
+Reads the catalog from a SQLite copy of the database (seeded from ``dump/``
+if missing, see ``benchmarks/seed_sqlite.py``) and, for each ``--scales``
+factor, grows it with perturbed copies of every movie: runtime and budget
+jittered, each label dropped with probability ``--drop``. Queries are
+catalog movies (GET /movies/{id}/similar) and random pitches
+(POST /predict/neighbors), reported apart: random label combinations are
+far from every movie, so most of them fall back to the exact scan. Recall@k
+counts the LSH results at least as similar as the k-th exact one, so ties
+do not count as misses.
+
+    python -m benchmarks.bench_neighbors --scales 1 10 40 80 --queries 200 --k 10
+"""
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+def grow(movies, pairs, scale, drop, rng):
+    """The catalog plus ``scale - 1`` perturbed copies of every movie, in id order."""
+    grown, grown_pairs = list(movies), {facet: list(rows) for facet, rows in pairs.items()}
+    for copy in range(1, scale):
+        for row in movies:
+            runtime, budget = row["runtimeMinutes"], row["budget"]
+            grown.append(dict(row, id=f"{row['id']}~{copy}",
+                              runtimeMinutes=None if runtime is None else runtime * rng.uniform(0.9, 1.1),
+                              budget=None if budget is None else budget * rng.uniform(0.7, 1.4)))
+        for facet, rows in pairs.items():
+            grown_pairs[facet].extend((f"{movie_id}~{copy}", value_id, name)
+                                      for movie_id, value_id, name in rows if rng.random() >= drop)
+    grown.sort(key=lambda row: row["id"])
+    return grown, grown_pairs
+
+def percentile(values, q):
+    return float(np.percentile(values, q * 100)) * 1000
+
+def measure(index, queries, k):
+    """(exact latencies, LSH latencies, recalls) over ``queries`` of ("similar", id) or ("pitch", payload)."""
+    exact, approx, recalls = [], [], []
+    for kind, query in queries:
+        run = index.similar if kind == "similar" else index.neighbors
+        t0 = time.perf_counter()
+        truth = run(query, k, exact=True)
+        t1 = time.perf_counter()
+        found = run(query, k, exact=False)
+        t2 = time.perf_counter()
+        exact.append(t1 - t0)
+        approx.append(t2 - t1)
+        if truth:
+            floor = truth[-1]["similarity"] - 1e-4
+            recalls.append(sum(hit["similarity"] >= floor for hit in found) / len(truth))
+    return exact, approx, recalls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="benchmarks/data/imdb.sqlite3",
+                        help="SQLite database, seeded from dump/ if missing")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 40, 80])
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind per scale")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--drop", type=float, default=0.15, help="probability of dropping a label from a copy")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        from benchmarks.seed_sqlite import seed
+        seed(args.db)
+    # The app reads its configuration at import time
+    os.environ.update(IMDB_DB_DRIVER="sqlite", IMDB_SQLITE_PATH=os.path.abspath(args.db), IMDB_MODEL_POLL_SECONDS="0")
+    from api.api import db, registry
+    from api.neighbors import EXACT_MAX_MOVIES, NeighborIndex, read_neighbors
+    from benchmarks.bench_predict import random_payload
+
+    movies, pairs = read_neighbors(db)
+    rng = random.Random(args.seed)
+    print(f"k={args.k}, {args.queries} movie and {args.queries} pitch queries per scale; "
+          f"the API scans exactly up to {EXACT_MAX_MOVIES} movies")
+    print(f"{'movies':>8} {'build s':>8} {'MiB':>6} {'query':>7} | {'exact p50':>9} {'p95':>6} | {'lsh p50':>7} "
+          f"{'p95':>6} | {'recall':>6} {'min':>5} | {'speedup':>7}")
+    for scale in args.scales:
+        grown, grown_pairs = grow(movies, pairs, scale, args.drop, rng)
+        t0 = time.perf_counter()
+        index = NeighborIndex(grown, grown_pairs, registry.current.feature_columns, registry.current.version)
+        build = time.perf_counter() - t0
+        size = index.describe()["index_bytes"] / 2 ** 20
+        for kind in ("similar", "pitch"):
+            if kind == "similar":
+                queries = [(kind, row["id"]) for row in rng.sample(grown, min(args.queries, len(grown)))]
+            else:
+                queries = [(kind, random_payload(rng)) for _ in range(args.queries)]
+            exact, approx, recalls = measure(index, queries, args.k)
+            print(f"{len(grown):>8} {build:>8.2f} {size:>6.1f} {kind:>7} | {percentile(exact, .5):>9.3f} "
+                  f"{percentile(exact, .95):>6.3f} | {percentile(approx, .5):>7.3f} {percentile(approx, .95):>6.3f} | "
+                  f"{np.mean(recalls):>6.3f} {min(recalls):>5.2f} | {np.median(exact) / np.median(approx):>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare per-film prediction cost of single calls against batched calls.
+
+Run from the project root:
+
+    python -m benchmarks.bench_predict --sizes 1 10 100 1000 10000
+"""
+import argparse
+import random
+import time
+
+from api.api import PredictRequest, predict_many, registry, score_items
+
+FEATURE_COLUMNS = registry.current.feature_columns
+
+GENRES = [c for c in FEATURE_COLUMNS if "_" not in c and c not in ("runtimeMinutes", "budget")]
+PREFIXED = {
+    prefix: [c[len(prefix):] for c in FEATURE_COLUMNS if c.startswith(prefix)]
+    for prefix in ("comp_", "lang_", "ctry_", "rating_", "loc_")
+}
+
+def random_payload(rng: random.Random) -> dict:
+    """Build a plausible PredictRequest body from the model's own vocabulary."""
+    return {
+        "runtimeMinutes": rng.randint(60, 180),
+        "budget": rng.choice([1e5, 1e6, 5e6, 2e7, 1e8, 2e8]),
+        "genres": rng.sample(GENRES, rng.randint(1, 3)),
+        "production_companies": rng.sample(PREFIXED["comp_"], rng.randint(0, 2)),
+        "languages": rng.sample(PREFIXED["lang_"], rng.randint(1, 2)),
+        "countries": rng.sample(PREFIXED["ctry_"], rng.randint(0, 2)),
+        "rating": rng.choice(PREFIXED["rating_"]),
+        "loc": rng.choice(PREFIXED["loc_"] + [None]),
+    }
+
+def time_single(payloads, repeat):
+    requests_ = [PredictRequest(**p) for p in payloads]
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for req in requests_:
+            score_items([req.dict()])
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def time_batch(payloads, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        predict_many(payloads)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--single-limit", type=int, default=200,
+                        help="largest batch size also timed as one call per film")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'batch':>8} {'single us/film':>16} {'batch us/film':>15} {'speedup':>8}")
+    for size in args.sizes:
+        payloads = [random_payload(rng) for _ in range(size)]
+        batch = time_batch(payloads, args.repeat) / size * 1e6
+        if size <= args.single_limit:
+            single = time_single(payloads, args.repeat) / size * 1e6
+            print(f"{size:>8} {single:>16.1f} {batch:>15.1f} {single / batch:>7.1f}x")
+        else:
+            print(f"{size:>8} {'-':>16} {batch:>15.1f} {'-':>8}")
+
+if __name__ == "__main__":
+    main()
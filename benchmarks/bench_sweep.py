@@ -0,0 +1,45 @@
+"""Cost of a what-if sweep compared with a single prediction.
+
+    python -m benchmarks.bench_sweep --points 50 500 5000
+"""
+import argparse
+import random
+
+import numpy as np
+
+from api.api import registry, sweep_matrix
+from benchmarks.bench_forest import best_of
+from benchmarks.bench_predict import random_payload
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    active = registry.current
+    encoder = active.encoder
+    base = random_payload(random.Random(args.seed))
+    x = encoder.encode_batch([base])
+    single = best_of(lambda: active.predict_proba(x), args.repeat) * 1000
+    print(f"single prediction: {single:.2f} ms")
+
+    print(f"{'points':>8} {'axes':>18} {'row by row ms':>14} {'batch ms':>9} {'sweep ms':>9} {'max |diff|':>11}")
+    for points in args.points:
+        budget = np.geomspace(1e5, 2e8, points)
+        side = max(int(points ** 0.5), 1)
+        grids = {
+            "budget": {"budget": budget},
+            "budget x runtime": {"budget": np.geomspace(1e5, 2e8, side), "runtimeMinutes": np.linspace(60, 180, side)},
+        }
+        for label, axes in grids.items():
+            X, _, _ = sweep_matrix(encoder, base, axes, {})
+            row_by_row = best_of(lambda: [active.predict_proba(X[i:i + 1]) for i in range(len(X))], 1) * 1000
+            batch = best_of(lambda: active.predict_proba(X), args.repeat) * 1000
+            sweep = best_of(lambda: active.predict_variants(X), args.repeat) * 1000
+            diff = np.abs(active.predict_variants(X) - active.forest.predict_proba(X)).max()
+            print(f"{len(X) - 1:>8} {label:>18} {row_by_row:>14.1f} {batch:>9.2f} {sweep:>9.2f} {diff:>11.1e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Build a SQLite copy of the IMDB database from the MySQL dumps in ``dump/``.
+
+The tables keep the dump's columns and rows. The indexes are the ones
+``scripts/migrations.py`` leaves on MySQL (junction primary keys and
+reverse indexes, movie sort indexes, master name indexes), so queries run
+against the migrated schema. The API serves it with ``IMDB_DB_DRIVER=sqlite``.
+
+    python -m benchmarks.seed_sqlite benchmarks/data/imdb.sqlite3
+"""
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+
+from scripts.migrations import JUNCTIONS
+
+DUMP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dump")
+
+# MySQL escapes inside quoted strings (mysqldump only emits these)
+ESCAPES = {"0": "\0", "'": "'", '"': '"', "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a", "\\": "\\"}
+
+INDEXES = [
+    *(f"CREATE INDEX idx_{table}_{other}_movie ON {table} ({other}, {movie})" for table, movie, other, _ in JUNCTIONS),
+    "CREATE INDEX idx_genres_name ON genres (name)",
+    "CREATE INDEX idx_locations_name ON locations (name)",
+    "CREATE INDEX idx_movies_startYear ON movies (startYear)",
+    "CREATE INDEX idx_movies_votes ON movies (numVotes, id)",
+    "CREATE INDEX idx_movies_rating ON movies (averageRating, numVotes)",
+    "CREATE INDEX idx_movies_contentRating ON movies (contentRating)",
+]
+
+def column_type(definition: str) -> str:
+    """SQLite type for a MySQL column type; decimals become REAL so they read back as floats."""
+    mysql_type = definition.split()[1].lower()
+    if mysql_type.startswith(("int", "tinyint", "smallint", "bigint")):
+        return "INTEGER"
+    if mysql_type.startswith(("decimal", "float", "double")):
+        return "REAL"
+    return "TEXT"
+
+def parse_table(text: str):
+    """Name, column definitions and primary key of the CREATE TABLE in a dump file."""
+    name, body = re.search(r"CREATE TABLE `(\w+)` \((.*?)\n\)[^;]*;", text, re.S).groups()
+    columns, primary_key = [], None
+    for line in body.splitlines():
+        line = line.strip().rstrip(",")
+        if line.startswith("`"):
+            columns.append((line.split("`")[1], column_type(line)))
+        elif line.startswith("PRIMARY KEY"):
+            primary_key = re.findall(r"`(\w+)`", line)
+    return name, columns, primary_key
+
+def sqlite_literals(statement: str) -> str:
+    """Rewrite the MySQL string literals of an INSERT into SQLite ones ('' instead of backslash escapes)."""
+    out, i, n = [], 0, len(statement)
+    while i < n:
+        quote = statement.find("'", i)
+        if quote < 0:
+            out.append(statement[i:])
+            break
+        out.append(statement[i:quote])
+        j, value = quote + 1, []
+        while True:
+            ch = statement[j]
+            if ch == "\\":
+                value.append(ESCAPES.get(statement[j + 1], statement[j + 1]))
+                j += 2
+            elif ch == "'" and statement.startswith("''", j):
+                value.append("'")
+                j += 2
+            elif ch == "'":
+                break
+            else:
+                value.append(ch)
+                j += 1
+        out.append("'" + "".join(value).replace("'", "''") + "'")
+        i = j + 1
+    return "".join(out)
+
+def seed(path: str, dump_dir: str = DUMP_DIR) -> dict:
+    """Create ``path`` (replacing it) from the dumps and return the row count of each table."""
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    junctions = {table: (movie, other) for table, movie, other, _ in JUNCTIONS}
+    conn = sqlite3.connect(path, isolation_level=None)
+    counts = {}
+    try:
+        conn.execute("BEGIN")
+        for dump in sorted(glob.glob(os.path.join(dump_dir, "IMDB_*.sql"))):
+            with open(dump, encoding="utf-8") as f:
+                text = f.read()
+            table, columns, primary_key = parse_table(text)
+            if table in junctions:
+                primary_key = list(junctions[table])  # migration 1
+            ddl = [f'"{name}" {kind}' for name, kind in columns]
+            if primary_key:
+                ddl.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+            conn.execute(f'CREATE TABLE "{table}" ({", ".join(ddl)})')
+            for statement in re.findall(r"^INSERT INTO .*?\);$", text, re.M | re.S):
+                statement = sqlite_literals(statement.replace("`", '"', 2))
+                if table in junctions:
+                    # Migration 1 drops duplicate and NULL pairs before adding the key
+                    statement = statement.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+                conn.execute(statement)
+            if table in junctions:
+                movie, other = junctions[table]
+                conn.execute(f"DELETE FROM {table} WHERE {movie} IS NULL OR {other} IS NULL")
+            if table == "movies":
+                conn.execute("ALTER TABLE movies ADD COLUMN content_hash TEXT")  # migration 4
+            counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        for index in INDEXES:
+            conn.execute(index)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default="benchmarks/data/imdb.sqlite3")
+    parser.add_argument("--dump-dir", default=DUMP_DIR)
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    counts = seed(args.path, args.dump_dir)
+    for table, count in counts.items():
+        print(f"{table:<18} {count:>7}")
+    print(f"{args.path} seeded in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
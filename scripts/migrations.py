@@ -0,0 +1,154 @@
+"""Versioned schema migrations for the IMDB database.
+
+Each migration runs once and is recorded in ``schema_migrations``. Steps
+check the current schema before changing it, so a migration interrupted
+half-way (MySQL DDL commits implicitly) can simply be run again.
+
+    python scripts/migrations.py            # apply pending migrations
+    python scripts/migrations.py --status   # list applied versions
+
+After migrating, ``python -m api.plancheck`` verifies that no API query
+falls back to a full table scan.
+"""
+import argparse
+
+import mysql.connector
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "12345678",
+    "database": "IMDB",
+    "port": 3306
+}
+
+# (table, movie column, other column, other column type)
+JUNCTIONS = [
+    ("movie_genres", "movie_id", "genre_id", "INT"),
+    ("movie_languages", "movie_id", "language_id", "VARCHAR(255)"),
+    ("movie_countries", "movie_id", "country_id", "VARCHAR(255)"),
+    ("movie_companies", "movie_id", "company_id", "VARCHAR(255)"),
+    ("movie_locations", "movie_id", "location_id", "INT"),
+]
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+        (table, index)
+    )
+    return cursor.fetchone() is not None
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+        (table, column)
+    )
+    return cursor.fetchone() is not None
+
+def junction_keys(cursor):
+    """Composite primary keys on every junction table plus a reverse (other, movie) index."""
+    for table, movie_col, other_col, other_type in JUNCTIONS:
+        if not index_exists(cursor, table, "PRIMARY"):
+            # Drop duplicate and NULL rows first; they would block the primary key
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE dedupe AS SELECT DISTINCT {movie_col}, {other_col} FROM {table} "
+                f"WHERE {movie_col} IS NOT NULL AND {other_col} IS NOT NULL"
+            )
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"INSERT INTO {table} ({movie_col}, {other_col}) SELECT {movie_col}, {other_col} FROM dedupe")
+            cursor.execute("DROP TEMPORARY TABLE dedupe")
+            # ALTER TABLE commits the dedupe above before it runs
+            cursor.execute(
+                f"ALTER TABLE {table} MODIFY {movie_col} VARCHAR(255) NOT NULL, "
+                f"MODIFY {other_col} {other_type} NOT NULL, ADD PRIMARY KEY ({movie_col}, {other_col})"
+            )
+        reverse = f"idx_{table}_{other_col}_movie"
+        if not index_exists(cursor, table, reverse):
+            cursor.execute(f"CREATE INDEX {reverse} ON {table} ({other_col}, {movie_col})")
+
+def unique_master_names(cursor):
+    """Unique name indexes for the auto-increment master tables the loader looks up by name."""
+    for table in ("genres", "locations"):
+        index = f"uq_{table}_name"
+        if index_exists(cursor, table, index):
+            continue
+        cursor.execute(f"SELECT name FROM {table} GROUP BY name HAVING COUNT(*) > 1 LIMIT 10")
+        duplicates = [row[0] for row in cursor.fetchall()]
+        if duplicates:
+            raise RuntimeError(f"{table} has duplicate names, merge them before migrating: {duplicates}")
+        cursor.execute(f"CREATE UNIQUE INDEX {index} ON {table} (name)")
+
+def movie_sort_indexes(cursor):
+    """Indexes behind the year filters, vote/rating sorts and the ratings listing."""
+    indexes = [
+        ("idx_movies_startYear", "startYear"),
+        ("idx_movies_votes", "numVotes, id"),
+        ("idx_movies_rating", "averageRating, numVotes"),
+        ("idx_movies_contentRating", "contentRating"),
+    ]
+    for index, columns in indexes:
+        if not index_exists(cursor, "movies", index):
+            cursor.execute(f"CREATE INDEX {index} ON movies ({columns})")
+
+def movie_content_hash(cursor):
+    """Per-movie content hash the incremental refresh compares to skip unchanged titles."""
+    if not column_exists(cursor, "movies", "content_hash"):
+        cursor.execute("ALTER TABLE movies ADD COLUMN content_hash CHAR(32) NULL")
+
+MIGRATIONS = [
+    (1, "composite primary keys and reverse indexes on junction tables", junction_keys),
+    (2, "unique name indexes on genres and locations", unique_master_names),
+    (3, "movies indexes for year, votes, rating and content rating", movie_sort_indexes),
+    (4, "content hash column on movies for incremental refreshes", movie_content_hash),
+]
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def apply_migrations(conn, verbose=True):
+    """Apply pending migrations in version order and return the versions applied."""
+    cursor = conn.cursor(buffered=True)
+    done = applied_versions(cursor)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        if verbose:
+            print(f"Applying migration {version}: {description}")
+        migrate(cursor)
+        cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+        conn.commit()
+        applied.append(version)
+    cursor.close()
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the IMDB database.")
+    parser.add_argument("--status", action="store_true", help="only list applied and pending versions")
+    args = parser.parse_args()
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        if args.status:
+            cursor = conn.cursor()
+            done = applied_versions(cursor)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3} {'applied' if version in done else 'pending':<8} {description}")
+            cursor.close()
+        else:
+            applied = apply_migrations(conn)
+            print(f"Applied {len(applied)} migration(s).")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
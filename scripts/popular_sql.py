@@ -1,21 +1,59 @@
+"""Create the IMDB schema and load the movie catalog into MySQL.
+
+    python scripts/popular_sql.py --file dados/movies_data.xlsx              # bulk load (default)
+    python scripts/popular_sql.py --file dados/movies_data.xlsx --load-data  # bulk load via LOAD DATA LOCAL INFILE
+    python scripts/popular_sql.py --file dados/movies_data.xlsx --mode rows  # original row-by-row path
+    python scripts/popular_sql.py --file dados/movies_data.xlsx --mode refresh  # write only what changed
+
+The source (.xlsx, .csv, .parquet or .jsonl) is streamed in ``--chunk-size``
+chunks, so memory use does not grow with the size of the file.
+"""
+import argparse
+import ast
+import hashlib
+import itertools
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.request
+
 import mysql.connector
+import numpy as np
 import pandas as pd
-import ast
 import pycountry
 
-# Establish a connection to the MySQL server
-conn = mysql.connector.connect(
-    host="localhost",  # Your MySQL host
-    user="root",  # Your MySQL username
-    password="12345678",  # Your MySQL password
-    database="IMDB",  # Your database name
-    port=3306  # MySQL port, default is 3306
-)
+from migrations import apply_migrations
+
+DB_CONFIG = {
+    "host": "localhost",  # Your MySQL host
+    "user": "root",  # Your MySQL username
+    "password": "12345678",  # Your MySQL password
+    "database": "IMDB",  # Your database name
+    "port": 3306  # MySQL port, default is 3306
+}
 
-cursor = conn.cursor(buffered=True)
+MOVIE_COLUMNS = [
+    'id', 'url', 'primaryTitle', 'originalTitle', 'type', 'description', 'primaryImage', 'trailer', 'contentRating',
+    'isAdult', 'releaseDate', 'startYear', 'endYear', 'runtimeMinutes', 'budget', 'grossWorldwide',
+    'averageRating', 'numVotes', 'metascore', 'weekendGrossAmount', 'weekendGrossCurrency',
+    'lifetimeGrossAmount', 'lifetimeGrossCurrency', 'weeksRunning'
+]
+LIST_COLUMNS = ['genres', 'countriesOfOrigin', 'spokenLanguages', 'productionCompanies', 'filmingLocations']
+# junction table -> column referencing the master table
+JUNCTION_COLUMNS = {
+    'movie_genres': 'genre_id',
+    'movie_languages': 'language_id',
+    'movie_countries': 'country_id',
+    'movie_companies': 'company_id',
+    'movie_locations': 'location_id',
+}
 
 # Define the function to create tables
-def create_tables():
+def create_tables(conn):
+    cursor = conn.cursor(buffered=True)
     # First, create the movies table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS movies (
@@ -127,9 +165,36 @@ def create_tables():
 
     # Commit all changes to the database
     conn.commit()
+    cursor.close()
+
+def country_name(code):
+    country = pycountry.countries.get(alpha_2=code)
+    return country.name if country else code
+
+def company_key(comp):
+    """(id, name) of a productionCompanies entry, which is a dict or a bare string."""
+    if isinstance(comp, dict):
+        return comp.get('id'), comp.get('name')
+    return str(comp), str(comp)
+
+def seed_countries(conn, data):
+    """Seed the countries master table with readable names for the codes in ``data``."""
+    unique_country_codes = {
+        code for codes in data['countriesOfOrigin'] for code in codes
+    }
+    country_mapping = [(code, country_name(code)) for code in unique_country_codes]
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT IGNORE INTO countries (id, name) VALUES (%s, %s)",
+        country_mapping
+    )
+    conn.commit()
+    cursor.close()
 
 # Function to insert data into the tables
-def insert_data(data):
+def insert_data(conn, data):
+    """Row-by-row loader: one statement per movie and per relationship row."""
+    cursor = conn.cursor(buffered=True)
     # Initialize caches for master tables
     genre_cache = {}
     language_cache = {}
@@ -140,13 +205,7 @@ def insert_data(data):
     # Insert data into movies table and their relationships
     for _, row in data.iterrows():
         # Prepare movie record
-        movie_values = (
-            row['id'], row['url'], row['primaryTitle'], row['originalTitle'], row['type'], row['description'],
-            row['primaryImage'], row['trailer'], row['contentRating'], row['isAdult'], row['releaseDate'],
-            row['startYear'], row['endYear'], row['runtimeMinutes'], row['budget'], row['grossWorldwide'],
-            row['averageRating'], row['numVotes'], row['metascore'], row['weekendGrossAmount'],
-            row['weekendGrossCurrency'], row['lifetimeGrossAmount'], row['lifetimeGrossCurrency'], row['weeksRunning']
-        )
+        movie_values = tuple(row[col] for col in MOVIE_COLUMNS)
         movie_values = [None if pd.isna(val) else val for val in movie_values]
         cursor.execute("""
             INSERT INTO movies (id, url, primaryTitle, originalTitle, type, description, primaryImage, trailer, contentRating,
@@ -179,12 +238,7 @@ def insert_data(data):
 
         # companies cache-backed inserts
         for comp in row['productionCompanies']:
-            if isinstance(comp, dict):
-                comp_id = comp.get('id')
-                comp_name = comp.get('name')
-            else:
-                comp_id = str(comp)
-                comp_name = str(comp)
+            comp_id, comp_name = company_key(comp)
             if comp_id not in company_cache:
                 cursor.execute("INSERT IGNORE INTO companies (id, name) VALUES (%s, %s)", (comp_id, comp_name))
                 company_cache[comp_id] = comp_id
@@ -199,40 +253,426 @@ def insert_data(data):
             cursor.execute("INSERT IGNORE INTO movie_locations (movie_id, location_id) VALUES (%s, %s)", (row['id'], location_cache[loc]))
 
     conn.commit()
+    cursor.close()
 
-# Load the Excel data
-file_path = 'movies_data.xlsx'
-data = pd.read_excel(file_path)
-# Drop duplicate entries by movie id to avoid primary key conflicts
-data = data.drop_duplicates(subset=['id'])
-# Convert string representations of list columns into actual Python lists
-list_columns = ['genres', 'countriesOfOrigin', 'spokenLanguages', 'productionCompanies', 'filmingLocations']
-for col in list_columns:
-    data[col] = data[col].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else (x if isinstance(x, list) else []))
-
-# Create tables
-create_tables()
-
-# Dynamically seed the countries master table using codes from the DataFrame
-unique_country_codes = {
-    code for codes in data['countriesOfOrigin'] for code in codes
-}
-country_mapping = []
-for code in unique_country_codes:
-    country = pycountry.countries.get(alpha_2=code)
-    country_name = country.name if country else code
-    country_mapping.append((code, country_name))
-cursor.executemany(
-    "INSERT IGNORE INTO countries (id, name) VALUES (%s, %s)",
-    country_mapping
-)
-conn.commit()
-
-# Now insert movie data
-insert_data(data)
-
-# Close the connection to the database
-cursor.close()
-conn.close()
-
-"Data inserted successfully!"
+# ----- Bulk loader -----
+def to_python(value):
+    """Plain Python value for the driver: NaN/NaT become None, NumPy scalars are unboxed."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+        return None if isinstance(value, float) and value != value else value
+    if value is pd.NaT:
+        return None
+    return value
+
+def hash_value(value):
+    """Normalise a value for hashing so 1921 and 1921.0 (NaN-widened columns) hash alike."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def content_hash(movie, relations):
+    """MD5 of a movie's column values and its sorted relationship keys."""
+    payload = [[hash_value(v) for v in movie], [sorted(map(str, set(keys))) for keys in relations]]
+    return hashlib.md5(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def placeholders(n, width=None):
+    """``%s, %s, ...`` for an IN list, or ``(%s, %s), ...`` rows when ``width`` is given."""
+    item = "%s" if width is None else "(" + ", ".join(["%s"] * width) + ")"
+    return ", ".join([item] * n)
+
+def tsv_field(value):
+    """Encode one value in the default LOAD DATA text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+class BulkLoader:
+    """Loads catalog DataFrames table by table in large multi-row batches.
+
+    Master-table ids are resolved in memory (one round trip per batch of new
+    names), every table is written with multi-row ``INSERT`` statements (or
+    ``LOAD DATA LOCAL INFILE`` from a generated TSV) and the transaction is
+    committed after each batch. ``load`` may be called repeatedly, e.g. once
+    per chunk of a large source; the master caches carry over between calls.
+    """
+
+    def __init__(self, conn, batch_size=5000, use_load_data=False):
+        self.conn = conn
+        self.cursor = conn.cursor(buffered=True)
+        self.batch_size = batch_size
+        self.use_load_data = use_load_data
+        self.genre_ids = {}
+        self.location_ids = {}
+        self.known = {"languages": set(), "countries": set(), "companies": set()}
+        self.stats = {}  # table -> [rows, seconds]
+
+    # -- writing --
+    def write(self, table, columns, rows, ignore=True, upsert=False):
+        """Insert ``rows`` into ``table`` in batches, committing after each one.
+
+        With ``upsert`` existing rows (matched on the primary key) are updated
+        in place with ``ON DUPLICATE KEY UPDATE``, reading the new values
+        through a row alias (MySQL 8.0.19+; ``VALUES(col)`` is deprecated).
+        """
+        if not rows:
+            return
+        start = time.perf_counter()
+        if self.use_load_data and not upsert:
+            self._load_data(table, columns, rows, ignore)
+        else:
+            verb = "INSERT IGNORE" if ignore and not upsert else "INSERT"
+            suffix = ""
+            if upsert:
+                suffix = " AS new ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = new.{c}" for c in columns[1:])
+            for i in range(0, len(rows), self.batch_size):
+                batch = rows[i:i + self.batch_size]
+                sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES {placeholders(len(batch), len(columns))}{suffix}"
+                self.cursor.execute(sql, [value for row in batch for value in row])
+                self.conn.commit()
+        self.record(table, len(rows), start)
+
+    def record(self, table, rows, start):
+        entry = self.stats.setdefault(table, [0, 0.0])
+        entry[0] += rows
+        entry[1] += time.perf_counter() - start
+
+    def _load_data(self, table, columns, rows, ignore):
+        for i in range(0, len(rows), self.batch_size):
+            with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False, encoding="utf-8", newline="") as f:
+                for row in rows[i:i + self.batch_size]:
+                    f.write("\t".join(tsv_field(v) for v in row) + "\n")
+                path = f.name
+            try:
+                self.cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s {'IGNORE' if ignore else ''} INTO TABLE {table} "
+                    f"CHARACTER SET utf8mb4 ({', '.join(columns)})",
+                    (path,)
+                )
+                self.conn.commit()
+            finally:
+                os.remove(path)
+
+    # -- master tables --
+    def resolve_names(self, table, names, cache):
+        """Insert unseen names into an auto-increment master table and cache their ids."""
+        new = [name for name in dict.fromkeys(names) if name not in cache]
+        if not new:
+            return
+        self.write(table, ["name"], [(name,) for name in new])
+        for i in range(0, len(new), self.batch_size):
+            batch = new[i:i + self.batch_size]
+            self.cursor.execute(f"SELECT id, name FROM {table} WHERE name IN ({placeholders(len(batch))})", batch)
+            found = {name: id_ for id_, name in self.cursor.fetchall()}
+            for name in batch:
+                if name in found:
+                    cache[name] = found[name]
+                else:
+                    # The column collation matched another spelling of this name
+                    self.cursor.execute(f"SELECT id FROM {table} WHERE name = %s", (name,))
+                    cache[name] = self.cursor.fetchone()[0]
+
+    def resolve_keyed(self, table, pairs):
+        """Insert unseen (id, name) pairs into a master table keyed by its own id."""
+        known = self.known[table]
+        new = [(key, name) for key, name in dict(pairs).items() if key not in known]
+        self.write(table, ["id", "name"], new)
+        known.update(key for key, _ in new)
+
+    # -- entry point --
+    def prepare(self, data):
+        """Resolve the master ids ``data`` refers to.
+
+        Returns the movie ids, the ``movies`` rows (ending in their content
+        hash) and, per junction table, the list of related keys of each movie.
+        """
+        ids = data['id'].tolist()
+        genres = data['genres'].tolist()
+        languages = data['spokenLanguages'].tolist()
+        countries = data['countriesOfOrigin'].tolist()
+        companies = [[company_key(c) for c in comps] for comps in data['productionCompanies']]
+        locations = data['filmingLocations'].tolist()
+
+        self.resolve_names("genres", [g for gs in genres for g in gs], self.genre_ids)
+        self.resolve_names("locations", [l for ls in locations for l in ls], self.location_ids)
+        self.resolve_keyed("languages", [(l, l) for ls in languages for l in ls])
+        self.resolve_keyed("countries", [(c, country_name(c)) for cs in countries for c in cs])
+        self.resolve_keyed("companies", [pair for cs in companies for pair in cs])
+
+        relations = {
+            "movie_genres": [[self.genre_ids[g] for g in gs] for gs in genres],
+            "movie_languages": languages,
+            "movie_countries": countries,
+            "movie_companies": [[key for key, _ in cs] for cs in companies],
+            "movie_locations": [[self.location_ids[l] for l in ls] for ls in locations],
+        }
+        # Hash source names rather than generated ids so hashes agree across databases
+        sources = (genres, languages, countries, relations["movie_companies"], locations)
+        movies = []
+        for i, row in enumerate(data[MOVIE_COLUMNS].astype(object).itertuples(index=False, name=None)):
+            values = tuple(to_python(v) for v in row)
+            movies.append(values + (content_hash(values, [keys[i] for keys in sources]),))
+        return ids, movies, relations
+
+    def load(self, data):
+        """Load one DataFrame whose list columns are already parsed into lists."""
+        ids, movies, relations = self.prepare(data)
+        self.write("movies", MOVIE_COLUMNS + ["content_hash"], movies, ignore=False)
+        for table, keys in relations.items():
+            self.write(table, ["movie_id", JUNCTION_COLUMNS[table]],
+                       [(m, k) for m, ks in zip(ids, keys) for k in ks])
+
+    def report(self):
+        """Print rows, seconds and rows/sec for every table written."""
+        print(f"{'table':<22} {'rows':>10} {'seconds':>9} {'rows/sec':>11}")
+        for table, (rows, seconds) in self.stats.items():
+            rate = rows / seconds if seconds else float("inf")
+            print(f"{table:<22} {rows:>10} {seconds:>9.2f} {rate:>11.0f}")
+
+    def close(self):
+        self.cursor.close()
+
+class IncrementalLoader(BulkLoader):
+    """Refreshes an already loaded catalog, writing only what changed.
+
+    Each incoming movie's content hash is compared with the stored
+    ``movies.content_hash``: new movies are inserted, changed ones are
+    upserted and only their added or removed relationship rows are written,
+    unchanged ones are skipped. ``finish`` deletes the stored movies the
+    source no longer contains, unless ``delete_missing`` is off.
+    """
+
+    def __init__(self, conn, batch_size=5000, delete_missing=True):
+        super().__init__(conn, batch_size=batch_size)
+        self.delete_missing = delete_missing
+        self.cursor.execute("SELECT id, content_hash FROM movies")
+        self.stored = dict(self.cursor.fetchall())  # id -> hash, for movies not seen in the source yet
+        self.counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+    def load(self, data):
+        ids, movies, relations = self.prepare(data)
+        new, changed = [], []
+        for i, movie_id in enumerate(ids):
+            if movie_id not in self.stored:
+                new.append(i)
+            elif self.stored.pop(movie_id) != movies[i][-1]:
+                changed.append(i)
+        self.counts["inserted"] += len(new)
+        self.counts["updated"] += len(changed)
+        self.counts["unchanged"] += len(ids) - len(new) - len(changed)
+
+        columns = MOVIE_COLUMNS + ["content_hash"]
+        self.write("movies", columns, [movies[i] for i in new], ignore=False)
+        self.write("movies", columns, [movies[i] for i in changed], upsert=True)
+        for table, keys in relations.items():
+            self.write(table, ["movie_id", JUNCTION_COLUMNS[table]],
+                       [(ids[i], k) for i in new for k in keys[i]])
+            if changed:
+                self.sync_junction(table, [ids[i] for i in changed], [keys[i] for i in changed])
+
+    def sync_junction(self, table, movie_ids, keys):
+        """Bring the ``table`` rows of ``movie_ids`` in line with ``keys``, touching only the differences."""
+        column = JUNCTION_COLUMNS[table]
+        wanted = {(m, k) for m, ks in zip(movie_ids, keys) for k in ks}
+        current = set()
+        for i in range(0, len(movie_ids), self.batch_size):
+            batch = movie_ids[i:i + self.batch_size]
+            self.cursor.execute(f"SELECT movie_id, {column} FROM {table} WHERE movie_id IN ({placeholders(len(batch))})", batch)
+            current.update(tuple(row) for row in self.cursor.fetchall())
+        stale = sorted(current - wanted)
+        start = time.perf_counter()
+        for i in range(0, len(stale), self.batch_size):
+            batch = stale[i:i + self.batch_size]
+            self.cursor.execute(
+                f"DELETE FROM {table} WHERE (movie_id, {column}) IN ({placeholders(len(batch), 2)})",
+                [value for pair in batch for value in pair]
+            )
+            self.conn.commit()
+        if stale:
+            self.record(f"{table} (del)", len(stale), start)
+        self.write(table, ["movie_id", column], sorted(wanted - current))
+
+    def finish(self):
+        """Delete the movies that are stored but were not in the source."""
+        missing = sorted(self.stored) if self.delete_missing else []
+        start = time.perf_counter()
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            for table in JUNCTION_COLUMNS:
+                self.cursor.execute(f"DELETE FROM {table} WHERE movie_id IN ({placeholders(len(batch))})", batch)
+            self.cursor.execute(f"DELETE FROM movies WHERE id IN ({placeholders(len(batch))})", batch)
+            self.conn.commit()
+        if missing:
+            self.record("movies (del)", len(missing), start)
+        self.counts["deleted"] = len(missing)
+        self.stored = {}
+
+    def report(self):
+        print(", ".join(f"{name}: {count}" for name, count in self.counts.items()))
+        super().report()
+
+# ----- Streaming source -----
+SOURCE_FORMATS = {".xlsx": "xlsx", ".csv": "csv", ".parquet": "parquet", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+def parse_list(x):
+    return ast.literal_eval(x) if isinstance(x, str) else (x if isinstance(x, list) else [])
+
+def read_chunks(file_path, chunk_size=5000):
+    """Yield the catalog as DataFrames of at most ``chunk_size`` rows without reading the whole file."""
+    fmt = SOURCE_FORMATS.get(os.path.splitext(file_path)[1].lower())
+    if fmt == "csv":
+        yield from pd.read_csv(file_path, chunksize=chunk_size)
+    elif fmt == "jsonl":
+        yield from pd.read_json(file_path, lines=True, chunksize=chunk_size)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq  # optional dependency, only needed for Parquet sources
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif fmt == "xlsx":
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = list(next(rows))
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                yield pd.DataFrame(chunk, columns=header)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"unsupported source format: {file_path} (expected {', '.join(SOURCE_FORMATS)})")
+
+def parse_chunk(data, seen_ids):
+    """Drop movies already seen in earlier chunks and parse the list columns into Python lists."""
+    # Drop duplicate entries by movie id to avoid primary key conflicts
+    data = data.drop_duplicates(subset=['id'])
+    data = data[~data['id'].isin(seen_ids)].copy()
+    seen_ids.update(data['id'])
+    # Convert string representations of list columns into actual Python lists
+    for col in LIST_COLUMNS:
+        data[col] = data[col].apply(parse_list)
+    return data
+
+def parsed_chunks(file_path, chunk_size=5000, queue_size=2):
+    """Parsed chunks of ``file_path``, read and parsed in a background thread.
+
+    The producer runs at most ``queue_size`` chunks ahead of the consumer, so
+    parsing overlaps the database writes while memory stays bounded by
+    roughly ``(queue_size + 2) * chunk_size`` rows whatever the file size.
+    """
+    chunks = queue.Queue(maxsize=queue_size)
+    done = object()
+    stop = threading.Event()
+
+    def offer(item):
+        # Block while the queue is full, but give up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        seen_ids = set()
+        try:
+            for raw in read_chunks(file_path, chunk_size):
+                if not offer(parse_chunk(raw, seen_ids)):
+                    return
+            offer(done)
+        except BaseException as exc:
+            offer(exc)
+
+    producer = threading.Thread(target=produce, name="catalog-reader", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+def invalidate_api_cache(api_url):
+    """Tell a running API that the catalog changed so it drops its cached lists and rebuilds its stats snapshot."""
+    request = urllib.request.Request(api_url.rstrip("/") + "/cache/invalidate", method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            print(f"API cache invalidated: {json.load(response)}")
+    except OSError as exc:
+        print(f"Could not invalidate the API cache at {api_url}: {exc}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the IMDB schema and load the movie catalog.")
+    parser.add_argument("--file", default="dados/movies_data.xlsx", help="catalog file: .xlsx, .csv, .parquet or .jsonl")
+    parser.add_argument("--mode", choices=["bulk", "rows", "refresh"], default="bulk",
+                        help="bulk: batched multi-row writes (default); rows: one statement per row; "
+                             "refresh: incremental update of an already loaded catalog")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per statement and per commit in bulk mode")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="movies read from the source per chunk")
+    parser.add_argument("--load-data", action="store_true",
+                        help="bulk mode writes through LOAD DATA LOCAL INFILE (needs local_infile enabled on the server)")
+    parser.add_argument("--invalidate-cache", metavar="API_URL",
+                        help="after loading, clear the response cache and rebuild the stats of the API at this base URL "
+                             "(e.g. http://localhost:8000)")
+    parser.add_argument("--keep-missing", action="store_true",
+                        help="refresh mode keeps stored movies that are absent from the source instead of deleting them")
+    args = parser.parse_args()
+
+    # Establish a connection to the MySQL server
+    conn = mysql.connector.connect(allow_local_infile=args.load_data, **DB_CONFIG)
+
+    # Create tables and bring indexes/keys up to the current schema version
+    create_tables(conn)
+    apply_migrations(conn)
+
+    # Stream the source chunk by chunk; parsing runs ahead in a reader thread
+    start = time.perf_counter()
+    if args.mode == "refresh":
+        loader = IncrementalLoader(conn, batch_size=args.batch_size, delete_missing=not args.keep_missing)
+    elif args.mode == "bulk":
+        loader = BulkLoader(conn, batch_size=args.batch_size, use_load_data=args.load_data)
+    else:
+        loader = None
+    total = 0
+    for data in parsed_chunks(args.file, args.chunk_size):
+        if loader is None:
+            # Dynamically seed the countries master table using codes from the chunk
+            seed_countries(conn, data)
+            insert_data(conn, data)
+        else:
+            loader.load(data)
+        total += len(data)
+        print(f"  {total} movies loaded ({time.perf_counter() - start:.1f}s)")
+    if isinstance(loader, IncrementalLoader):
+        loader.finish()
+    if loader is not None:
+        loader.report()
+        loader.close()
+    print(f"Loaded {total} movies in {time.perf_counter() - start:.1f}s ({args.mode} mode)")
+
+    # Close the connection to the database
+    conn.close()
+    print("Data inserted successfully!")
+
+    if args.invalidate_cache:
+        invalidate_api_cache(args.invalidate_cache)
+
+if __name__ == "__main__":
+    main()
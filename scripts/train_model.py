@@ -0,0 +1,323 @@
+"""Train the success model and publish it with its feature manifest.
+
+    python scripts/train_model.py --file dados/movies_data.xlsx             # from the source file
+    python scripts/train_model.py --from-db                                  # from the MySQL catalog
+    python scripts/train_model.py --file dados/movies_data.xlsx --activate  # and serve it (models/model.joblib)
+
+Scripted version of notebooks/API_IMDB_Analise_e_Modelo.ipynb: one-hot blocks
+for genres, filming locations, countries, languages and companies (labels
+seen in more than one movie), four rating buckets, the
+``numVotes * averageRating >= 2M`` target, VarianceThreshold(0.01) and a
+RandomForestClassifier(random_state=42) on an 80/20 split, fitted on all
+cores.
+
+The feature matrix is built sparse and cached in ``models/cache/`` (``.npz``
+plus a JSON vocabulary) under a key derived from the source contents, so a
+retrain on unchanged data skips reading and parsing. Each run writes
+``models/model-<version>.joblib`` and ``models/model-<version>.json``, the
+manifest with the feature columns, parameters, metrics and per-stage
+timings. ``--activate`` copies both over the model the API serves; its
+registry picks the new file up and hot-swaps it.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import joblib
+import mysql.connector
+import numpy as np
+import pandas as pd
+import sklearn
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import VarianceThreshold
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from popular_sql import DB_CONFIG, company_key, parsed_chunks
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))  # the repo root
+from api.features import RATING_BUCKETS, RATING_MAP  # noqa: E402  (the API encodes ratings the same way)
+
+FEATURE_VERSION = 1  # bump when the encoding changes, to invalidate cached matrices
+SUCCESS_POPULARITY = 2_000_000  # numVotes * averageRating of a successful movie
+NUMERIC_FIELDS = ['runtimeMinutes', 'budget', 'averageRating', 'numVotes']
+# (catalog field, column prefix, labels must appear in more than this many movies), in column order
+LABEL_BLOCKS = [
+    ('genres', '', 0),
+    ('locations', 'loc_', 1),
+    ('countries', 'ctry_', 1),
+    ('languages', 'lang_', 1),
+    ('companies', 'comp_', 1),
+]
+DEFAULT_PARAMS = {"test_size": 0.2, "random_state": 42, "variance_threshold": 0.01}
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 3)
+
+def empty_catalog():
+    fields = ['id', 'contentRating'] + NUMERIC_FIELDS + [field for field, _, _ in LABEL_BLOCKS]
+    return {field: [] for field in fields}
+
+# ----- Sources -----
+def file_key(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return "file:" + digest.hexdigest()
+
+def catalog_from_file(path, chunk_size=5000):
+    """Columns the model needs, read with the loader's streaming parser."""
+    catalog = empty_catalog()
+    for chunk in parsed_chunks(path, chunk_size):
+        catalog['id'].extend(chunk['id'])
+        catalog['contentRating'].extend(chunk['contentRating'])
+        for field in NUMERIC_FIELDS:
+            catalog[field].extend(pd.to_numeric(chunk[field], errors='coerce'))
+        catalog['genres'].extend(chunk['genres'])
+        catalog['locations'].extend(chunk['filmingLocations'])
+        catalog['countries'].extend(chunk['countriesOfOrigin'])
+        catalog['languages'].extend(chunk['spokenLanguages'])
+        catalog['companies'].extend([[company_key(c)[1] for c in comps] for comps in chunk['productionCompanies']])
+    return catalog
+
+# catalog field -> (movie id, label) query
+LABEL_QUERIES = {
+    'genres': "SELECT mg.movie_id, g.name FROM movie_genres mg JOIN genres g ON g.id = mg.genre_id",
+    'locations': "SELECT ml.movie_id, l.name FROM movie_locations ml JOIN locations l ON l.id = ml.location_id",
+    'countries': "SELECT movie_id, country_id FROM movie_countries",
+    'languages': "SELECT movie_id, language_id FROM movie_languages",
+    'companies': "SELECT mc.movie_id, c.name FROM movie_companies mc JOIN companies c ON c.id = mc.company_id",
+}
+
+def db_key(conn):
+    """Digest of the movies' content hashes; None when some rows have none (always rebuild then)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT content_hash FROM movies ORDER BY id")
+    digest = hashlib.sha256()
+    hashes = [value for (value,) in cursor.fetchall()]
+    cursor.close()
+    if any(value is None for value in hashes):
+        return None
+    for value in hashes:
+        digest.update(value.encode())
+    return "db:" + digest.hexdigest()
+
+def catalog_from_db(conn):
+    """Columns the model needs, from the movies table and the junction tables."""
+    catalog = empty_catalog()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, contentRating, {', '.join(NUMERIC_FIELDS)} FROM movies ORDER BY id")
+    position = {}
+    for row in cursor.fetchall():
+        position[row[0]] = len(catalog['id'])
+        catalog['id'].append(row[0])
+        catalog['contentRating'].append(row[1])
+        for field, value in zip(NUMERIC_FIELDS, row[2:]):
+            catalog[field].append(np.nan if value is None else float(value))
+    for field, sql in LABEL_QUERIES.items():
+        labels = [[] for _ in catalog['id']]
+        cursor.execute(sql)
+        for movie_id, label in cursor.fetchall():
+            if movie_id in position:
+                labels[position[movie_id]].append(label)
+        catalog[field] = labels
+    cursor.close()
+    return catalog
+
+# ----- Features -----
+def one_hot(rows, vocabulary):
+    """CSR matrix with a 1 in the column of every label of each row found in ``vocabulary``."""
+    index = {label: i for i, label in enumerate(vocabulary)}
+    indptr, indices = [0], []
+    for labels in rows:
+        indices.extend(sorted(index[label] for label in labels if label in index))
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.ones(len(indices)), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(rows), len(vocabulary)),
+    )
+
+def build_features(catalog):
+    """Sparse feature matrix, target and column names for the movies with a budget and a runtime.
+
+    Label vocabularies are counted over every movie, before incomplete ones
+    are dropped, as the notebook does.
+    """
+    numeric = {field: np.asarray(catalog[field], dtype=float) for field in NUMERIC_FIELDS}
+    keep = np.flatnonzero(~(np.isnan(numeric['runtimeMinutes']) | np.isnan(numeric['budget'])))
+    with np.errstate(invalid='ignore'):
+        y = (numeric['numVotes'] * numeric['averageRating'] >= SUCCESS_POPULARITY).astype(np.int8)[keep]
+
+    blocks = [sparse.csr_matrix(np.column_stack([numeric['runtimeMinutes'], numeric['budget']])[keep])]
+    columns = ['runtimeMinutes', 'budget']
+    for field, prefix, min_count in LABEL_BLOCKS:
+        labels = [{str(label) for label in values} for values in catalog[field]]
+        counts = Counter(label for row in labels for label in row)
+        vocabulary = sorted(label for label, count in counts.items() if count > min_count)
+        blocks.append(one_hot([labels[i] for i in keep], vocabulary))
+        columns += [prefix + label for label in vocabulary]
+    ratings = [{RATING_MAP.get(catalog['contentRating'][i])} for i in keep]
+    blocks.append(one_hot(ratings, RATING_BUCKETS))
+    columns += ['rating_' + bucket for bucket in RATING_BUCKETS]
+    return sparse.hstack(blocks, format='csr'), y, columns
+
+def cache_paths(cache_dir):
+    return os.path.join(cache_dir, "features.npz"), os.path.join(cache_dir, "features.json")
+
+def load_cached_features(cache_dir, key):
+    """(X, y, columns) from the cache when it was built from ``key``, else None."""
+    matrix_path, vocabulary_path = cache_paths(cache_dir)
+    try:
+        with open(vocabulary_path) as f:
+            meta = json.load(f)
+        if key is None or meta.get("key") != key or meta.get("feature_version") != FEATURE_VERSION:
+            return None
+        with np.load(matrix_path) as arrays:
+            X = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+            y = arrays['y']
+    except (OSError, ValueError, KeyError):
+        return None
+    return X, y, meta["columns"]
+
+def save_cached_features(cache_dir, key, X, y, columns):
+    os.makedirs(cache_dir, exist_ok=True)
+    matrix_path, vocabulary_path = cache_paths(cache_dir)
+    np.savez(matrix_path, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.asarray(X.shape), y=y)
+    meta = {"key": key, "feature_version": FEATURE_VERSION, "rows": X.shape[0], "columns": columns}
+    # The vocabulary goes last, so a matrix is never paired with another run's key
+    write_json(vocabulary_path, meta)
+
+def write_json(path, value):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(value, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+# ----- Training -----
+def fit(X, y, columns, params, n_jobs):
+    """Variance selection, split and forest fit; returns the model, kept columns and test metrics."""
+    selector = VarianceThreshold(threshold=params["variance_threshold"]).fit(X)
+    kept = [columns[i] for i in selector.get_support(indices=True)]
+    # Dense from here: the selected columns are few, and a DataFrame gives the model its feature names
+    frame = pd.DataFrame(selector.transform(X).toarray(), columns=kept)
+    X_train, X_test, y_train, y_test = train_test_split(
+        frame, y, test_size=params["test_size"], random_state=params["random_state"]
+    )
+    model = RandomForestClassifier(random_state=params["random_state"], n_jobs=n_jobs)
+    model.fit(X_train, y_train)
+    model.n_jobs = None  # the API scores small batches, where worker start-up costs more than it saves
+    proba = model.predict_proba(X_test)[:, 1]
+    y_pred = (proba > 0.5).astype(int)
+    metrics = {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "precision": precision_score(y_test, y_pred, zero_division=0),
+        "recall": recall_score(y_test, y_pred, zero_division=0),
+        "f1": f1_score(y_test, y_pred, zero_division=0),
+        "roc_auc": roc_auc_score(y_test, proba) if len(set(y_test)) > 1 else None,
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "positive_rate": float(np.mean(y)),
+    }
+    return model, kept, metrics
+
+def model_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def activate(model_path, target):
+    """Copy the model and its manifest over ``target`` (manifest first, each through a rename)."""
+    source_manifest = os.path.splitext(model_path)[0] + ".json"
+    target_manifest = os.path.splitext(target)[0] + ".json"
+    for source, destination in ((source_manifest, target_manifest), (model_path, target)):
+        tmp = f"{destination}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the success model and write it with its feature manifest.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="catalog file (.xlsx, .csv, .parquet or .jsonl)")
+    source.add_argument("--from-db", action="store_true", help="read the catalog from the MySQL database")
+    parser.add_argument("--output-dir", default="models", help="where the versioned model and manifest go")
+    parser.add_argument("--cache-dir", default=os.path.join("models", "cache"), help="feature matrix cache")
+    parser.add_argument("--no-cache", action="store_true", help="rebuild the feature matrix even if cached")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel jobs for fitting (-1: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per chunk when reading --file")
+    parser.add_argument("--activate", nargs="?", const=os.path.join("models", "model.joblib"), metavar="PATH",
+                        help="also copy the model over PATH, the file the API serves (default models/model.joblib)")
+    args = parser.parse_args()
+
+    timings = {}
+    params = dict(DEFAULT_PARAMS)
+    conn = None
+    try:
+        with timed(timings, "source_key"):
+            if args.from_db:
+                conn = mysql.connector.connect(**DB_CONFIG)
+                key = db_key(conn)
+            else:
+                key = file_key(args.file)
+        cached = None if args.no_cache else load_cached_features(args.cache_dir, key)
+        if cached is not None:
+            X, y, columns = cached
+            print(f"Feature matrix from cache ({args.cache_dir})")
+        else:
+            with timed(timings, "load"):
+                catalog = catalog_from_db(conn) if args.from_db else catalog_from_file(args.file, args.chunk_size)
+            with timed(timings, "features"):
+                X, y, columns = build_features(catalog)
+            if key is not None:
+                save_cached_features(args.cache_dir, key, X, y, columns)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    with timed(timings, "fit"):
+        model, features, metrics = fit(X, y, columns, params, args.n_jobs)
+
+    with timed(timings, "save"):
+        os.makedirs(args.output_dir, exist_ok=True)
+        version = time.strftime("%Y%m%d-%H%M%S")
+        model_path = os.path.join(args.output_dir, f"model-{version}.joblib")
+        joblib.dump(model, model_path)
+        manifest = {
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "model_sha256": model_sha256(model_path),
+            "source": {"kind": "db" if args.from_db else "file", "path": args.file, "key": key},
+            "rows": X.shape[0],
+            "vocabulary_size": len(columns),
+            "features": features,
+            "params": dict(params, n_estimators=model.n_estimators, feature_version=FEATURE_VERSION),
+            "metrics": metrics,
+            "timings": timings,
+            "sklearn_version": sklearn.__version__,
+        }
+        write_json(os.path.splitext(model_path)[0] + ".json", manifest)
+    if args.activate:
+        activate(model_path, args.activate)
+        print(f"Activated as {args.activate}")
+
+    print(f"Model {model_path}: {len(features)} of {len(columns)} features, {X.shape[0]} movies")
+    print("  " + ", ".join(f"{name} {value:.3f}" for name, value in metrics.items()
+                           if isinstance(value, float)))
+    print("  timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+
+if __name__ == "__main__":
+    main()